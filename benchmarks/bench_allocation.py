@@ -0,0 +1,85 @@
+"""
+Measures the throughput of a pair of engines editing the same buffer, along with the time spent in the garbage
+collector while doing so.
+
+Run from the root of the repository::
+
+    python benchmarks/bench_allocation.py [operations]
+"""
+import gc
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyote.engine import Engine  # noqa: E402
+from pyote.operations import InsertOperation, DeleteOperation  # noqa: E402
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode  # noqa: E402
+
+
+class GCTimer(object):
+    """
+    Records how many collections the garbage collector ran, and how long they took
+    """
+    def __init__(self):
+        self.collections = 0
+        self.pause = 0.0
+        self._start = None
+
+    def __call__(self, phase, info):
+        if phase == "start":
+            self._start = time.perf_counter()
+        elif self._start is not None:
+            self.pause += time.perf_counter() - self._start
+            self.collections += 1
+            self._start = None
+
+
+def random_edit(length, rng):
+    """
+    Creates a transaction sequence with a single random edit on a buffer of the given length
+    :param int length: The length of the buffer being edited
+    :param random.Random rng: The source of randomness
+    :rtype: pyote.utils.TransactionSequence
+    """
+    if length > 10 and rng.random() < 0.3:
+        position = rng.randrange(length - 5)
+        return TransactionSequence(None, None, DeleteOperationNode.from_list([DeleteOperation(position, 5)]))
+    position = rng.randint(0, length)
+    return TransactionSequence(None, InsertOperationNode.from_list([InsertOperation(position, "abcdefgh")]), None)
+
+
+def run(operations, seed=0):
+    rng = random.Random(seed)
+    engines = [Engine(1), Engine(2)]
+    length = 0
+    timer = GCTimer()
+    gc.collect()
+    gc.callbacks.append(timer)
+    start = time.perf_counter()
+    try:
+        for count in range(operations):
+            sender = engines[count % 2]
+            receiver = engines[(count + 1) % 2]
+            sequence = random_edit(length, rng)
+            length += sum(op.get_increment() for op in (sequence.inserts or sequence.deletes).to_list())
+            receiver.integrate_remote(sender.process_transaction(sequence))
+    finally:
+        elapsed = time.perf_counter() - start
+        gc.callbacks.remove(timer)
+    return elapsed, timer
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    elapsed, timer = run(operations)
+    print("operations:     {}".format(operations))
+    print("ops/sec:        {:.0f}".format(operations / elapsed))
+    print("gc collections: {}".format(timer.collections))
+    print("gc pause:       {:.1f} ms".format(timer.pause * 1000))
+
+
+if __name__ == "__main__":
+    main()
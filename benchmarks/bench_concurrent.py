@@ -0,0 +1,52 @@
+"""
+Measures the time spent finding the local inserts which are concurrent with a remote sequence, when one remote site
+sends many sequences in a row against a long history, with and without the per-site concurrent views.
+
+Run from the root of the repository::
+
+    python benchmarks/bench_concurrent.py [history] [sequences]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyote.engine import Engine  # noqa: E402
+from pyote.operations import InsertOperation  # noqa: E402
+from pyote.utils import TransactionSequence, InsertOperationNode  # noqa: E402
+
+
+def edit(engine, position, value):
+    return engine.process_transaction(TransactionSequence(
+        None, InsertOperationNode.from_list([InsertOperation(position, value)]), None))
+
+
+def run(history, sequences, cached):
+    local = Engine(1)
+    remote = Engine(2)
+    for count in range(history):
+        remote.integrate_remote(edit(local, count, "a"))
+    elapsed = 0.0
+    for count in range(sequences):
+        # The local site keeps editing as well, so each remote sequence has some concurrent inserts
+        outgoing = edit(remote, count, "b")
+        edit(local, history + count, "c")
+        start = time.perf_counter()
+        local._get_concurrent(outgoing.starting_state, local._inserts, 2 if cached else None)
+        elapsed += time.perf_counter() - start
+        local.integrate_remote(outgoing)
+    return elapsed
+
+
+def main():
+    history = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    sequences = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    for cached in (False, True):
+        elapsed = run(history, sequences, cached)
+        print("{:10} {:8.3f} ms for {} sequences".format("cached" if cached else "uncached", elapsed * 1000,
+                                                         sequences))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Measures the time taken to move a batch of cursors through a transaction sequence in one pass, compared to moving each
+cursor through the whole sequence by itself.
+
+Run from the root of the repository::
+
+    python benchmarks/bench_cursors.py [cursors] [operations]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyote.cursors import transform_positions  # noqa: E402
+from pyote.operations import InsertOperation, DeleteOperation  # noqa: E402
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode, State  # noqa: E402
+
+
+def build_sequence(operations, rng):
+    inserts = []
+    deletes = []
+    for count in range(operations):
+        insert = InsertOperation(count * 20, "abc")
+        insert.state = State(rng.randint(1, 10), count, count)
+        inserts.append(insert)
+        delete = DeleteOperation(count * 20, 2)
+        delete.state = State(rng.randint(1, 10), count, count)
+        deletes.append(delete)
+    return TransactionSequence(None, InsertOperationNode.from_list(inserts), DeleteOperationNode.from_list(deletes))
+
+
+def one_at_a_time(sequence, positions, site_id):
+    transformed = []
+    for position in positions:
+        node = sequence.inserts
+        while node:
+            operation = node.value
+            if operation.position < position or (operation.position == position and
+                                                 operation.state.site_id < site_id):
+                position += len(operation.value)
+            node = node.next
+        node = sequence.deletes
+        while node:
+            operation = node.value
+            if operation.position + operation.length <= position:
+                position -= operation.length
+            elif operation.position < position:
+                position = operation.position
+            node = node.next
+        transformed.append(position)
+    return transformed
+
+
+def main():
+    cursors = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rng = random.Random(0)
+    sequence = build_sequence(operations, rng)
+    positions = sorted(rng.randrange(operations * 20) for _ in range(cursors))
+    start = time.perf_counter()
+    batch = transform_positions(sequence, positions, 5)
+    middle = time.perf_counter()
+    single = one_at_a_time(sequence, positions, 5)
+    end = time.perf_counter()
+    assert batch == single
+    print("batch:          {:8.2f} ms".format((middle - start) * 1000))
+    print("one at a time:  {:8.2f} ms".format((end - middle) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Measures the time a server spends relaying sequences to many clients, when it keeps one engine per client and every
+one of those engines has the same history, with and without a shared transform cache.
+
+Run from the root of the repository::
+
+    python benchmarks/bench_fanout.py [clients] [history] [sequences]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyote.cache import TransformCache  # noqa: E402
+from pyote.engine import Engine  # noqa: E402
+from pyote.operations import InsertOperation, DeleteOperation  # noqa: E402
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode  # noqa: E402
+
+
+def edit(engine, count):
+    if count % 3 == 2:
+        return engine.process_transaction(TransactionSequence(
+            None, None, DeleteOperationNode.from_list([DeleteOperation(count // 2, 1)])))
+    return engine.process_transaction(TransactionSequence(
+        None, InsertOperationNode.from_list([InsertOperation(count, "ab")]), None))
+
+
+def build_stream(history, sequences):
+    """
+    Creates the sequences sent by two sites which edit at the same time
+    """
+    site1 = Engine(1)
+    site2 = Engine(2)
+    stream = []
+    for count in range(history + sequences):
+        outgoing1 = edit(site1, count)
+        outgoing2 = edit(site2, count + 1)
+        site1.integrate_remote(outgoing2)
+        site2.integrate_remote(outgoing1)
+        stream.extend([outgoing1, outgoing2])
+    return stream[:2 * history], stream[2 * history:]
+
+
+def run(clients, history, sequences, cache):
+    engines = [Engine(100 + client, transform_cache=cache) for client in range(clients)]
+    warm_up, measured = build_stream(history, sequences)
+    for sequence in warm_up:
+        for engine in engines:
+            engine.integrate_remote(sequence)
+    start = time.perf_counter()
+    for sequence in measured:
+        for engine in engines:
+            engine.integrate_remote(sequence)
+    return time.perf_counter() - start
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    history = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    sequences = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    for cache in (None, TransformCache()):
+        elapsed = run(clients, history, sequences, cache)
+        print("{:10} {:8.1f} ms to relay {} sequences to {} clients".format(
+            "cached" if cache else "uncached", elapsed * 1000, 2 * sequences, clients))
+
+
+if __name__ == "__main__":
+    main()
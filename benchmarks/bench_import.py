@@ -0,0 +1,60 @@
+"""
+Measures the time taken to import the engine in a fresh interpreter, as a short-lived worker would, and fails if it
+takes longer than a budget.  The time comes from ``python -X importtime``, and the best of several runs is taken, since
+a fresh process is easily slowed down by the rest of the machine.  Bytecode is cached in a temporary directory, so the
+first run compiles the modules and the rest don't.
+
+Run from the root of the repository::
+
+    python benchmarks/bench_import.py [budget in milliseconds] [runs]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#: The modules which importing the engine must not import, because only some uses of the engine need them
+DEFERRED = ('json', 'hashlib', 'mmap', 'pyote.history', 'pyote.serialization')
+
+
+def measure(module, cache_directory):
+    """
+    Imports a module in a fresh interpreter
+    :return: The time taken to import the module, in seconds, and the names of every module that was imported
+    :rtype: (float, list[str])
+    """
+    environment = dict(os.environ, PYTHONPATH=ROOT, PYTHONPYCACHEPREFIX=cache_directory)
+    environment.pop('PYTHONDONTWRITEBYTECODE', None)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import sys, {}; print("\\n".join(sys.modules))'.format(module)],
+                            env=environment, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                            check=True)
+    for line in result.stderr.splitlines():
+        # Each line is "import time: self | cumulative | name", and the module asked for is the outermost one
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e6, result.stdout.split()
+    raise RuntimeError("{} was not imported".format(module))
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else 15
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    with tempfile.TemporaryDirectory() as cache_directory:
+        results = [measure('pyote.engine', cache_directory) for _ in range(runs)]
+    best = min(elapsed for elapsed, _ in results)
+    modules = results[0][1]
+    print("import pyote.engine {:8.1f} ms (budget {:.1f} ms)".format(best * 1000, budget))
+    print("{} modules loaded, {} from pyote".format(len(modules), sum(name.startswith('pyote') for name in modules)))
+    deferred = [name for name in DEFERRED if name in modules]
+    if deferred:
+        print("imported modules that should have been deferred: {}".format(', '.join(deferred)))
+    if best * 1000 > budget or deferred:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
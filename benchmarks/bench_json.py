@@ -0,0 +1,65 @@
+"""
+Measures the throughput of encoding transaction sequences to JSON and decoding them again, both through the generic
+path (``__getstate__`` and ``json``) and through :meth:`pyote.utils.TransactionSequence.to_json` and
+:meth:`pyote.utils.TransactionSequence.from_json`.
+
+Run from the root of the repository::
+
+    python benchmarks/bench_json.py [operations]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyote import serialization  # noqa: E402
+from pyote.operations import InsertOperation, DeleteOperation  # noqa: E402
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode, State  # noqa: E402
+
+
+def build_sequence(operations):
+    inserts = []
+    deletes = []
+    for time_stamp in range(operations // 2):
+        insert = InsertOperation(time_stamp * 10, "some text")
+        insert.state = State(1, time_stamp, time_stamp)
+        inserts.append(insert)
+        delete = DeleteOperation(time_stamp * 3, 2)
+        delete.state = State(1, time_stamp + operations, time_stamp + operations)
+        deletes.append(delete)
+    return TransactionSequence(State(2, 1, 1), InsertOperationNode.from_list(inserts),
+                               DeleteOperationNode.from_list(deletes))
+
+
+def measure(function, argument, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    sequence = build_sequence(operations)
+
+    generic_encode, text = measure(lambda s: json.dumps(s.__getstate__(), default=lambda o: o.__getstate__()),
+                                   sequence)
+    generic_decode, _ = measure(lambda t: TransactionSequence.from_message(json.loads(t)), text)
+    fast_encode, text = measure(TransactionSequence.to_json, sequence)
+    fast_decode, _ = measure(TransactionSequence.from_json, text)
+
+    print("operations:        {}".format(operations))
+    print("json library:      {}".format("orjson" if serialization.orjson else "json"))
+    print("generic encode:    {:.0f} ops/sec".format(operations / generic_encode))
+    print("to_json:           {:.0f} ops/sec".format(operations / fast_encode))
+    print("generic decode:    {:.0f} ops/sec".format(operations / generic_decode))
+    print("from_json:         {:.0f} ops/sec".format(operations / fast_decode))
+
+
+if __name__ == "__main__":
+    main()
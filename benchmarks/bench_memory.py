@@ -0,0 +1,60 @@
+"""
+Measures how much memory a history of operations takes up.  Half of the history is made up of inserts and half of
+deletes, each with its own state, as they would be in an engine's history.  The same history is then measured again
+after being packed into columns.
+
+Run from the root of the repository::
+
+    python benchmarks/bench_memory.py [operations]
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyote.history import InsertColumns, DeleteColumns  # noqa: E402
+from pyote.operations import InsertOperation, DeleteOperation  # noqa: E402
+from pyote.utils import InsertOperationNode, DeleteOperationNode, State  # noqa: E402
+
+
+def build_history(operations):
+    """
+    Builds linked lists of inserts and deletes with `operations` nodes between them
+    :param int operations: The total number of operations in the history
+    :rtype: (pyote.utils.InsertOperationNode, pyote.utils.DeleteOperationNode)
+    """
+    inserts = []
+    deletes = []
+    for time_stamp in range(operations // 2):
+        insert = InsertOperation(time_stamp, "a")
+        insert.state = State(1, time_stamp * 2, time_stamp * 2)
+        inserts.append(insert)
+        delete = DeleteOperation(time_stamp, 1)
+        delete.state = State(2, time_stamp * 2 + 1, time_stamp)
+        deletes.append(delete)
+    return InsertOperationNode.from_list(inserts), DeleteOperationNode.from_list(deletes)
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    tracemalloc.start()
+    history = build_history(operations)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("operations:     {}".format(operations))
+    print("history size:   {:.1f} MB".format(current / 1e6))
+    print("bytes per op:   {:.0f}".format(current / operations))
+    print("peak:           {:.1f} MB".format(peak / 1e6))
+
+    tracemalloc.start()
+    packed = InsertColumns.from_sequence(history[0]), DeleteColumns.from_sequence(history[1])
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("packed size:    {:.1f} MB".format(current / 1e6))
+    print("packed per op:  {:.0f}".format(current / operations))
+    return history, packed
+
+
+if __name__ == "__main__":
+    main()
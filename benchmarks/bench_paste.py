@@ -0,0 +1,54 @@
+"""
+Measures the cost of sending a large paste to several peers: integrating it, and encoding the resulting sequence once
+for every peer, with and without the encoded paste being kept in the content store.
+
+Run from the root of the repository::
+
+    python benchmarks/bench_paste.py [megabytes] [peers]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyote import serialization  # noqa: E402
+from pyote.engine import Engine  # noqa: E402
+from pyote.operations import InsertOperation  # noqa: E402
+from pyote.utils import TransactionSequence, InsertOperationNode  # noqa: E402
+
+
+def paste(engine, value):
+    return engine.process_transaction(TransactionSequence(
+        None, InsertOperationNode.from_list([InsertOperation(0, value)]), None))
+
+
+def run(value, peers, cached):
+    store = serialization.content_store
+    store.clear()
+    sender = Engine(1)
+    receiver = Engine(2)
+    start = time.perf_counter()
+    outgoing = paste(sender, value)
+    incoming = TransactionSequence.from_json(outgoing.to_json())
+    relayed = receiver.integrate_remote(incoming)
+    integrated = time.perf_counter()
+    for _ in range(peers):
+        if not cached:
+            store.clear()
+        relayed.to_json()
+    return integrated - start, time.perf_counter() - integrated
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    peers = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    value = "paste \"text\"\n" * int(megabytes * 1024 * 1024 / 13)
+    for cached in (False, True):
+        integrate, encode = run(value, peers, cached)
+        print("{:10} integrate: {:7.1f} ms   encode for {} peers: {:7.1f} ms".format(
+            "cached" if cached else "uncached", integrate * 1000, peers, encode * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Measures the time spent relaying transactions from two editing clients to many others, when the server keeps one engine
+per client, compared to a server which puts the transactions in one order and only transforms them past each client's
+unaccepted transactions.
+
+Run from the root of the repository::
+
+    python benchmarks/bench_server.py [clients] [history] [sequences]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_fanout import build_stream  # noqa: E402
+from pyote.engine import Engine  # noqa: E402
+from pyote.operations import InsertOperation, DeleteOperation  # noqa: E402
+from pyote.server import Server, Client  # noqa: E402
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode  # noqa: E402
+
+
+def make_edit(count):
+    if count % 3 == 2:
+        return TransactionSequence(None, None, DeleteOperationNode.from_list([DeleteOperation(count // 2, 1)]))
+    return TransactionSequence(None, InsertOperationNode.from_list([InsertOperation(count, "ab")]), None)
+
+
+def run_engines(clients, history, sequences):
+    engines = [Engine(100 + client) for client in range(clients)]
+    warm_up, measured = build_stream(history, sequences)
+    for sequence in warm_up:
+        for engine in engines:
+            engine.integrate_remote(sequence)
+    start = time.perf_counter()
+    for sequence in measured:
+        for engine in engines:
+            engine.integrate_remote(sequence)
+    return time.perf_counter() - start
+
+
+def run_server(clients, history, sequences):
+    server = Server()
+    editors = [Client(1), Client(2)]
+    readers = [Client(100 + client) for client in range(clients)]
+    start = None
+    for count in range(history + sequences):
+        if count == history:
+            start = time.perf_counter()
+        sent = []
+        # Each editor sends a transaction while the other's is on its way, so every transaction is transformed once
+        for editor, offset in zip(editors, (0, 1)):
+            sent.append((editor, editor.local_edit(make_edit(count + offset))))
+        for editor, (revision, sequence) in sent:
+            accepted = server.receive(editor.site_id, revision, sequence)
+            editor.server_ack()
+            for other in editors:
+                if other is not editor:
+                    other.server_operation(editor.site_id, accepted)
+            for reader in readers:
+                reader.server_operation(editor.site_id, accepted)
+    return time.perf_counter() - start
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    history = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    sequences = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    for name, run in (("engines", run_engines), ("server", run_server)):
+        elapsed = run(clients, history, sequences)
+        print("{:10} {:8.1f} ms to relay {} sequences to {} clients".format(name, elapsed * 1000, 2 * sequences,
+                                                                            clients))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures how long reader threads take to look up states and the size of the history while one thread integrates
+sequences, with a plain engine behind one lock, and with a :class:`pyote.threadsafe.ConcurrentEngine` whose readers use
+its snapshots.  Every so often, a reader also packs the history, as it would to save the document.  Behind one lock, a
+reader waits for whatever the writer is doing to finish.
+
+Run from the root of the repository::
+
+    python benchmarks/bench_threads.py [sequences] [readers]
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyote.engine import Engine  # noqa: E402
+from pyote.operations import InsertOperation  # noqa: E402
+from pyote.threadsafe import ConcurrentEngine  # noqa: E402
+from pyote.utils import TransactionSequence, InsertOperationNode, State  # noqa: E402
+
+#: The number of reads between each time a reader packs the history
+PACK_EVERY = 200
+
+
+def make_sequences(count):
+    remote = Engine(2)
+    return [remote.process_transaction(TransactionSequence(
+        None, InsertOperationNode.from_list([InsertOperation(index, "ab")]), None)) for index in range(count)]
+
+
+class LockedReader(object):
+    def __init__(self, engine, lock):
+        self.engine = engine
+        self.lock = lock
+
+    def read(self, state, pack):
+        with self.lock:
+            self.engine.memory_usage.bytes
+            self.engine._lookup_local_time(state)
+            if pack:
+                self.engine.pack_history()
+
+
+class SnapshotReader(object):
+    def __init__(self, engine):
+        self.engine = engine
+
+    def read(self, state, pack):
+        snapshot = self.engine.snapshot(history=pack)
+        snapshot.memory_usage.bytes
+        snapshot.local_time(state)
+
+
+def run(sequences, readers, concurrent):
+    if concurrent:
+        engine = ConcurrentEngine(1)
+        lock = None
+        reader = SnapshotReader(engine)
+    else:
+        engine = Engine(1)
+        lock = threading.Lock()
+        reader = LockedReader(engine, lock)
+    done = threading.Event()
+    latencies = [[] for _ in range(readers)]
+
+    def read(index):
+        state = State(2, 0, 1)
+        while not done.is_set():
+            start = time.perf_counter()
+            reader.read(state, len(latencies[index]) % PACK_EVERY == PACK_EVERY - 1)
+            latencies[index].append(time.perf_counter() - start)
+            # Give the other threads a turn, as a reader serving requests would
+            time.sleep(0)
+
+    threads = [threading.Thread(target=read, args=(index,)) for index in range(readers)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    for sequence in sequences:
+        if lock is None:
+            engine.integrate_remote(sequence)
+        else:
+            with lock:
+                engine.integrate_remote(sequence)
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in threads:
+        thread.join()
+    return elapsed, sorted(latency for reader_latencies in latencies for latency in reader_latencies)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    for concurrent in (False, True):
+        elapsed, latencies = run(make_sequences(count), readers, concurrent)
+        print("{:10} {} sequences in {:6.2f} s, {:6d} reads, median {:7.1f} us, 99th percentile {:7.1f} us".format(
+            "snapshots" if concurrent else "one lock", count, elapsed, len(latencies),
+            latencies[len(latencies) // 2] * 1e6, latencies[len(latencies) * 99 // 100] * 1e6))
+
+
+if __name__ == "__main__":
+    main()
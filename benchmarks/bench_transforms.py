@@ -0,0 +1,95 @@
+"""
+Measures each of the transformation loops on long sequences, in plain Python and, if it has been built with
+``python build_transforms.py``, compiled with Cython, so the two can be compared.  Each loop is measured once with
+empty node pools, so that every node it copies is allocated, and once with full pools, as in an engine that has been
+running for a while.
+
+Run from the root of the repository::
+
+    python benchmarks/bench_transforms.py [operations] [runs]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyote import _transforms  # noqa: E402
+from pyote.operations import InsertOperation, DeleteOperation  # noqa: E402
+from pyote.utils import InsertOperationNode, DeleteOperationNode, State  # noqa: E402
+
+POOLS = (InsertOperationNode.pool, DeleteOperationNode.pool)
+
+try:
+    from pyote import _ctransforms  # noqa: E402
+except ImportError:
+    _ctransforms = None
+
+#: The sequences each function is measured with: the first is transformed by, swapped or merged with the second
+CASES = (
+    ('transform_insert_insert', InsertOperationNode, InsertOperationNode),
+    ('transform_delete_insert', DeleteOperationNode, InsertOperationNode),
+    ('transform_insert_delete', InsertOperationNode, DeleteOperationNode),
+    ('transform_delete_delete', DeleteOperationNode, DeleteOperationNode),
+    ('swap_sequence_delete_insert', DeleteOperationNode, InsertOperationNode),
+    ('swap_sequence_delete_delete', DeleteOperationNode, DeleteOperationNode),
+    ('merge_sequence', InsertOperationNode, InsertOperationNode),
+)
+
+
+def make_sequence(node_class, site_id, count, rng):
+    operations = []
+    for local_time in range(count):
+        if node_class is InsertOperationNode:
+            operation = InsertOperation(local_time * 7 + rng.randrange(3), "ab")
+        else:
+            operation = DeleteOperation(local_time * 5 + rng.randrange(2), 2)
+        operation.state = State(site_id, local_time, local_time)
+        operations.append(operation)
+    return node_class.from_list(operations)
+
+
+def measure(function, first_class, second_class, count, runs, pooled):
+    """
+    :return: The fastest time taken to call `function` with fresh sequences, in seconds
+    :rtype: float
+    """
+    rng = random.Random(1)
+    best = None
+    for _ in range(runs):
+        first = make_sequence(first_class, 1, count, rng)
+        second = make_sequence(second_class, 2, count, rng)
+        for pool in POOLS:
+            pool.clear()
+            if pooled:
+                pool.reserve(pool.capacity)
+        start = time.perf_counter()
+        function(first, second)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    for pool in POOLS:
+        pool.clear()
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+    if _ctransforms is None:
+        print("pyote._ctransforms hasn't been built, so only plain Python is measured")
+    for pooled in (False, True):
+        print("{:30} {:>10} {:>10} {:>8}".format('full pools' if pooled else 'empty pools', 'python', 'compiled',
+                                                 'speedup'))
+        for name, first_class, second_class in CASES:
+            python = measure(getattr(_transforms, name), first_class, second_class, count, runs, pooled)
+            if _ctransforms is None:
+                print("{:30} {:8.2f}ms".format(name, python * 1000))
+                continue
+            compiled = measure(getattr(_ctransforms, name), first_class, second_class, count, runs, pooled)
+            print("{:30} {:8.2f}ms {:8.2f}ms {:7.2f}x".format(name, python * 1000, compiled * 1000,
+                                                              python / compiled))
+
+
+if __name__ == "__main__":
+    main()
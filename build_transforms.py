@@ -0,0 +1,72 @@
+"""
+Compiles pyote/_transforms.py with Cython into the extension module pyote._ctransforms, which the engine uses in place
+of the plain Python module when the ``PYOTE_COMPILED`` environment variable is set.  The source isn't changed, so the
+compiled module behaves exactly like the plain one, and the plain one is still used wherever the extension hasn't been
+built.  Compare the two with ``benchmarks/bench_transforms.py`` before turning it on: on CPython 3.11 and later the
+compiled module is slower.
+
+Run from the root of the repository, with Cython and a C compiler installed::
+
+    python build_transforms.py
+
+Remove pyote/_ctransforms.*.so (or .pyd), or unset ``PYOTE_COMPILED``, to go back to the plain Python module.
+"""
+import glob
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def build():
+    """
+    Builds the extension in a temporary directory, and copies it into the package
+    :return: The path of the extension
+    :rtype: str
+    """
+    from Cython.Build import cythonize
+    from setuptools import Distribution, Extension
+
+    build_directory = tempfile.mkdtemp()
+    try:
+        # The source is copied under the name of the extension, so that Cython names the module after it
+        package_directory = os.path.join(build_directory, 'pyote')
+        os.mkdir(package_directory)
+        open(os.path.join(package_directory, '__init__.py'), 'w').close()
+        source = os.path.join(package_directory, '_ctransforms.py')
+        shutil.copy(os.path.join(ROOT, 'pyote', '_transforms.py'), source)
+        # The declarations of the C types used by the loops go with it, under the same name
+        shutil.copy(os.path.join(ROOT, 'pyote', '_transforms.pxd'), os.path.join(package_directory, '_ctransforms.pxd'))
+
+        extension = Extension('pyote._ctransforms', [source])
+        distribution = Distribution({'ext_modules': cythonize([extension], language_level=3, quiet=True)})
+        command = distribution.get_command_obj('build_ext')
+        command.build_lib = build_directory
+        command.build_temp = os.path.join(build_directory, 'temp')
+        command.ensure_finalized()
+        command.run()
+
+        built = command.get_ext_fullpath('pyote._ctransforms')
+        target = os.path.join(ROOT, 'pyote', os.path.basename(built))
+        for old in glob.glob(os.path.join(ROOT, 'pyote', '_ctransforms.*')):
+            os.remove(old)
+        shutil.copy(built, target)
+        return target
+    finally:
+        shutil.rmtree(build_directory)
+
+
+def main():
+    try:
+        import Cython  # noqa: F401
+    except ImportError:
+        print("Cython is needed to build the compiled transformations", file=sys.stderr)
+        return 1
+    print("Built {}".format(build()))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
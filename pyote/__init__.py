@@ -0,0 +1,52 @@
+"""
+Operational transformation for collaborative editing.
+
+Importing the package imports nothing else.  The subsystems, such as :mod:`pyote.serialization`, :mod:`pyote.server`
+and :mod:`pyote.history`, are imported the first time they are used, either by importing them directly or as
+attributes of the package, so a short-lived process which only needs the engine only pays for the engine::
+
+    import pyote
+
+    engine = pyote.Engine(1)
+    server = pyote.server.Server()
+"""
+import sys
+
+#: The subsystems which are imported when they are first used as attributes of the package
+SUBMODULES = ('cache', 'cursors', 'edits', 'engine', 'history', 'operations', 'profiling', 'replication',
+              'serialization', 'server', 'simulation', 'stats', 'streaming', 'threadsafe', 'undo', 'utils')
+
+# The classes which can be used from the package itself, and the modules they are imported from
+_EXPORTS = {
+    'Engine': 'engine',
+    'OTException': 'engine',
+    'ConcurrentEngine': 'threadsafe',
+    'TransactionSequence': 'utils',
+    'State': 'utils',
+    'InsertOperation': 'operations',
+    'DeleteOperation': 'operations',
+}
+
+__all__ = list(_EXPORTS) + list(SUBMODULES)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(_import(_EXPORTS[name]), name)
+    elif name in SUBMODULES:
+        value = _import(name)
+    else:
+        raise AttributeError("module 'pyote' has no attribute '{}'".format(name))
+    # Later lookups find the attribute without calling this again
+    globals()[name] = value
+    return value
+
+
+def _import(submodule):
+    name = 'pyote.' + submodule
+    __import__(name)
+    return sys.modules[name]
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
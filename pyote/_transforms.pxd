@@ -0,0 +1,30 @@
+# Types for the compiled build of pyote._transforms, which build_transforms.py copies next to the source.  The sizes and
+# positions the loops add up are kept in C integers, rather than as Python objects, and the plain Python module doesn't
+# see this file at all.
+import cython
+
+@cython.locals(incoming_value_size=cython.long, existing_value_size=cython.long, existing_pos=cython.long,
+               incoming_pos=cython.long)
+cpdef transform_insert_insert(incoming_sequence, existing_sequence)
+
+@cython.locals(incoming_value_size=cython.long, existing_value_size=cython.long, existing_pos=cython.long,
+               incoming_pos=cython.long)
+cpdef transform_delete_insert(incoming_sequence, existing_sequence)
+
+@cython.locals(incoming_value_size=cython.long, existing_value_size=cython.long, existing_end_point=cython.long,
+               existing_pos=cython.long, incoming_pos=cython.long)
+cpdef transform_insert_delete(incoming_sequence, existing_sequence)
+
+@cython.locals(incoming_value_size=cython.long, existing_value_size=cython.long, existing_end_point=cython.long,
+               existing_pos=cython.long, incoming_pos=cython.long, double_count_amount=cython.long,
+               double_delta=cython.long)
+cpdef transform_delete_delete(incoming_sequence, existing_sequence)
+
+@cython.locals(value_size=cython.long, pruned=cython.long)
+cpdef merge_sequence(sequence1, sequence2, landed=*, prune=*)
+
+@cython.locals(size1=cython.long, size2=cython.long)
+cpdef swap_sequence_delete_insert(sequence2, sequence1)
+
+@cython.locals(size1=cython.long, size2=cython.long)
+cpdef swap_sequence_delete_delete(sequence2, sequence1)
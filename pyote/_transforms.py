@@ -0,0 +1,549 @@
+"""
+The loops that transform, swap and merge sequences of operations, which do nearly all of the work of integrating a
+sequence.  :class:`pyote.engine.Engine` calls them through its methods of the same names.
+
+This module is plain Python, but it can also be compiled with Cython, by running ``python build_transforms.py`` from the
+root of the repository, which builds :mod:`pyote._ctransforms` from this same source and the C types declared in
+``_transforms.pxd``.  The engine only uses the compiled module when the ``PYOTE_COMPILED`` environment variable is set.
+Nearly all of the time in these loops goes to reading and writing the attributes of nodes, operations and states, and
+CPython 3.11 and later do that faster for classes with ``__slots__`` than the generic attribute access in compiled
+code, so the compiled module is slower than this one there (see ``benchmarks/bench_transforms.py``).
+
+Nodes are copied by calling their ``__copy__`` methods directly, rather than through :func:`copy.copy`, which has to
+look the method up for every node.
+"""
+from copy import copy
+
+from pyote.operations import DeleteOperation
+from pyote.utils import DeleteOperationNode
+
+
+def transform_insert_insert(incoming_sequence, existing_sequence):
+    """
+    Performs inclusive transformation on sequence1 with sequence2, meaning that the effects of `existing sequence`
+    are incorporated in `incoming_sequence`
+    :param pyote.utils.InsertOperationNode incoming_sequence: The sequence that will be transformed
+    :param pyote.utils.InsertOperationNode existing_sequence: The sequence with operations that will perform the
+                                                               transformation
+    :returns: The incoming sequence with the operations in the existing sequence taken into account
+    :rtype: pyote.utils.InsertOperationNode
+    """
+    incoming_value_size = 0
+    existing_value_size = 0
+    transformed_sequence = None
+    transformed_head = None
+    incoming_node = incoming_sequence
+    existing_node = existing_sequence
+    # Walk through both sequences, one at a time.
+    while existing_node and incoming_node:
+        # Calculate what the position of the operation would be if it were performed now, rather than
+        # after all other operations before it in the sequence.
+        existing_pos = existing_node.value.position - existing_value_size
+        incoming_pos = incoming_node.value.position - incoming_value_size
+        # If the position of the insert in the existing sequence comes before the insert in the incoming sequence,
+        # then record how much it would move the insertion position forward.
+        if existing_pos < incoming_pos:
+            existing_value_size += existing_node.value.get_increment()
+            existing_node = existing_node.next
+        elif existing_pos == incoming_pos and \
+            existing_node.value.state.site_id < \
+                incoming_node.value.state.site_id:
+            existing_value_size += existing_node.value.get_increment()
+            existing_node = existing_node.next
+        else:
+            # Otherwise, update the position of the incoming sequence's operation, and record how much it would
+            # move the position forward after it's applied.
+            if transformed_sequence:
+                transformed_sequence.next = incoming_node.__copy__()
+                transformed_sequence = transformed_sequence.next
+            else:
+                transformed_sequence = incoming_node.__copy__()
+                transformed_head = transformed_sequence
+            transformed_sequence.value.position += existing_value_size
+            incoming_value_size += incoming_node.value.get_increment()
+            incoming_node = incoming_node.next
+
+    # Take care of any elements that weren't handled in the above.
+    while incoming_node:
+        if transformed_sequence:
+            transformed_sequence.next = incoming_node.__copy__()
+            transformed_sequence = transformed_sequence.next
+        else:
+            transformed_sequence = incoming_node.__copy__()
+            transformed_head = transformed_sequence
+        transformed_sequence.value.position += existing_value_size
+        incoming_node = incoming_node.next
+    return transformed_head
+
+
+def transform_delete_insert(incoming_sequence, existing_sequence):
+    """
+    Performs inclusive transformation on sequence1 with sequence2, meaning that the effects of `existing sequence`
+    are incorporated in `incoming_sequence`
+    :param pyote.utils.DeleteOperationNode incoming_sequence: The sequence that will be transformed
+    :param pyote.utils.InsertOperationNode existing_sequence: The sequence with operations that will perform the
+                                                               transformation
+    :returns: The incoming sequence with the operations in the existing sequence taken into account
+    :rtype: pyote.utils.DeleteOperationNode
+    """
+    incoming_value_size = 0
+    existing_value_size = 0
+    transformed_sequence = None
+    transformed_head = None
+    incoming_node = incoming_sequence
+    existing_node = existing_sequence
+    # Walk through both sequences, one at a time.
+    while existing_node and incoming_node:
+        # Calculate what the position of the operation would be if it were performed now, rather than
+        # after all other operations before it in the sequence.
+        existing_pos = existing_node.value.position - existing_value_size
+        incoming_pos = incoming_node.value.position - incoming_value_size
+        # If the position of the insert in the existing sequence comes before the insert in the incoming sequence,
+        # then record how much it would move the insertion position forward.
+        if existing_pos < incoming_pos:
+            existing_value_size += existing_node.value.get_increment()
+            existing_node = existing_node.next
+        elif existing_pos == incoming_pos and \
+                existing_node.value.state.site_id < \
+                incoming_node.value.state.site_id:
+            existing_value_size += existing_node.value.get_increment()
+            existing_node = existing_node.next
+        else:
+            # Otherwise, update the position of the incoming sequence's operation, and record how much it would
+            # move the position forward after it's applied.
+            if transformed_sequence:
+                transformed_sequence.next = incoming_node.__copy__()
+                transformed_sequence = transformed_sequence.next
+            else:
+                transformed_sequence = incoming_node.__copy__()
+                transformed_head = transformed_sequence
+            transformed_sequence.value.position += existing_value_size
+            incoming_value_size += incoming_node.value.get_increment()
+            incoming_node = incoming_node.next
+
+    # Take care of any elements that weren't handled in the above.
+    while incoming_node:
+        if transformed_sequence:
+            transformed_sequence.next = incoming_node.__copy__()
+            transformed_sequence = transformed_sequence.next
+        else:
+            transformed_sequence = incoming_node.__copy__()
+            transformed_head = transformed_sequence
+        transformed_sequence.value.position += existing_value_size
+        incoming_node = incoming_node.next
+    return transformed_head
+
+
+def transform_insert_delete(incoming_sequence, existing_sequence):
+    """
+    Performs inclusive transformation on `incoming_sequence` with `existing_sequence`, meaning that the effects of
+    `existing sequence` are incorporated in `incoming_sequence`
+    :param pyote.utils.InsertOperationNode incoming_sequence: The sequence that will be transformed
+    :param pyote.utils.DeleteOperationNode existing_sequence: The sequence with operations that will perform the
+                                                               transformation
+    :returns: A copy of `incoming_sequence` with the operations in the existing sequence taken into account
+    :rtype: pyote.utils.InsertOperationNode
+    """
+    incoming_value_size = 0
+    existing_value_size = 0
+    existing_end_point = 0
+    transformed_sequence = None
+    transformed_head = None
+    incoming_node = incoming_sequence
+    existing_node = existing_sequence
+    # Walk through both sequences, one at a time.
+    while existing_node and incoming_node:
+        # Calculate what the position of the operation would be if it were performed now, rather than
+        # after all other operations before it in the sequence.
+        existing_pos = existing_node.value.position - existing_value_size
+        incoming_pos = incoming_node.value.position - incoming_value_size
+        # If the position of the insert in the existing sequence comes before the insert in the incoming sequence,
+        # then record how much it would move the insertion position forward.
+        if existing_pos < incoming_pos:
+            existing_value_size += existing_node.value.get_increment()
+            existing_end_point = existing_pos + existing_node.value.length
+            existing_node = existing_node.next
+        elif existing_pos == incoming_pos and \
+                existing_node.value.state.site_id < \
+                incoming_node.value.state.site_id:
+            existing_value_size += existing_node.value.get_increment()
+            existing_end_point = existing_pos + existing_node.value.length
+            existing_node = existing_node.next
+        else:
+            # Otherwise, update the position of the incoming sequence's operation, and record how much it would
+            # move the position forward after it's applied.
+            if transformed_sequence:
+                transformed_sequence.next = incoming_node.__copy__()
+                transformed_sequence = transformed_sequence.next
+            else:
+                transformed_sequence = incoming_node.__copy__()
+                transformed_head = transformed_sequence
+
+            if incoming_pos < existing_end_point:
+                transformed_sequence.value.position = existing_end_point + incoming_value_size
+            transformed_sequence.value.position += existing_value_size
+            incoming_value_size += incoming_node.value.get_increment()
+            incoming_node = incoming_node.next
+
+    # Take care of any elements that weren't handled in the above.
+    while incoming_node:
+        incoming_pos = incoming_node.value.position - incoming_value_size
+        if transformed_sequence:
+            transformed_sequence.next = incoming_node.__copy__()
+            transformed_sequence = transformed_sequence.next
+        else:
+            transformed_sequence = incoming_node.__copy__()
+            transformed_head = transformed_sequence
+        # An insert inside the last delete still ends up where the deleted text was
+        if incoming_pos < existing_end_point:
+            transformed_sequence.value.position = existing_end_point + incoming_value_size
+        transformed_sequence.value.position += existing_value_size
+        incoming_value_size += incoming_node.value.get_increment()
+        incoming_node = incoming_node.next
+    return transformed_head
+
+
+def transform_delete_delete(incoming_sequence, existing_sequence):
+    """
+    Performs inclusive transformation on sequence1 with sequence2, meaning that the effects of `existing sequence`
+    are incorporated in `incoming_sequence`
+    :param pyote.utils.DeleteOperationNode incoming_sequence: The sequence that will be transformed
+    :param pyote.utils.DeleteOperationNode existing_sequence: The sequence with operations that will perform the
+                                                               transformation
+    :returns: The incoming sequence with the operations in the existing sequence taken into account
+    :rtype: pyote.utils.DeleteOperationNode
+    """
+    existing_value_size = 0
+    incoming_value_size = 0
+    transformed_sequence = None
+    transformed_head = None
+    incoming_node = incoming_sequence
+    existing_node = existing_sequence
+    existing_end_point = 0
+    double_count_amount = 0
+    # Walk through both sequences, one at a time.
+    while existing_node and incoming_node:
+        # Calculate what the position of the operation would be if it were performed now, rather than
+        # after all other operations before it in the sequence.
+        existing_pos = existing_node.value.position + existing_value_size
+        incoming_pos = incoming_node.value.position + incoming_value_size
+        double_delta = 0
+        # If the position of the insert in the existing sequence comes before the insert in the incoming sequence,
+        # then record how much it would move the insertion position forward.
+        if existing_pos < incoming_pos:
+            existing_value_size += existing_node.value.length
+            existing_end_point = existing_pos + existing_node.value.length
+            existing_node = existing_node.next
+        elif existing_pos == incoming_pos and \
+                existing_node.value.state.site_id < \
+                incoming_node.value.state.site_id:
+            existing_value_size += existing_node.value.length
+            existing_end_point = existing_pos + existing_node.value.length
+            existing_node = existing_node.next
+        else:
+            # Otherwise, update the position of the incoming sequence's operation, and record how much it would
+            # move the position forward after it's applied.
+            if transformed_sequence:
+                transformed_sequence.next = incoming_node.__copy__()
+                transformed_sequence = transformed_sequence.next
+            else:
+                transformed_sequence = incoming_node.__copy__()
+                transformed_head = transformed_sequence
+            next_node = incoming_node.next
+            # There are three possible situations: either the incoming operation  overlaps with
+            # the existing operation before it, it overlaps with the existing operation after it, or it overlaps
+            # with neither.
+            # We begin by checking if the preceding existing operation overlaps with it
+            if existing_end_point > incoming_pos:
+                # Now, either this delete is contained completely within the preceding delete, or it isn't.
+                # In either case, we set the start of the incoming delete to the same point as the position
+                # of the preceding delete, and set the length to be whatever is left after the preceding delete
+                # has completed, which could be 0
+                transformed_sequence.value.position = existing_end_point - incoming_value_size
+                transformed_sequence.value.length = max(0, incoming_node.value.length -
+                                                        existing_end_point + incoming_pos)
+                # We now check if the next existing operation overlaps with this one
+            if incoming_pos + incoming_node.value.length > existing_pos:
+                # If so, then either the incoming operation ends within the existing operation, or it continues past
+                # the end.
+                if incoming_pos + incoming_node.value.length < existing_pos + existing_node.value.length:
+                    # If it ends early, then shorten the incoming operation so that it ends at the start of the
+                    # existing operation
+                    transformed_sequence.value.length = existing_pos - incoming_pos
+                elif incoming_pos != existing_pos + existing_node.value.length:
+                    # Otherwise, shorten the operation AND create a new operation
+                    # which starts after the existing operation
+                    transformed_sequence.value.length -= incoming_pos + incoming_node.value.length - existing_pos
+                    next_node = DeleteOperationNode(DeleteOperation(existing_pos + existing_node.value.length,
+                                                                    incoming_node.value.length + incoming_pos -
+                                                                    existing_pos - existing_node.value.length))
+                    next_node.next = incoming_node.next
+                    next_node.value.state = copy(incoming_node.value.state)
+                    # Because we are inserting a new node in the incoming sequence, we will double count it when
+                    # calculating the amount of deleting that we've done so far, so we subtract the size of the
+                    #  newly created node (it will be re-added on the next iteration)
+                    incoming_value_size -= next_node.value.length
+                    double_delta = -next_node.value.length
+                    next_node.value.position -= incoming_value_size + incoming_node.value.length
+
+            transformed_sequence.value.position -= existing_value_size - double_count_amount
+            double_count_amount += incoming_node.value.length - transformed_sequence.value.length + double_delta
+            incoming_value_size += incoming_node.value.length
+            incoming_node = next_node
+
+    # Take care of any elements that weren't handled in the above.
+    while incoming_node:
+        incoming_pos = incoming_node.value.position + incoming_value_size
+        if transformed_sequence:
+            transformed_sequence.next = incoming_node.__copy__()
+            transformed_sequence = transformed_sequence.next
+        else:
+            transformed_sequence = incoming_node.__copy__()
+            transformed_head = transformed_sequence
+        if existing_end_point > incoming_pos:
+            # Now, either this delete is contained completely within the preceding delete, or it isn't.
+            # In either case, we set the start of the incoming delete to the same point as the position
+            # of the preceding delete, and set the length to be whatever is left after the preceding delete
+            # has completed, which could be 0
+            transformed_sequence.value.position = existing_end_point - incoming_value_size
+            transformed_sequence.value.length = max(0, incoming_node.value.length -
+                                                    existing_end_point + incoming_pos)
+
+        transformed_sequence.value.position -= existing_value_size - double_count_amount
+        double_count_amount += incoming_node.value.length - transformed_sequence.value.length
+        incoming_value_size += incoming_node.value.length
+        incoming_node = incoming_node.next
+    return transformed_head
+
+
+def merge_sequence(sequence1, sequence2, landed=None, prune=False):
+    """
+    Merges two sequence that are in effect order into one sequence that maintains effect order.  All of the
+    operations in sequence1 must already have been incorporated (via :meth:_transform) into the operations in
+    `sequence2`. Essentially this works as a two way merge operation.  The state from the last operation in
+    `sequence2` is returned, to be recorded as the most recently applied state.
+
+    The nodes of `sequence1` are relinked into the merged sequence rather than copied, so `sequence1` must be owned
+    by the engine (such as the history itself) and must not be used after the merge.  `sequence2` is copied.
+
+    :param pyote.utils.OperationNode sequence1: The first sequence to merge
+    :param pyote.utils.OperationNode sequence2: The second sequence to merge.  Must have incorporated the effects of
+                                                `sequence1` already, and cannot contain any overlaps with the
+                                                effects of `sequence1` (if they are both delete operations)
+    :param list landed: If given, the operations from `sequence2` are appended to it, as they appear in the merged
+                        sequence
+    :param bool prune: Whether to leave the operations that don't change the text, such as deletes with a length
+                       of zero, out of the merged sequence
+    :return: A new sequence that is effect equivalent to running sequence1 then sequence 2, the state of the last
+             operation in `sequence2`, and the number of operations that were left out
+    :rtype: (pyote.utils.OperationNode, pyote.utils.State, int)
+    """
+    value_size = 0
+    merged_sequence = None
+    merged_node = None
+    last_state = None
+    pruned = 0
+    node1 = sequence1
+    node2 = sequence2
+    while node1 and node2:
+        if node2.value.position - value_size < node1.value.position:
+            if prune and not node2.value.get_increment():
+                pruned += 1
+                last_state = node2.value.state
+                node2 = node2.next
+                continue
+            if merged_node:
+                merged_node.next = node2.__copy__()
+                merged_node = merged_node.next
+            else:
+                merged_node = node2.__copy__()
+                merged_sequence = merged_node
+            if landed is not None:
+                landed.append(merged_node.value)
+            value_size += node2.value.get_increment()
+            last_state = node2.value.state
+            node2 = node2.next
+        else:
+            if prune and not node1.value.get_increment():
+                pruned += 1
+                node1 = node1.next
+                continue
+            node1.value.position += value_size
+            if merged_node:
+                merged_node.next = node1
+                merged_node = merged_node.next
+            else:
+                merged_node = node1
+                merged_sequence = merged_node
+            node1 = node1.next
+    while node2:
+        if prune and not node2.value.get_increment():
+            pruned += 1
+            last_state = node2.value.state
+            node2 = node2.next
+            continue
+        if merged_node:
+            merged_node.next = node2.__copy__()
+            merged_node = merged_node.next
+        else:
+            merged_node = node2.__copy__()
+            merged_sequence = merged_node
+        if landed is not None:
+            landed.append(merged_node.value)
+        value_size += node2.value.get_increment()
+        last_state = node2.value.state
+        node2 = node2.next
+    while node1:
+        if prune and not node1.value.get_increment():
+            pruned += 1
+            node1 = node1.next
+            continue
+        node1.value.position += value_size
+        if merged_node:
+            merged_node.next = node1
+            merged_node = merged_node.next
+        else:
+            merged_node = node1
+            merged_sequence = merged_node
+        node1 = node1.next
+    if prune and merged_node:
+        # The last node may still be linked to the operations that were left out after it
+        merged_node.next = None
+
+    return merged_sequence, last_state, pruned
+
+
+def swap_sequence_delete_insert(sequence2, sequence1):
+    """
+    Swaps the execution order of the two input sequences.  That is, previously sequence2 was executed
+    before sequence1, now it is executed afterwards
+    :param DeleteOperationNode sequence2:
+    :param InsertOperationNode sequence1:
+    :return: A tuple with the two sequences' order of execution swapped.  They are in the order
+             sequence1', sequence2'
+    :rtype: (InsertOperationNode, DeleteOperationNode):
+
+    """
+    new_sequence1 = None
+    new_sequence2 = None
+    new_node1 = None
+    new_node2 = None
+    node1 = sequence1
+    node2 = sequence2
+    size1 = 0
+    size2 = 0
+    while node1 and node2:
+        if node2.value.position <= node1.value.position - size1:
+            if new_sequence2:
+                new_node2.next = node2.__copy__()
+                new_node2 = new_node2.next
+            else:
+                new_node2 = node2.__copy__()
+                new_sequence2 = new_node2
+            new_node2.value.position += size1
+            size2 -= node2.value.get_increment()
+            node2 = node2.next
+        else:
+            if new_sequence1:
+                new_node1.next = node1.__copy__()
+                new_node1 = new_node1.next
+            else:
+                new_node1 = node1.__copy__()
+                new_sequence1 = new_node1
+            new_node1.value.position += size2
+            size1 += node1.value.get_increment()
+            node1 = node1.next
+    while node1:
+        if new_sequence1:
+            new_node1.next = node1.__copy__()
+            new_node1 = new_node1.next
+        else:
+            new_node1 = node1.__copy__()
+            new_sequence1 = new_node1
+        new_node1.value.position += size2
+        size1 += node1.value.get_increment()
+        node1 = node1.next
+    while node2:
+        if new_sequence2:
+            new_node2.next = node2.__copy__()
+            new_node2 = new_node2.next
+        else:
+            new_node2 = node2.__copy__()
+            new_sequence2 = new_node2
+        new_node2.value.position += size1
+        size2 -= node2.value.get_increment()
+        node2 = node2.next
+
+    return new_sequence1, new_sequence2
+
+
+def swap_sequence_delete_delete(sequence2, sequence1):
+    """
+    Swaps the execution order of the two input sequences.  That is, previously sequence2 was executed
+    before sequence1, now it is exectuted afterwards
+    :param DeleteOperationNode sequence2:
+    :param DeleteOperationNode sequence1:
+    :return: A tuple with the two sequence's order of execution swapped.  They are in the order
+             sequence1', sequence2'
+    :rtype: (DeleteOperationNode, DeleteOperationNode):
+
+    """
+    new_sequence1 = None
+    new_sequence2 = None
+    new_node1 = None
+    new_node2 = None
+    node1 = sequence1
+    node2 = sequence2
+    size1 = 0
+    size2 = 0
+    while node1 and node2:
+        if node2.value.position <= node1.value.position + size1:
+            if new_sequence2:
+                new_node2.next = node2.__copy__()
+                new_node2 = new_node2.next
+            else:
+                new_node2 = node2.__copy__()
+                new_sequence2 = new_node2
+            new_node2.value.position -= size1
+            size2 -= node2.value.get_increment()
+            node2 = node2.next
+        else:
+            if new_sequence1:
+                new_node1.next = node1.__copy__()
+                new_node1 = new_node1.next
+            else:
+                new_node1 = node1.__copy__()
+                new_sequence1 = new_node1
+            next_node = node1.next
+            if node1.value.position + size1 + node1.value.length > node2.value.position:
+                new_node1.value.length = node2.value.position - node1.value.position - size1
+                next_node = DeleteOperationNode(
+                    DeleteOperation(node1.value.position, node1.value.length - new_node1.value.length))
+                next_node.next = node1.next
+                next_node.value.state = copy(node1.value.state)
+
+            new_node1.value.position += size2
+            size1 -= new_node1.value.get_increment()
+            node1 = next_node
+    while node1:
+        if new_sequence1:
+            new_node1.next = node1.__copy__()
+            new_node1 = new_node1.next
+        else:
+            new_node1 = node1.__copy__()
+            new_sequence1 = new_node1
+        new_node1.value.position += size2
+        size1 -= node1.value.get_increment()
+        node1 = node1.next
+    while node2:
+        if new_sequence2:
+            new_node2.next = node2.__copy__()
+            new_node2 = new_node2.next
+        else:
+            new_node2 = node2.__copy__()
+            new_sequence2 = new_node2
+        new_node2.value.position += size1
+        size2 -= node2.value.get_increment()
+        node2 = node2.next
+
+    return new_sequence1, new_sequence2
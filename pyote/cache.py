@@ -0,0 +1,62 @@
+"""
+Sharing the work of transforming a remote sequence between engines.
+
+A server that relays every sequence to many clients typically keeps one engine per client, and those engines often
+have exactly the same history, because they have integrated the same sequences in the same order.  Every one of them
+would then transform each relayed sequence in exactly the same way.  Engines that are given the same
+:class:`TransformCache` look up the result of those transformations before doing them, keyed by a fingerprint of the
+incoming sequence and a digest of everything that built the engine's history, so that only the first engine pays for
+them.
+"""
+from collections import OrderedDict
+
+
+class TransformCache(object):
+    def __init__(self, capacity=1024):
+        """
+        A least recently used cache of transformation results, shared between engines.  The results are plain
+        positions and states rather than operations, so nothing in the cache is ever part of a history.
+        :param int capacity: The number of results to keep
+        """
+        self.capacity = capacity
+        #: The number of lookups which found a result
+        self.hits = 0
+        """:type: int"""
+        #: The number of lookups which didn't find a result
+        self.misses = 0
+        """:type: int"""
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Looks up the result stored for `key`
+        :param key: The key the result was stored under
+        :return: The result, or None if there isn't one
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        """
+        Stores a result, dropping the least recently used result if the cache is full
+        :param key: The key to store the result under
+        :param entry: The result
+        """
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes every result from the cache
+        """
+        self._entries.clear()
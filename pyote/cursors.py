@@ -0,0 +1,175 @@
+"""
+Moving cursors and selections so that they stay in the same place in the text as a transaction sequence is applied.
+
+The positions are transformed in the same way that :meth:`pyote.engine.Engine._transform_insert_insert` and
+:meth:`pyote.engine.Engine._transform_delete_insert` transform operations: the cursors and the operations are both
+walked in order, once, so a whole batch of cursors costs about as much as a single pass over the sequence.  A cursor
+which sits exactly where text is inserted is moved after the text if the insert's site id is lower than the cursor's
+site id, and stays before it otherwise, which is the same rule that orders two inserts at the same position.
+"""
+from pyote.operations import MultiReplaceOperation
+
+#: Used as the site id of a position which stays before any text inserted exactly at it, such as the end of a range
+#: which shouldn't grow
+STAY_BEFORE = object()
+
+
+def transform_positions(sequence, positions, site_ids=None):
+    """
+    Finds where each position will be once `sequence` has been applied to the text, as in
+    :meth:`pyote.utils.TransactionSequence.apply_to`
+    :param pyote.utils.TransactionSequence sequence: The sequence that is being applied
+    :param list[int] positions: The positions to transform, in ascending order
+    :param site_ids: The site that each position belongs to, which decides whether it goes before or after text
+                     inserted exactly at that position.  This can be a single site id for every position, or a list
+                     with one site id for each position.  A position without a site id always goes after the text,
+                     as a cursor does when text is typed at it, and a position with :data:`STAY_BEFORE` as its site
+                     id always stays before it.
+    :type site_ids: int | list[int]
+    :return: The transformed positions, in the same order as `positions`
+    :rtype: list[int]
+    :raises ValueError: If the positions are not in ascending order
+    """
+    if not isinstance(site_ids, list):
+        return _transform_deletes(sequence.deletes,
+                                  _transform_inserts(sequence.inserts, positions, [site_ids] * len(positions)))
+    for previous, position in zip(positions, positions[1:]):
+        _check_order(previous, position)
+    # Positions which are the same, but belong to different sites, can be moved past different amounts of inserted
+    # text.  Ordering them by site keeps the transformed positions in order, so the deletes can be applied in one pass.
+    order = sorted(range(len(positions)), key=lambda index: (positions[index], _site_rank(site_ids[index])))
+    transformed = _transform_deletes(sequence.deletes,
+                                     _transform_inserts(sequence.inserts, [positions[index] for index in order],
+                                                        [site_ids[index] for index in order]))
+    result = [None] * len(positions)
+    for index, position in zip(order, transformed):
+        result[index] = position
+    return result
+
+
+def transform_ranges(sequence, ranges, site_ids=None):
+    """
+    Finds where each range, such as a selection, will be once `sequence` has been applied to the text.  Text inserted
+    at either end of a range is placed inside or outside the range by the same rule as for a single position, and a
+    range whose text is entirely deleted is collapsed to where the text was.
+    :param pyote.utils.TransactionSequence sequence: The sequence that is being applied
+    :param list[(int, int)] ranges: The (start, end) of each range, with start no greater than end
+    :param site_ids: The site that each range belongs to, as in :func:`transform_positions`
+    :type site_ids: int | list[int]
+    :return: The transformed ranges, in the same order as `ranges`
+    :rtype: list[(int, int)]
+    """
+    if not isinstance(site_ids, list):
+        site_ids = [site_ids] * len(ranges)
+    # Transform every end point in one pass, and then put the ranges back together
+    end_points = sorted((position, index) for index, (start, end) in enumerate(ranges) for position in (start, end))
+    transformed = transform_positions(sequence, [position for position, _ in end_points],
+                                      [site_ids[index] for _, index in end_points])
+    starts = [None] * len(ranges)
+    ends = [None] * len(ranges)
+    for (position, index), new_position in zip(end_points, transformed):
+        start, end = ranges[index]
+        if position == start and starts[index] is None:
+            starts[index] = new_position
+        else:
+            ends[index] = new_position
+    return [(start, max(start, end)) for start, end in zip(starts, ends)]
+
+
+def transform_replacements(sequence, operation):
+    """
+    Moves the ranges of a :class:`pyote.operations.MultiReplaceOperation`, such as the matches found by a find and
+    replace, past a sequence applied to the text since they were found, in one pass over the sequence.  Text inserted
+    at either end of a range is left outside of it.  A replacement whose range has had text inserted into it or deleted
+    from it by the sequence is dropped, since the text it was meant to replace is no longer there.  Each dropped
+    replacement is returned with where its range is now, so that the caller can decide what to do about it, such as
+    looking for the match again in the text that is there now.
+    :param pyote.utils.TransactionSequence sequence: The sequence that is being applied
+    :param pyote.operations.MultiReplaceOperation operation: The replacements, located in the text before `sequence`
+    :return: The replacements which are left, located in the text after `sequence`, and the replacements which were
+             dropped, as the index in `operation.ranges` and the start and end of the range in the text after `sequence`
+    :rtype: (pyote.operations.MultiReplaceOperation, list[(int, int, int)])
+    """
+    positions = []
+    site_ids = []
+    for position, length, _ in operation.ranges:
+        positions.extend((position, position + length))
+        site_ids.extend((None, STAY_BEFORE))
+    transformed = transform_positions(sequence, positions, site_ids)
+    # Where the ranges are once only the inserts have been applied, which tells apart text inserted into a range from
+    # text deleted from it, when both change its length by the same amount
+    inserted = _transform_inserts(sequence.inserts, positions, site_ids) if sequence.inserts else positions
+    ranges = []
+    dropped = []
+    for index, (_, length, value) in enumerate(operation.ranges):
+        start, end = transformed[2 * index], transformed[2 * index + 1]
+        if not length:
+            ranges.append((start, 0, value))
+        elif end - start == length and inserted[2 * index + 1] - inserted[2 * index] == length:
+            ranges.append((start, length, value))
+        else:
+            dropped.append((index, start, end))
+    return MultiReplaceOperation(ranges), dropped
+
+
+def _check_order(previous, position):
+    if position < previous:
+        raise ValueError("Positions must be in ascending order")
+
+
+def _transform_inserts(inserts, positions, site_ids):
+    transformed = []
+    # The total length of the inserts before the current one, which is how far they have moved every position after
+    # them
+    shift = 0
+    node = inserts
+    previous = None
+    for position, site_id in zip(positions, site_ids):
+        if previous is not None:
+            _check_order(previous, position)
+        previous = position
+        while node and node.value.position < position + shift:
+            shift += node.value.get_increment()
+            node = node.next
+        new_position = position + shift
+        # Inserts exactly at this position go before it if they come from a site with a lower id.  Inserts which
+        # follow on from each other in one sequence are all at this position.
+        tied = node
+        while tied and tied.value.position == new_position and _goes_before(tied.value, site_id):
+            new_position += tied.value.get_increment()
+            tied = tied.next
+        transformed.append(new_position)
+    return transformed
+
+
+def _site_rank(site_id):
+    # Positions without a site go after every inserted text, so they come after every site
+    if site_id is STAY_BEFORE:
+        return -1, 0
+    return (1, 0) if site_id is None else (0, site_id)
+
+
+def _goes_before(operation, site_id):
+    if site_id is STAY_BEFORE:
+        return False
+    if site_id is None or not operation.state:
+        return True
+    return operation.state.site_id < site_id
+
+
+def _transform_deletes(deletes, positions):
+    transformed = []
+    # The total length of the deletes before the current one
+    removed = 0
+    node = deletes
+    for position in positions:
+        current = position - removed
+        while node and node.value.position + node.value.length <= current:
+            removed += node.value.length
+            current -= node.value.length
+            node = node.next
+        if node and node.value.position < current:
+            # The position was inside the deleted text, so it ends up where the text was
+            current = node.value.position
+        transformed.append(current)
+    return transformed
@@ -0,0 +1,146 @@
+"""
+Converting transaction sequences to and from lists of edits.
+
+A transaction sequence holds its inserts and then its deletes, each located in the text as it is after the operations
+before it.  That suits the engine, but code which needs to move a whole transaction past another one, such as
+:mod:`pyote.server` and :mod:`pyote.undo`, works with lists of edits instead.  Every edit is a `(start, end, text)`
+tuple, which replaces the text between `start` and `end` with `text`, located in the text before any of the edits.  The
+edits in a list don't overlap, and are in order, and edits which touch are combined into one.
+"""
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode
+
+
+def operations(sequence):
+    """
+    Copies the positions and values out of a sequence, so that they aren't changed as the history changes
+    :param pyote.utils.TransactionSequence sequence: The sequence
+    :return: The position and value of each insert, and the position and length of each delete, in effect order
+    :rtype: (list[(int, str)], list[(int, int)])
+    """
+    inserts = []
+    node = sequence.inserts
+    while node:
+        inserts.append((node.value.position, node.value.value))
+        node = node.next
+    deletes = []
+    node = sequence.deletes
+    while node:
+        deletes.append((node.value.position, node.value.length))
+        node = node.next
+    return inserts, deletes
+
+
+def to_sequence(inserts, deletes):
+    """
+    Creates a transaction sequence out of the inserts and deletes returned by :func:`operations`
+    :param list[(int, str)] inserts: The position and value of each insert, in effect order
+    :param list[(int, int)] deletes: The position and length of each delete, in effect order
+    :rtype: pyote.utils.TransactionSequence
+    """
+    return TransactionSequence(None,
+                               InsertOperationNode.from_list([InsertOperation(*insert) for insert in inserts]),
+                               DeleteOperationNode.from_list([DeleteOperation(*delete) for delete in deletes]))
+
+
+def edits_from_operations(inserts, deletes):
+    """
+    Turns the inserts and deletes of a sequence into edits.  The inserts and the deletes are both located in the text
+    as it is after the inserts, where the inserted text and the deleted text are each a list of intervals, and
+    inserted text that is deleted again cancels out.
+    :param list[(int, str)] inserts: The inserts in the sequence, in effect order
+    :param list[(int, int)] deletes: The deletes in the sequence, in effect order
+    :return: The edits which make the same changes, located in the text before the sequence
+    :rtype: list[(int, int, str)]
+    """
+    # The inserted text, as [start, end, value], located in the text after the inserts
+    inserted = []
+    for position, value in inserts:
+        # An insert in effect order either falls inside or at the end of the last inserted text, or after it
+        if inserted and position <= inserted[-1][1]:
+            start, end, text = inserted[-1]
+            inserted[-1] = [start, end + len(value), text[:position - start] + value + text[position - start:]]
+        elif value:
+            inserted.append([position, position + len(value), value])
+    deleted = []
+    removed = 0
+    for position, length in deletes:
+        deleted.append((position + removed, position + removed + length))
+        removed += length
+
+    boundaries = sorted(set([point for interval in inserted for point in interval[:2]] +
+                            [point for interval in deleted for point in interval]))
+    edits = []
+    # The amount of inserted text before the current point
+    inserted_before = 0
+    insert_index = delete_index = 0
+    for start, end in zip(boundaries, boundaries[1:]):
+        while insert_index < len(inserted) and inserted[insert_index][1] <= start:
+            insert_index += 1
+        while delete_index < len(deleted) and deleted[delete_index][1] <= start:
+            delete_index += 1
+        is_inserted = insert_index < len(inserted) and inserted[insert_index][0] <= start
+        is_deleted = delete_index < len(deleted) and deleted[delete_index][0] <= start
+        position = start - inserted_before
+        if is_inserted and not is_deleted:
+            offset = start - inserted[insert_index][0]
+            add_edit(edits, position, position, inserted[insert_index][2][offset:offset + end - start])
+        elif is_deleted and not is_inserted:
+            add_edit(edits, position, position + end - start, '')
+        if is_inserted:
+            inserted_before += end - start
+    return edits
+
+
+def edits_from_sequence(sequence):
+    """
+    Finds the edits that a sequence makes to the text it is applied to
+    :param pyote.utils.TransactionSequence sequence: The sequence, in effect order
+    :rtype: list[(int, int, str)]
+    """
+    return edits_from_operations(*operations(sequence))
+
+
+def add_edit(edits, start, end, text):
+    """
+    Adds an edit to the end of a list of edits, combining it with the last edit if they touch
+    :param list[(int, int, str)] edits: The edits to add to
+    :param int start: The start of the text to replace
+    :param int end: The end of the text to replace
+    :param str text: The text to replace it with
+    """
+    if end == start and not text:
+        return
+    if edits and edits[-1][1] == start:
+        last_start, _, last_text = edits[-1]
+        edits[-1] = (last_start, end, last_text + text)
+    else:
+        edits.append((start, end, text))
+
+
+def operations_from_edits(edits):
+    """
+    Turns edits into the inserts and deletes of a sequence, in effect order
+    :param list[(int, int, str)] edits: The edits
+    :rtype: (list[(int, str)], list[(int, int)])
+    """
+    inserts = []
+    deletes = []
+    inserted = removed = 0
+    for start, end, text in edits:
+        if text:
+            inserts.append((start + inserted, text))
+            inserted += len(text)
+        if end > start:
+            deletes.append((start + inserted - removed, end - start))
+            removed += end - start
+    return inserts, deletes
+
+
+def sequence_from_edits(edits):
+    """
+    Turns edits into a transaction sequence in effect order
+    :param list[(int, int, str)] edits: The edits
+    :rtype: pyote.utils.TransactionSequence
+    """
+    return to_sequence(*operations_from_edits(edits))
@@ -1,15 +1,40 @@
+import os
+from collections import deque
 from copy import copy
 
 from pyote.operations import DeleteOperation
-from pyote.utils import TransactionSequence, OperationNode, DeleteOperationNode, State
+from pyote.utils import TransactionSequence, OperationNode, InsertOperationNode, DeleteOperationNode, State, \
+    MemoryUsage
+
+# The compiled transformations are slower than the plain ones on CPython 3.11 and later, so they are only used when
+# they are asked for
+_transforms = None
+if os.environ.get('PYOTE_COMPILED'):
+    try:
+        from pyote import _ctransforms as _transforms
+    except ImportError:
+        pass
+if _transforms is None:
+    from pyote import _transforms
+
+#: Whether the transformations are running from the module compiled by build_transforms.py
+COMPILED = _transforms.__name__ == 'pyote._ctransforms'
 
 
 class OTException(Exception):
     pass
 
 
+class MemoryLimitExceeded(OTException):
+    pass
+
+
 class Engine(object):
-    def __init__(self, site_id):
+    #: The number of merged inserts to remember for bringing concurrent views up to date
+    MAX_LANDED = 4096
+
+    def __init__(self, site_id, max_pending=1024, soft_limit=None, hard_limit=None, on_soft_limit=None,
+                 transform_cache=None, stats=None, prune_deletes=False):
         """
         Initialize the history at this site.
         The history at a site is represented as a sequence of insert operations, followed by a sequence of delete
@@ -18,6 +43,26 @@ class Engine(object):
         deletions
 
         :param int site_id: An id which uniquely identifies this site across all peers
+        :param int max_pending: The maximum number of remote sequences that :meth:`deliver_remote` will hold while
+                                waiting for the state they were generated from
+        :param int soft_limit: The approximate size of the history, in bytes, above which `on_soft_limit` is called
+        :param int hard_limit: The approximate size of the history, in bytes, that it may never grow beyond.  Sequences
+                               which would take the history past this size are rejected with
+                               :class:`MemoryLimitExceeded` before any of the history is changed.
+        :param on_soft_limit: Called with the engine whenever the history grows past `soft_limit`, so that it can be
+                              compacted or the document unloaded.  It is not called again until the history has dropped
+                              back below the limit.
+        :type on_soft_limit: (Engine) -> None
+        :param pyote.cache.TransformCache transform_cache: A cache shared with other engines, which is used to skip
+                                                           transforming a remote sequence if an engine with the same
+                                                           history has already transformed it
+        :param pyote.stats.EngineStats stats: Where to count how much the transformations fragment the history.  By
+                                              default, nothing is counted.
+        :param bool prune_deletes: Whether to leave deletes with a length of zero out of the history.  Transforming a
+                                   delete which falls entirely inside text that has already been deleted leaves it with
+                                   nothing to delete, but it would otherwise be kept in the history, and walked past by
+                                   every transformation after it.  Its state is still kept in the state index, so
+                                   sequences generated after it can still be integrated.
         """
         #: The unique id for this site
         self.site_id = site_id
@@ -34,6 +79,57 @@ class Engine(object):
         #: The current time stamp for operations that have been integrated into the history
         self._time_stamp = 0
         """:type: int"""
+        #: The local time of every operation integrated into the history, keyed by (site_id, remote_time)
+        self._state_index = {}
+        """:type: dict[(int, int), int]"""
+        #: Remote sequences that arrived before their starting state, keyed by the (site_id, remote_time) they wait on
+        self._pending = {}
+        """:type: dict[(int, int), list[pyote.utils.TransactionSequence]]"""
+        #: Held back sequences whose starting state has since been integrated, in the order they became ready
+        self._ready = deque()
+        """:type: collections.deque"""
+        #: The number of remote sequences currently held back by :meth:`deliver_remote`
+        self.pending_count = 0
+        """:type: int"""
+        #: The maximum number of remote sequences that can be held back at once
+        self.max_pending = max_pending
+        """:type: int"""
+        #: The size of the history, which is kept up to date as operations are added to it
+        self.memory_usage = MemoryUsage()
+        """:type: pyote.utils.MemoryUsage"""
+        self.soft_limit = soft_limit
+        """:type: int"""
+        self.hard_limit = hard_limit
+        """:type: int"""
+        self.on_soft_limit = on_soft_limit
+        # Whether the history was over the soft limit the last time it was checked
+        self._over_soft_limit = False
+        #: The last result of _get_concurrent for each remote site, as (local time of the starting state, length of
+        #: _landed at the time, operations in effect order)
+        self._concurrent_views = {}
+        """:type: dict[int, (int, int, list[pyote.operations.InsertOperation])]"""
+        #: The inserts merged into the history, in the order they were merged
+        self._landed = []
+        """:type: list[pyote.operations.InsertOperation]"""
+        #: The number of inserts that have been dropped from the front of _landed
+        self._landed_offset = 0
+        """:type: int"""
+        #: The cache of transformation results shared with other engines
+        self.transform_cache = transform_cache
+        """:type: pyote.cache.TransformCache"""
+        #: A digest of every sequence that has built the history, in order, which is the same for two engines exactly
+        #: when their histories are the same.  It is only kept up to date when there is a transform cache.
+        self._history_digest = b'' if transform_cache is not None else None
+        """:type: bytes"""
+        #: The counts of the nodes in and out of the transformations, which are only kept if stats were given
+        self.stats = stats
+        """:type: pyote.stats.EngineStats"""
+        #: Whether deletes with a length of zero are left out of the history
+        self.prune_deletes = prune_deletes
+        """:type: bool"""
+        #: The number of deletes with a length of zero that have been left out of the history
+        self.pruned_deletes = 0
+        """:type: int"""
 
     def integrate_remote(self, remote_sequence):
         """
@@ -46,37 +142,114 @@ class Engine(object):
         :rtype: pyote.utils.TransactionSequence
         """
 
-        # Get all the local inserts that have happened since the last sync with the remote site
-        local_concurrent_inserts = self._get_concurrent(remote_sequence.starting_state, self._inserts)
+        self._check_hard_limit(remote_sequence)
+        local_deletes = self._deletes
+
+        # If an engine with the same history has already integrated this sequence, then the transformed remote
+        # operations will be the same here
+        cache_key = cached = None
+        if self._history_digest is not None:
+            cache_key = (remote_sequence.fingerprint(), self._history_digest)
+            cached = self.transform_cache.get(cache_key)
+
+        if cached:
+            transformed_remote_inserts = self._copy_with_positions(remote_sequence.inserts, cached[0])
+            new_remote_inserts = self._copy_with_positions(remote_sequence.inserts, cached[1])
+        else:
+            # Get all the local inserts that have happened since the last sync with the remote site
+            local_concurrent_inserts = self._get_concurrent(remote_sequence.starting_state, self._inserts,
+                                                            self._sender(remote_sequence))
 
-        # Transform the remote inserts so that they account for the changes from the local inserts
-        transformed_remote_inserts = self._transform_insert_insert(remote_sequence.inserts, local_concurrent_inserts)
+            # Transform the remote inserts so that they account for the changes from the local inserts
+            transformed_remote_inserts = self._transform_insert_insert(remote_sequence.inserts,
+                                                                       local_concurrent_inserts)
 
-        # Transform the remote inserts so that they account for the changes from the local deletes
-        new_remote_inserts = self._transform_insert_delete(transformed_remote_inserts, self._deletes)
+            # Transform the remote inserts so that they account for the changes from the local deletes
+            new_remote_inserts = self._transform_insert_delete(transformed_remote_inserts, self._deletes)
 
         self._assign_timestamps(transformed_remote_inserts)
 
         # Merge the transformed remote inserts with the local.  Note that we use the inserts that have not been
         # transformed by deletes, as the local inserts always preceded the deletes.
-        self._inserts = self._merge_sequence(self._inserts, transformed_remote_inserts)
+        self._inserts = self._merge_sequence(self._inserts, transformed_remote_inserts, self._landed)
+        self._trim_landed()
 
         # Adjust the local deletes with the remote inserts that have been merged into the local inserts
         transformed_local_deletes = self._transform_delete_insert(self._deletes, transformed_remote_inserts)
 
-        # Transform the remote deletes with all of the local inserts that happened since the last sync
-        transformed_remote_deletes = self._transform_delete_insert(remote_sequence.deletes, local_concurrent_inserts)
+        transformed_remote_deletes = None
+        if cached:
+            new_remote_deletes = self._deletes_from_records(cached[2])
+        else:
+            # Transform the remote deletes with all of the local inserts that happened since the last sync
+            transformed_remote_deletes = self._transform_delete_insert(remote_sequence.deletes,
+                                                                       local_concurrent_inserts)
 
-        # Transform the remote deletes with ALL of the local deletes.
-        new_remote_deletes = self._transform_delete_delete(transformed_remote_deletes, transformed_local_deletes)
+            # Transform the remote deletes with ALL of the local deletes.
+            new_remote_deletes = self._transform_delete_delete(transformed_remote_deletes, transformed_local_deletes)
+
+            if self.stats is not None:
+                self.stats.record_transform('transform_delete_delete', transformed_remote_deletes, new_remote_deletes)
+
+            if cache_key:
+                self.transform_cache.put(cache_key, (self._positions(transformed_remote_inserts),
+                                                     self._positions(new_remote_inserts),
+                                                     self._delete_records(new_remote_deletes)))
 
         self._assign_timestamps(new_remote_deletes)
 
         # Merge the remote deletes that have taken all the local operations into effect with the local deletes
-        self._deletes = self._merge_sequence(transformed_local_deletes, new_remote_deletes)
+        pruned = self.pruned_deletes
+        self._deletes = self._merge_sequence(transformed_local_deletes, new_remote_deletes, prune=self.prune_deletes)
+
+        # The intermediate sequences, and the deletes that were replaced, won't be used again, so they can be reused
+        InsertOperationNode.pool.release(transformed_remote_inserts)
+        DeleteOperationNode.pool.release(transformed_remote_deletes)
+        DeleteOperationNode.pool.release(local_deletes)
+
+        states = self.memory_usage.states
+        self.memory_usage.add(new_remote_inserts, new_remote_deletes)
+        self.memory_usage.delete_nodes -= self.pruned_deletes - pruned
+        if self.stats is not None:
+            self.stats.record_call(True, self.memory_usage.states - states)
+        self._check_soft_limit()
+        self._advance_digest(b'r', remote_sequence)
 
         return TransactionSequence(remote_sequence.starting_state, new_remote_inserts, new_remote_deletes)
 
+    def deliver_remote(self, remote_sequence):
+        """
+        Integrates `remote_sequence` into the local history as soon as the state it was generated from is known
+        locally.  Sequences that arrive before their starting state are held back, and are integrated automatically
+        once an operation with that state has been integrated.  Unlike :meth:`integrate_remote`, this never raises
+        because of an unknown starting state, so callers don't need to retry out of order sequences themselves.
+        :param pyote.utils.TransactionSequence remote_sequence: A transaction sequence representing the operations to
+                                                                integrate into local history
+        :return: The transaction sequences that can now be applied to the local data, in the order they must be applied.
+                 This is empty if `remote_sequence` was held back.
+        :rtype: list[pyote.utils.TransactionSequence]
+        """
+        starting_state = remote_sequence.starting_state
+        if starting_state and self._lookup_local_time(starting_state) is None:
+            if self.pending_count >= self.max_pending:
+                raise OTException("Too many sequences are waiting for their starting state")
+            self._pending.setdefault((starting_state.site_id, starting_state.remote_time), []).append(remote_sequence)
+            self.pending_count += 1
+            return []
+
+        self._ready.append(remote_sequence)
+        applied = []
+        # Integrating a sequence can release held back sequences, which are queued in _ready by _assign_timestamps
+        while self._ready:
+            sequence = self._ready.popleft()
+            try:
+                applied.append(self.integrate_remote(sequence))
+            except MemoryLimitExceeded:
+                # Leave the sequence to be integrated by the next delivery, once the history has been compacted
+                self._ready.appendleft(sequence)
+                raise
+        return applied
+
     def process_transaction(self, outgoing_sequence):
         """
         Processes a series of operations prior to being sent out to remote sites.  The operations must
@@ -88,26 +261,105 @@ class Engine(object):
         :rtype: TransactionSequence
         """
 
+        self._check_hard_limit(outgoing_sequence)
+
         # Record the current state so that when we transmit this sequence, we can place it within the history
         outgoing_state = self.last_state
         self._assign_timestamps(outgoing_sequence.inserts)
         self._assign_timestamps(outgoing_sequence.deletes)
 
+        local_deletes = self._deletes
+
         # Swap the execution order of the outgoing insert operations so that they happen before the local deletes
-        transformed_inserts, transformed_deletes = self._swap_sequence_delete_insert(self._deletes,
+        transformed_inserts, transformed_deletes = self._swap_sequence_delete_insert(local_deletes,
                                                                                      outgoing_sequence.inserts)
 
         # Swap the execution order of the outgoing delete operations so they happen before the local deletes
-        new_deletes, _ = self._swap_sequence_delete_delete(transformed_deletes, outgoing_sequence.deletes)
+        new_deletes, swapped_deletes = self._swap_sequence_delete_delete(transformed_deletes, outgoing_sequence.deletes)
+
+        if self.stats is not None:
+            self.stats.record_transform('swap_sequence_delete_delete', outgoing_sequence.deletes, new_deletes)
 
         # Record that we've performed the outgoing insertion operations
-        self._inserts = self._merge_sequence(self._inserts, transformed_inserts)
+        self._inserts = self._merge_sequence(self._inserts, transformed_inserts, self._landed)
+        self._trim_landed()
 
         # Record that we've performed the outgoing delete operations
-        self._deletes = self._merge_sequence(transformed_deletes, outgoing_sequence.deletes)
+        pruned = self.pruned_deletes
+        self._deletes = self._merge_sequence(transformed_deletes, outgoing_sequence.deletes, prune=self.prune_deletes)
+
+        # Neither the deletes that were replaced nor the unused result of the second swap will be used again
+        DeleteOperationNode.pool.release(local_deletes)
+        DeleteOperationNode.pool.release(swapped_deletes)
+
+        states = self.memory_usage.states
+        self.memory_usage.add(transformed_inserts, outgoing_sequence.deletes)
+        self.memory_usage.delete_nodes -= self.pruned_deletes - pruned
+        if self.stats is not None:
+            self.stats.record_call(False, self.memory_usage.states - states)
+        self._check_soft_limit()
+        self._advance_digest(b'l', outgoing_sequence)
 
         return TransactionSequence(outgoing_state, transformed_inserts, new_deletes)
 
+    def recount_memory_usage(self):
+        """
+        Measures the history again by walking it, and indexes the states of its operations so that sequences generated
+        after them can be integrated.  This must be called after the history has been replaced or compacted directly,
+        rather than through :meth:`integrate_remote` and :meth:`process_transaction`, since starting states are only
+        ever looked up in the index.
+        :return: The size of the history
+        :rtype: pyote.utils.MemoryUsage
+        """
+        self.memory_usage = MemoryUsage.of(self._inserts, self._deletes)
+        self._index_history()
+        self._history_replaced()
+        self._over_soft_limit = self.soft_limit is not None and self.memory_usage.bytes > self.soft_limit
+        return self.memory_usage
+
+    def pack_history(self):
+        """
+        Packs the history into columns, which take up far less memory than the linked lists.  The engine itself isn't
+        changed, so it can be dropped once the packed history has been stored.
+        :rtype: pyote.history.ColumnarHistory
+        """
+        from pyote.history import ColumnarHistory
+        return ColumnarHistory.from_engine(self)
+
+    @classmethod
+    def from_history(cls, history, **kwargs):
+        """
+        Creates an engine which carries on from a packed history.  All of the history is unpacked into the engine,
+        even from a :class:`pyote.history.MappedHistory`, since the engine only works with its own linked lists.
+        :param pyote.history.ColumnarHistory history: The history created by :meth:`pack_history`
+        :param kwargs: Any other arguments for the engine, such as its limits
+        :rtype: Engine
+        """
+        return history.restore(cls(history.site_id, **kwargs))
+
+    def _check_hard_limit(self, sequence):
+        """
+        Makes sure that adding `sequence` to the history won't take it past the hard limit
+        :param pyote.utils.TransactionSequence sequence: The sequence that is about to be added
+        :raises MemoryLimitExceeded: If the history would grow too large
+        """
+        if self.hard_limit is None:
+            return
+        size = self.memory_usage.bytes + MemoryUsage.of(sequence.inserts, sequence.deletes).bytes
+        if size > self.hard_limit:
+            raise MemoryLimitExceeded("Integrating the sequence would grow the history to about {} bytes, past the "
+                                      "limit of {}".format(size, self.hard_limit))
+
+    def _check_soft_limit(self):
+        if self.soft_limit is None:
+            return
+        if self.memory_usage.bytes <= self.soft_limit:
+            self._over_soft_limit = False
+        elif not self._over_soft_limit:
+            self._over_soft_limit = True
+            if self.on_soft_limit:
+                self.on_soft_limit(self)
+
     def _assign_timestamps(self, sequence):
         """
         Assigns a sequential local timestamp to every node in the sequence.  If the node is lacking
@@ -117,51 +369,45 @@ class Engine(object):
         node = sequence
         while node:
             self._time_stamp += 1
-            if node.value.state:
-                node.value.state.local_time = self._time_stamp
+            state = node.value.state
+            if state:
+                state.local_time = self._time_stamp
             else:
-                node.value.state = State(self.site_id, self._time_stamp, self._time_stamp)
+                state = node.value.state = State(self.site_id, self._time_stamp, self._time_stamp)
+            key = (state.site_id, state.remote_time)
+            self._state_index[key] = self._time_stamp
+            if self._pending and key in self._pending:
+                waiting = self._pending.pop(key)
+                self.pending_count -= len(waiting)
+                self._ready.extend(waiting)
             node = node.next
 
-    def _get_concurrent(self, starting_state, insert_sequence):
+    def _get_concurrent(self, starting_state, insert_sequence, site_id=None):
         """
         Gets all operations in the insertion sequence which happened after the given starting state
         :param pyote.utils.State starting_state: The state to use as a reference
         :param  insert_sequence: The sequence of events to look for events within
         :type insert_sequence: pyote.utils.InsertOperationNode
+        :param int site_id: The site that the remote sequence came from.  If given, and `insert_sequence` is the
+                            history, the result is built from the last result for that site where possible, and
+                            remembered for the next sequence from that site.
         :rtype: pyote.utils.InsertOperationNode
         """
-        if not starting_state:
-            return insert_sequence
-        local_ref = -1
-        # Look through all operations in our history
-        node = self._inserts
-        while node:
-            operation = node.value
-            # If the operation matches the starting state
-            if operation.state.site_id == starting_state.site_id and \
-                    operation.state.remote_time == starting_state.remote_time:
-                # Then record the corresponding local time
-                local_ref = operation.state.local_time
-                break
-            node = node.next
-
-        # If we didn't find a matching operation in the inserts, check in the deletes
-        if local_ref == -1:
-            node = self._deletes
-            while node:
-                operation = node.value
-                # If the operation matches the starting state
-                if operation.state.site_id == starting_state.site_id and \
-                        operation.state.remote_time == starting_state.remote_time:
-                    # Then record the corresponding local time
-                    local_ref = operation.state.local_time
-                    break
-                node = node.next
-
-        # If we didn't find a matching operation, then we can't yet apply the sequence that relies on the starting state
-        if local_ref == -1:
-            raise OTException()
+        # Without a starting state, every operation is concurrent.  The operations are still gathered into a separate
+        # sequence, because merging relinks the nodes of the history.
+        local_ref = None
+        if starting_state:
+            local_ref = self._lookup_local_time(starting_state)
+
+            # If we didn't find a matching operation, then we can't yet apply the sequence that relies on the starting
+            # state
+            if local_ref is None:
+                raise OTException("No operation matches the starting state {}".format(starting_state))
+
+        cache = site_id is not None and local_ref is not None and insert_sequence is self._inserts
+        operations = self._cached_concurrent(site_id, local_ref) if cache else None
+        if operations is not None:
+            return self._sequence_from_operations(operations)
 
         # Find all the operations in the insertion sequence which happened after local_ref
         concurrents = None
@@ -169,7 +415,7 @@ class Engine(object):
         node = insert_sequence
 
         while node:
-            if node.value.state.local_time > local_ref:
+            if local_ref is None or node.value.state.local_time > local_ref:
                 if concurrents:
                     concurrents.next = OperationNode(node.value)
                     concurrents = concurrents.next
@@ -178,497 +424,229 @@ class Engine(object):
                     concurrent_head = concurrents
             node = node.next
 
+        if cache:
+            self._concurrent_views[site_id] = (local_ref, self._landed_offset + len(self._landed),
+                                               concurrent_head.to_list() if concurrent_head else [])
         return concurrent_head
 
     @staticmethod
-    def _transform_insert_insert(incoming_sequence, existing_sequence):
-        """
-        Performs inclusive transformation on sequence1 with sequence2, meaning that the effects of `existing sequence`
-        are incorporated in `incoming_sequence`
-        :param pyote.utils.InsertOperationNode incoming_sequence: The sequence that will be transformed
-        :param pyote.utils.InsertOperationNode existing_sequence: The sequence with operations that will perform the
-                                                                   transformation
-        :returns: The incoming sequence with the operations in the existing sequence taken into account
-        :rtype: pyote.utils.InsertOperationNode
+    def _sender(sequence):
         """
-        incoming_value_size = 0
-        existing_value_size = 0
-        transformed_sequence = None
-        transformed_head = None
-        incoming_node = incoming_sequence
-        existing_node = existing_sequence
-        # Walk through both sequences, one at a time.
-        while existing_node and incoming_node:
-            # Calculate what the position of the operation would be if it were performed now, rather than
-            # after all other operations before it in the sequence.
-            existing_pos = existing_node.value.position - existing_value_size
-            incoming_pos = incoming_node.value.position - incoming_value_size
-            # If the position of the insert in the existing sequence comes before the insert in the incoming sequence,
-            # then record how much it would move the insertion position forward.
-            if existing_pos < incoming_pos:
-                existing_value_size += existing_node.value.get_increment()
-                existing_node = existing_node.next
-            elif existing_pos == incoming_pos and \
-                existing_node.value.state.site_id < \
-                    incoming_node.value.state.site_id:
-                existing_value_size += existing_node.value.get_increment()
-                existing_node = existing_node.next
-            else:
-                # Otherwise, update the position of the incoming sequence's operation, and record how much it would
-                # move the position forward after it's applied.
-                if transformed_sequence:
-                    transformed_sequence.next = copy(incoming_node)
-                    transformed_sequence = transformed_sequence.next
-                else:
-                    transformed_sequence = copy(incoming_node)
-                    transformed_head = transformed_sequence
-                transformed_sequence.value.position += existing_value_size
-                incoming_value_size += incoming_node.value.get_increment()
-                incoming_node = incoming_node.next
-
-        # Take care of any elements that weren't handled in the above.
-        while incoming_node:
-            if transformed_sequence:
-                transformed_sequence.next = copy(incoming_node)
-                transformed_sequence = transformed_sequence.next
-            else:
-                transformed_sequence = copy(incoming_node)
-                transformed_head = transformed_sequence
-            transformed_sequence.value.position += existing_value_size
-            incoming_node = incoming_node.next
-        return transformed_head
+        Finds the site that generated a remote sequence, from the states of its operations
+        :param pyote.utils.TransactionSequence sequence: The remote sequence
+        :return: The site id, or None if the sequence has no operations
+        :rtype: int
+        """
+        node = sequence.inserts or sequence.deletes
+        if node and node.value.state:
+            return node.value.state.site_id
+        return None
 
-    @staticmethod
-    def _transform_delete_insert(incoming_sequence, existing_sequence):
-        """
-        Performs inclusive transformation on sequence1 with sequence2, meaning that the effects of `existing sequence`
-        are incorporated in `incoming_sequence`
-        :param pyote.utils.DeleteOperationNode incoming_sequence: The sequence that will be transformed
-        :param pyote.utils.InsertOperationNode existing_sequence: The sequence with operations that will perform the
-                                                                   transformation
-        :returns: The incoming sequence with the operations in the existing sequence taken into account
-        :rtype: pyote.utils.DeleteOperationNode
+    def _cached_concurrent(self, site_id, local_ref):
         """
-        incoming_value_size = 0
-        existing_value_size = 0
-        transformed_sequence = None
-        transformed_head = None
-        incoming_node = incoming_sequence
-        existing_node = existing_sequence
-        # Walk through both sequences, one at a time.
-        while existing_node and incoming_node:
-            # Calculate what the position of the operation would be if it were performed now, rather than
-            # after all other operations before it in the sequence.
-            existing_pos = existing_node.value.position - existing_value_size
-            incoming_pos = incoming_node.value.position - incoming_value_size
-            # If the position of the insert in the existing sequence comes before the insert in the incoming sequence,
-            # then record how much it would move the insertion position forward.
-            if existing_pos < incoming_pos:
-                existing_value_size += existing_node.value.get_increment()
-                existing_node = existing_node.next
-            elif existing_pos == incoming_pos and \
-                    existing_node.value.state.site_id < \
-                    incoming_node.value.state.site_id:
-                existing_value_size += existing_node.value.get_increment()
-                existing_node = existing_node.next
-            else:
-                # Otherwise, update the position of the incoming sequence's operation, and record how much it would
-                # move the position forward after it's applied.
-                if transformed_sequence:
-                    transformed_sequence.next = copy(incoming_node)
-                    transformed_sequence = transformed_sequence.next
-                else:
-                    transformed_sequence = copy(incoming_node)
-                    transformed_head = transformed_sequence
-                transformed_sequence.value.position += existing_value_size
-                incoming_value_size += incoming_node.value.get_increment()
-                incoming_node = incoming_node.next
-
-        # Take care of any elements that weren't handled in the above.
-        while incoming_node:
-            if transformed_sequence:
-                transformed_sequence.next = copy(incoming_node)
-                transformed_sequence = transformed_sequence.next
-            else:
-                transformed_sequence = copy(incoming_node)
-                transformed_head = transformed_sequence
-            transformed_sequence.value.position += existing_value_size
-            incoming_node = incoming_node.next
-        return transformed_head
+        Builds the operations that happened after `local_ref` from the last ones that were found for `site_id`, along
+        with the inserts that have been merged into the history since then.  This relies on the positions of the
+        inserts in the history always increasing in effect order, and on the operations in the history being updated
+        in place as other operations are merged in around them.
+        :param int site_id: The site that the remote sequence came from
+        :param int local_ref: The local time of the remote sequence's starting state
+        :return: The operations in effect order, or None if they have to be found by walking the history
+        :rtype: list[pyote.operations.InsertOperation]
+        """
+        view = self._concurrent_views.get(site_id)
+        if not view:
+            return None
+        view_ref, landed_index, operations = view
+        # A sequence from further back than the last one would need operations which were left out of the view
+        if view_ref > local_ref or landed_index < self._landed_offset:
+            return None
+        operations = [operation for operation in operations if operation.state.local_time > local_ref]
+        landed = [operation for operation in self._landed[landed_index - self._landed_offset:]
+                  if operation.state.local_time > local_ref]
+        if landed:
+            operations.extend(landed)
+            operations.sort(key=lambda operation: operation.position)
+            for previous, operation in zip(operations, operations[1:]):
+                if previous.position == operation.position:
+                    # Equal positions (from empty inserts) don't give an effect order
+                    del self._concurrent_views[site_id]
+                    return None
+        self._concurrent_views[site_id] = (local_ref, self._landed_offset + len(self._landed), operations)
+        return operations
 
     @staticmethod
-    def _transform_insert_delete(incoming_sequence, existing_sequence):
-        """
-        Performs inclusive transformation on `incoming_sequence` with `existing_sequence`, meaning that the effects of
-        `existing sequence` are incorporated in `incoming_sequence`
-        :param pyote.utils.InsertOperationNode incoming_sequence: The sequence that will be transformed
-        :param pyote.utils.DeleteOperationNode existing_sequence: The sequence with operations that will perform the
-                                                                   transformation
-        :returns: A copy of `incoming_sequence` with the operations in the existing sequence taken into account
-        :rtype: pyote.utils.InsertOperationNode
-        """
-        incoming_value_size = 0
-        existing_value_size = 0
-        existing_end_point = 0
-        transformed_sequence = None
-        transformed_head = None
-        incoming_node = incoming_sequence
-        existing_node = existing_sequence
-        # Walk through both sequences, one at a time.
-        while existing_node and incoming_node:
-            # Calculate what the position of the operation would be if it were performed now, rather than
-            # after all other operations before it in the sequence.
-            existing_pos = existing_node.value.position - existing_value_size
-            incoming_pos = incoming_node.value.position - incoming_value_size
-            # If the position of the insert in the existing sequence comes before the insert in the incoming sequence,
-            # then record how much it would move the insertion position forward.
-            if existing_pos < incoming_pos:
-                existing_value_size += existing_node.value.get_increment()
-                existing_end_point = existing_pos + existing_node.value.length
-                existing_node = existing_node.next
-            elif existing_pos == incoming_pos and \
-                    existing_node.value.state.site_id < \
-                    incoming_node.value.state.site_id:
-                existing_value_size += existing_node.value.get_increment()
-                existing_end_point = existing_pos + existing_node.value.length
-                existing_node = existing_node.next
-            else:
-                # Otherwise, update the position of the incoming sequence's operation, and record how much it would
-                # move the position forward after it's applied.
-                if transformed_sequence:
-                    transformed_sequence.next = copy(incoming_node)
-                    transformed_sequence = transformed_sequence.next
-                else:
-                    transformed_sequence = copy(incoming_node)
-                    transformed_head = transformed_sequence
-
-                if incoming_pos < existing_end_point:
-                    transformed_sequence.value.position = existing_end_point + incoming_value_size
-                transformed_sequence.value.position += existing_value_size
-                incoming_value_size += incoming_node.value.get_increment()
-                incoming_node = incoming_node.next
-
-        # Take care of any elements that weren't handled in the above.
-        while incoming_node:
-            if transformed_sequence:
-                transformed_sequence.next = copy(incoming_node)
-                transformed_sequence = transformed_sequence.next
+    def _sequence_from_operations(operations):
+        head = None
+        node = None
+        for operation in operations:
+            if node:
+                node.next = OperationNode(operation)
+                node = node.next
             else:
-                transformed_sequence = copy(incoming_node)
-                transformed_head = transformed_sequence
-            transformed_sequence.value.position += existing_value_size
-            incoming_node = incoming_node.next
-        return transformed_head
+                node = head = OperationNode(operation)
+        return head
 
-    @staticmethod
-    def _transform_delete_delete(incoming_sequence, existing_sequence):
-        """
-        Performs inclusive transformation on sequence1 with sequence2, meaning that the effects of `existing sequence`
-        are incorporated in `incoming_sequence`
-        :param pyote.utils.DeleteOperationNode incoming_sequence: The sequence that will be transformed
-        :param pyote.utils.DeleteOperationNode existing_sequence: The sequence with operations that will perform the
-                                                                   transformation
-        :returns: The incoming sequence with the operations in the existing sequence taken into account
-        :rtype: pyote.utils.DeleteOperationNode
+    def _trim_landed(self):
         """
-        existing_value_size = 0
-        incoming_value_size = 0
-        transformed_sequence = None
-        transformed_head = None
-        incoming_node = incoming_sequence
-        existing_node = existing_sequence
-        existing_end_point = 0
-        double_count_amount = 0
-        # Walk through both sequences, one at a time.
-        while existing_node and incoming_node:
-            # Calculate what the position of the operation would be if it were performed now, rather than
-            # after all other operations before it in the sequence.
-            existing_pos = existing_node.value.position + existing_value_size
-            incoming_pos = incoming_node.value.position + incoming_value_size
-            double_delta = 0
-            # If the position of the insert in the existing sequence comes before the insert in the incoming sequence,
-            # then record how much it would move the insertion position forward.
-            if existing_pos < incoming_pos:
-                existing_value_size += existing_node.value.length
-                existing_end_point = existing_pos + existing_node.value.length
-                existing_node = existing_node.next
-            elif existing_pos == incoming_pos and \
-                    existing_node.value.state.site_id < \
-                    incoming_node.value.state.site_id:
-                existing_value_size += existing_node.value.length
-                existing_end_point = existing_pos + existing_node.value.length
-                existing_node = existing_node.next
-            else:
-                # Otherwise, update the position of the incoming sequence's operation, and record how much it would
-                # move the position forward after it's applied.
-                if transformed_sequence:
-                    transformed_sequence.next = copy(incoming_node)
-                    transformed_sequence = transformed_sequence.next
-                else:
-                    transformed_sequence = copy(incoming_node)
-                    transformed_head = transformed_sequence
-                next_node = incoming_node.next
-                # There are three possible situations: either the incoming operation  overlaps with
-                # the existing operation before it, it overlaps with the existing operation after it, or it overlaps
-                # with neither.
-                # We begin by checking if the preceding existing operation overlaps with it
-                if existing_end_point > incoming_pos:
-                    # Now, either this delete is contained completely within the preceding delete, or it isn't.
-                    # In either case, we set the start of the incoming delete to the same point as the position
-                    # of the preceding delete, and set the length to be whatever is left after the preceding delete
-                    # has completed, which could be 0
-                    transformed_sequence.value.position = existing_end_point - incoming_value_size
-                    transformed_sequence.value.length = max(0, incoming_node.value.length -
-                                                            existing_end_point + incoming_pos)
-                    # We now check if the next existing operation overlaps with this one
-                if incoming_pos + incoming_node.value.length > existing_pos:
-                    # If so, then either the incoming operation ends within the existing operation, or it continues past
-                    # the end.
-                    if incoming_pos + incoming_node.value.length < existing_pos + existing_node.value.length:
-                        # If it ends early, then shorten the incoming operation so that it ends at the start of the
-                        # existing operation
-                        transformed_sequence.value.length = existing_pos - incoming_pos
-                    elif incoming_pos != existing_pos + existing_node.value.length:
-                        # Otherwise, shorten the operation AND create a new operation
-                        # which starts after the existing operation
-                        transformed_sequence.value.length -= incoming_pos + incoming_node.value.length - existing_pos
-                        next_node = DeleteOperationNode(DeleteOperation(existing_pos + existing_node.value.length,
-                                                                        incoming_node.value.length + incoming_pos -
-                                                                        existing_pos - existing_node.value.length))
-                        next_node.next = incoming_node.next
-                        next_node.value.state = copy(incoming_node.value.state)
-                        # Because we are inserting a new node in the incoming sequence, we will double count it when
-                        # calculating the amount of deleting that we've done so far, so we subtract the size of the
-                        #  newly created node (it will be re-added on the next iteration)
-                        incoming_value_size -= next_node.value.length
-                        double_delta = -next_node.value.length
-                        next_node.value.position -= incoming_value_size + incoming_node.value.length
-
-                transformed_sequence.value.position -= existing_value_size - double_count_amount
-                double_count_amount += incoming_node.value.length - transformed_sequence.value.length + double_delta
-                incoming_value_size += incoming_node.value.length
-                incoming_node = next_node
-
-        # Take care of any elements that weren't handled in the above.
-        while incoming_node:
-            incoming_pos = incoming_node.value.position + incoming_value_size
-            if transformed_sequence:
-                transformed_sequence.next = copy(incoming_node)
-                transformed_sequence = transformed_sequence.next
-            else:
-                transformed_sequence = copy(incoming_node)
-                transformed_head = transformed_sequence
-            if existing_end_point > incoming_pos:
-                # Now, either this delete is contained completely within the preceding delete, or it isn't.
-                # In either case, we set the start of the incoming delete to the same point as the position
-                # of the preceding delete, and set the length to be whatever is left after the preceding delete
-                # has completed, which could be 0
-                transformed_sequence.value.position = existing_end_point - incoming_value_size
-                transformed_sequence.value.length = max(0, incoming_node.value.length -
-                                                        existing_end_point + incoming_pos)
-
-            transformed_sequence.value.position -= existing_value_size - double_count_amount
-            double_count_amount += incoming_node.value.length - transformed_sequence.value.length
-            incoming_value_size += incoming_node.value.length
-            incoming_node = incoming_node.next
-        return transformed_head
-
-    def _merge_sequence(self, sequence1, sequence2):
-        """
-        Merges two sequence that are in effect order into one sequence that maintains effect order.  All of the
-        operations in sequence1 must already have been incorporated (via :meth:_transform) into the operations in
-        `sequence2`. Essentially this works as a two way merge operation.  As a result, state from the last operation
-        in `sequence2` will be recorded as the most recently applied state.
-
-        :param pyote.utils.OperationNode sequence1: The first sequence to merge
-        :param pyote.utils.OperationNode sequence2: The second sequence to merge.  Must have incorporated the effects of
-                                                    `sequence1` already, and cannot contain any overlaps with the
-                                                    effects of `sequence1` (if they are both delete operations)
-        :return: A new sequence that is effect equivalent to running sequence1 then sequence 2.
-        :rtype OperationNode
-        """
-        value_size = 0
-        merged_sequence = None
-        merged_node = None
-        node1 = sequence1
-        node2 = sequence2
-        while node1 and node2:
-            if node2.value.position - value_size < node1.value.position:
-                if merged_node:
-                    merged_node.next = copy(node2)
-                    merged_node = merged_node.next
-                else:
-                    merged_node = copy(node2)
-                    merged_sequence = merged_node
-                value_size += node2.value.get_increment()
-                self.last_state = node2.value.state
-                node2 = node2.next
-            else:
-                node1.value.position += value_size
-                if merged_node:
-                    merged_node.next = copy(node1)
-                    merged_node = merged_node.next
-                else:
-                    merged_node = copy(node1)
-                    merged_sequence = merged_node
-                node1 = node1.next
-        while node2:
-            if merged_node:
-                merged_node.next = copy(node2)
-                merged_node = merged_node.next
-            else:
-                merged_node = copy(node2)
-                merged_sequence = merged_node
-            value_size += node2.value.get_increment()
-            self.last_state = node2.value.state
-            node2 = node2.next
-        while node1:
-            node1.value.position += value_size
-            if merged_node:
-                merged_node.next = copy(node1)
-                merged_node = merged_node.next
-            else:
-                merged_node = copy(node1)
-                merged_sequence = merged_node
-            node1 = node1.next
+        Keeps the record of inserts merged into the history from growing without bound.  Views which still need the
+        inserts that are dropped will walk the history instead.
+        """
+        if len(self._landed) > self.MAX_LANDED:
+            dropped = len(self._landed) // 2
+            del self._landed[:dropped]
+            self._landed_offset += dropped
 
-        return merged_sequence
+    def _history_replaced(self):
+        """
+        Forgets everything that has been remembered about the history.  This must be called whenever the history is
+        replaced rather than added to.
+        """
+        self._concurrent_views = {}
+        self._landed = []
+        self._landed_offset = 0
+        if self._history_digest is not None:
+            # Nothing is known about how the new history was built, so make sure it matches no other history
+            self._history_digest = os.urandom(16)
+
+    def _advance_digest(self, kind, sequence):
+        """
+        Adds a sequence that has just been added to the history to the history's digest
+        :param bytes kind: Whether the sequence was local or remote
+        :param pyote.utils.TransactionSequence sequence: The sequence
+        """
+        if self._history_digest is not None:
+            import hashlib
+            self._history_digest = hashlib.blake2b(self._history_digest + kind + sequence.fingerprint(),
+                                                   digest_size=16).digest()
 
     @staticmethod
-    def _swap_sequence_delete_insert(sequence2, sequence1):
-        """
-        Swaps the execution order of the two input sequences.  That is, previously sequence2 was executed
-        before sequence1, now it is executed afterwards
-        :param DeleteOperationNode sequence2:
-        :param InsertOperationNode sequence1:
-        :return: A tuple with the two sequences' order of execution swapped.  They are in the order
-                 sequence1', sequence2'
-        :rtype: (InsertOperationNode, DeleteOperationNode):
-
-        """
-        new_sequence1 = None
-        new_sequence2 = None
-        new_node1 = None
-        new_node2 = None
-        node1 = sequence1
-        node2 = sequence2
-        size1 = 0
-        size2 = 0
-        while node1 and node2:
-                if node2.value.position <= node1.value.position - size1:
-                    if new_sequence2:
-                        new_node2.next = copy(node2)
-                        new_node2 = new_node2.next
-                    else:
-                        new_node2 = copy(node2)
-                        new_sequence2 = new_node2
-                    new_node2.value.position += size1
-                    size2 -= node2.value.get_increment()
-                    node2 = node2.next
-                else:
-                    if new_sequence1:
-                        new_node1.next = copy(node1)
-                        new_node1 = new_node1.next
-                    else:
-                        new_node1 = copy(node1)
-                        new_sequence1 = new_node1
-                    new_node1.value.position += size2
-                    size1 += node1.value.get_increment()
-                    node1 = node1.next
-        while node1:
-            if new_sequence1:
-                new_node1.next = copy(node1)
-                new_node1 = new_node1.next
-            else:
-                new_node1 = copy(node1)
-                new_sequence1 = new_node1
-            new_node1.value.position += size2
-            size1 += node1.value.get_increment()
-            node1 = node1.next
-        while node2:
-            if new_sequence2:
-                new_node2.next = copy(node2)
-                new_node2 = new_node2.next
+    def _positions(sequence):
+        positions = []
+        node = sequence
+        while node:
+            positions.append(node.value.position)
+            node = node.next
+        return tuple(positions)
+
+    @staticmethod
+    def _copy_with_positions(sequence, positions):
+        """
+        Copies a sequence, giving its operations new positions.  This rebuilds the result of a transformation which
+        neither splits nor drops operations.
+        :param pyote.utils.OperationNode sequence: The sequence to copy
+        :param tuple[int] positions: The position of each operation in the copy
+        :rtype: pyote.utils.OperationNode
+        """
+        head = None
+        copied = None
+        node = sequence
+        for position in positions:
+            if copied:
+                copied.next = copy(node)
+                copied = copied.next
             else:
-                new_node2 = copy(node2)
-                new_sequence2 = new_node2
-            new_node2.value.position += size1
-            size2 -= node2.value.get_increment()
-            node2 = node2.next
+                copied = head = copy(node)
+            copied.value.position = position
+            node = node.next
+        if copied:
+            copied.next = None
+        return head
 
-        return new_sequence1, new_sequence2
+    @staticmethod
+    def _delete_records(sequence):
+        records = []
+        node = sequence
+        while node:
+            operation = node.value
+            state = operation.state
+            records.append((operation.position, operation.length, state.site_id, state.local_time, state.remote_time))
+            node = node.next
+        return tuple(records)
 
     @staticmethod
-    def _swap_sequence_delete_delete(sequence2, sequence1):
-        """
-        Swaps the execution order of the two input sequences.  That is, previously sequence2 was executed
-        before sequence1, now it is exectuted afterwards
-        :param DeleteOperationNode sequence2:
-        :param DeleteOperationNode sequence1:
-        :return: A tuple with the two sequence's order of execution swapped.  They are in the order
-                 sequence1', sequence2'
-        :rtype: (DeleteOperationNode, DeleteOperationNode):
-
-        """
-        new_sequence1 = None
-        new_sequence2 = None
-        new_node1 = None
-        new_node2 = None
-        node1 = sequence1
-        node2 = sequence2
-        size1 = 0
-        size2 = 0
-        while node1 and node2:
-            if node2.value.position <= node1.value.position + size1:
-                if new_sequence2:
-                    new_node2.next = copy(node2)
-                    new_node2 = new_node2.next
-                else:
-                    new_node2 = copy(node2)
-                    new_sequence2 = new_node2
-                new_node2.value.position -= size1
-                size2 -= node2.value.get_increment()
-                node2 = node2.next
-            else:
-                if new_sequence1:
-                    new_node1.next = copy(node1)
-                    new_node1 = new_node1.next
+    def _deletes_from_records(records):
+        """
+        Rebuilds a sequence of deletes recorded by :meth:`_delete_records`
+        :param tuple records: The position, length and state of each delete
+        :rtype: pyote.utils.DeleteOperationNode
+        """
+        head = None
+        node = None
+        for position, length, site_id, local_time, remote_time in records:
+            new_node = DeleteOperationNode.pool.acquire()
+            if new_node:
+                operation = new_node.value
+                operation.position = position
+                operation.length = length
+                if operation.state:
+                    operation.state.site_id = site_id
+                    operation.state.local_time = local_time
+                    operation.state.remote_time = remote_time
                 else:
-                    new_node1 = copy(node1)
-                    new_sequence1 = new_node1
-                next_node = node1.next
-                if node1.value.position + size1 + node1.value.length > node2.value.position:
-                    new_node1.value.length = node2.value.position - node1.value.position - size1
-                    next_node = DeleteOperationNode(
-                        DeleteOperation(node1.value.position, node1.value.length - new_node1.value.length))
-                    next_node.next = node1.next
-                    next_node.value.state = copy(node1.value.state)
-
-                new_node1.value.position += size2
-                size1 -= new_node1.value.get_increment()
-                node1 = next_node
-        while node1:
-            if new_sequence1:
-                new_node1.next = copy(node1)
-                new_node1 = new_node1.next
+                    operation.state = State(site_id, local_time, remote_time)
             else:
-                new_node1 = copy(node1)
-                new_sequence1 = new_node1
-            new_node1.value.position += size2
-            size1 -= node1.value.get_increment()
-            node1 = node1.next
-        while node2:
-            if new_sequence2:
-                new_node2.next = copy(node2)
-                new_node2 = new_node2.next
+                operation = DeleteOperation(position, length)
+                operation.state = State(site_id, local_time, remote_time)
+                new_node = DeleteOperationNode(operation)
+            if node:
+                node.next = new_node
+                node = new_node
             else:
-                new_node2 = copy(node2)
-                new_sequence2 = new_node2
-            new_node2.value.position += size1
-            size2 -= node2.value.get_increment()
-            node2 = node2.next
+                node = head = new_node
+        return head
 
-        return new_sequence1, new_sequence2
+    def _lookup_local_time(self, state):
+        """
+        Finds the local time of the operation in the history that `state` refers to
+        :param pyote.utils.State state: The state of the operation to look for
+        :return: The local time of the matching operation, or None if no operation in the history matches
+        :rtype: int
+        """
+        return self._state_index.get((state.site_id, state.remote_time))
+
+    def _index_history(self):
+        """
+        Adds the states of every operation in the history to the state index, for histories that were assigned
+        directly rather than built through :meth:`_assign_timestamps`.  States that are already indexed keep their
+        local times, since the history may have been compacted since they were indexed.
+        """
+        index = self._state_index
+        for sequence in (self._inserts, self._deletes):
+            node = sequence
+            while node:
+                state = node.value.state
+                index.setdefault((state.site_id, state.remote_time), state.local_time)
+                node = node.next
+
+    # The transformations are implemented in pyote._transforms, which may be compiled
+    _transform_insert_insert = staticmethod(_transforms.transform_insert_insert)
+    _transform_delete_insert = staticmethod(_transforms.transform_delete_insert)
+    _transform_insert_delete = staticmethod(_transforms.transform_insert_delete)
+    _transform_delete_delete = staticmethod(_transforms.transform_delete_delete)
+    _swap_sequence_delete_insert = staticmethod(_transforms.swap_sequence_delete_insert)
+    _swap_sequence_delete_delete = staticmethod(_transforms.swap_sequence_delete_delete)
+
+    def _merge_sequence(self, sequence1, sequence2, landed=None, prune=False):
+        """
+        Merges two sequences that are in effect order into one sequence that maintains effect order, as in
+        :func:`pyote._transforms.merge_sequence`.  The state from the last operation in `sequence2` is recorded as the
+        most recently applied state.
+        :param pyote.utils.OperationNode sequence1: The first sequence to merge, whose nodes are relinked into the
+                                                    merged sequence
+        :param pyote.utils.OperationNode sequence2: The second sequence to merge, which is copied
+        :param list landed: If given, the operations from `sequence2` are appended to it, as they appear in the merged
+                            sequence
+        :param bool prune: Whether to leave deletes with a length of zero out of the merged sequence.  They are
+                           counted in :attr:`pruned_deletes`.
+        :return: A new sequence that is effect equivalent to running sequence1 then sequence 2.
+        :rtype: pyote.utils.OperationNode
+        """
+        merged_sequence, last_state, pruned = _transforms.merge_sequence(sequence1, sequence2, landed, prune)
+        self.pruned_deletes += pruned
+        # Keep a copy of the state, as the operations in `sequence2` may be reused once they have been merged
+        if last_state:
+            self.last_state = last_state.__copy__()
+        return merged_sequence
 
     def __repr__(self):
         return "engine.inserts: {}\nengine.deletes: {}".format(self._print_nodes(self._inserts),
@@ -0,0 +1,383 @@
+"""
+Packed persistence for the history of an engine, in a column oriented layout.
+
+The engine's working history is a pair of linked lists, in which every operation is three Python objects (a node, an
+operation and a state), and every inserted value is a separate string.  When a history is packed, the fields that the
+transformation functions read (positions, lengths and states) are stored in typed arrays, one array per field, and
+the inserted text is appended to a single UTF-8 buffer and addressed by offset.  A packed history takes a small,
+fixed number of bytes for each operation on top of the text itself, and can be scanned a column at a time without
+touching the text.
+
+Packing is meant for histories which aren't being edited, such as documents which have been idle for a while or which
+are about to be written to disk.  A packed history is only a way of storing a history: the engine's transformations
+still walk the linked lists, and never read the columns, so :meth:`ColumnarHistory.restore` has to turn a packed
+history back into linked lists before any sequence can be integrated into it.
+
+A packed history can be saved to a file with :meth:`ColumnarHistory.save`, and opened again with
+:meth:`MappedHistory.open`, which maps the file into memory rather than reading it.  The columns of a mapped history
+are views onto the file, so opening a history takes the same time no matter how large it is, and the operating system
+only pages in the parts of the history that are read.  Restoring a mapped history into an engine reads all of it, and
+builds the whole history on the heap, just as restoring any other packed history does.
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.utils import InsertOperationNode, DeleteOperationNode, State, MemoryUsage
+
+#: The array type code used for every column
+COLUMN_TYPE = 'q'
+
+# The header of a saved history: a magic number, the format version, whether the columns are little endian, the site
+# id and time stamp, whether there is a last state and the last state itself, the number of inserts, the number of
+# deletes and the size of the text.  It is padded so that the columns which follow it are aligned.
+_HEADER = struct.Struct('<8s11q')
+_HEADER_SIZE = 96
+_MAGIC = b'PYOTEHST'
+_VERSION = 1
+
+
+class OperationColumns(object):
+    #: The names of the columns that every kind of operation has
+    COLUMNS = ('position', 'site_id', 'local_time', 'remote_time')
+    #: The class of node that :meth:`to_sequence` builds
+    node_class = None
+
+    def __init__(self):
+        """
+        The operations of one half of a history, stored a column at a time.  Each subclass holds one kind of
+        operation, and creates the operation at an index, along with its state, with its `operation` method.  The
+        engine never reads the columns; they are only read to restore or inspect a packed history.
+        """
+        for name in self.COLUMNS:
+            setattr(self, name, array(COLUMN_TYPE))
+
+    def __len__(self):
+        return len(self.position)
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes taken up by the columns
+        :rtype: int
+        """
+        return sum(len(column) * column.itemsize for column in self.columns())
+
+    def columns(self):
+        """
+        Gets every column, in the order given by :attr:`COLUMNS`
+        :rtype: list[array.array]
+        """
+        return [getattr(self, name) for name in self.COLUMNS]
+
+    def append(self, operation):
+        """
+        Adds an operation to the end of the columns.  The operation must have a state.
+        :param pyote.operations.Operation operation: The operation to add
+        """
+        state = operation.state
+        self.position.append(operation.position)
+        self.site_id.append(state.site_id)
+        self.local_time.append(state.local_time)
+        self.remote_time.append(state.remote_time)
+
+    def extend(self, sequence):
+        """
+        Adds every operation in a linked list to the end of the columns
+        :param pyote.utils.OperationNode sequence: The operations to add
+        """
+        node = sequence
+        while node:
+            self.append(node.value)
+            node = node.next
+
+    @classmethod
+    def from_sequence(cls, sequence):
+        """
+        Packs a linked list of operations
+        :param pyote.utils.OperationNode sequence: The operations to pack
+        :rtype: OperationColumns
+        """
+        columns = cls()
+        columns.extend(sequence)
+        return columns
+
+    def state(self, index):
+        """
+        Creates the state of the operation at `index`
+        :param int index: The index of the operation
+        :rtype: pyote.utils.State
+        """
+        return State(self.site_id[index], self.local_time[index], self.remote_time[index])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Operation index out of range")
+        return self.operation(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.operation(index)
+
+    def to_sequence(self):
+        """
+        Unpacks the columns into a linked list of new operations
+        :rtype: pyote.utils.OperationNode
+        """
+        head = None
+        node = None
+        for operation in self:
+            if node:
+                node.next = self.node_class(operation)
+                node = node.next
+            else:
+                node = head = self.node_class(operation)
+        return head
+
+    def concurrent_indices(self, local_time):
+        """
+        Finds the operations that happened after the given local time, which are the ones that a remote sequence
+        generated at that time will not have seen.  Only the local time column is read.
+        :param int local_time: The local time of the remote sequence's starting state
+        :return: The indices of the operations, in effect order
+        :rtype: list[int]
+        """
+        return [index for index, time_stamp in enumerate(self.local_time) if time_stamp > local_time]
+
+
+class InsertColumns(OperationColumns):
+    COLUMNS = OperationColumns.COLUMNS + ('text_offset', 'text_bytes', 'text_length')
+    node_class = InsertOperationNode
+
+    def __init__(self):
+        """
+        Insert operations stored a column at a time.  The inserted values are encoded as UTF-8 and appended to a
+        single text buffer, and each operation records the offset and size of its value within the buffer, along with
+        the length of the value in characters, which is how far the insert moves the operations after it.
+        """
+        OperationColumns.__init__(self)
+        #: The inserted values, one after the other
+        self.text = bytearray()
+        """:type: bytearray"""
+
+    @property
+    def nbytes(self):
+        return OperationColumns.nbytes.fget(self) + len(self.text)
+
+    def append(self, operation):
+        OperationColumns.append(self, operation)
+        encoded = operation.value.encode('utf-8')
+        self.text_offset.append(len(self.text))
+        self.text_bytes.append(len(encoded))
+        self.text_length.append(len(operation.value))
+        self.text += encoded
+
+    def value(self, index):
+        """
+        Decodes the value inserted by the operation at `index`
+        :param int index: The index of the operation
+        :rtype: str
+        """
+        offset = self.text_offset[index]
+        return str(self.text[offset:offset + self.text_bytes[index]], 'utf-8')
+
+    def get_increment(self, index):
+        """
+        Gets the amount that the operation at `index` moves the operations that come after it, without decoding its
+        value
+        :param int index: The index of the operation
+        :rtype: int
+        """
+        return self.text_length[index]
+
+    def operation(self, index):
+        operation = InsertOperation(self.position[index], self.value(index))
+        operation.state = self.state(index)
+        return operation
+
+
+class DeleteColumns(OperationColumns):
+    COLUMNS = OperationColumns.COLUMNS + ('length',)
+    node_class = DeleteOperationNode
+
+    def append(self, operation):
+        OperationColumns.append(self, operation)
+        self.length.append(operation.length)
+
+    def get_increment(self, index):
+        """
+        Gets the amount that the operation at `index` moves the operations that come after it
+        :param int index: The index of the operation
+        :rtype: int
+        """
+        return -self.length[index]
+
+    def operation(self, index):
+        operation = DeleteOperation(self.position[index], self.length[index])
+        operation.state = self.state(index)
+        return operation
+
+
+class ColumnarHistory(object):
+    def __init__(self, site_id, time_stamp, last_state, inserts=None, deletes=None):
+        """
+        A packed copy of everything an engine needs to carry on from where it left off
+        :param int site_id: The id of the site the history belongs to
+        :param int time_stamp: The local time of the most recent operation in the history
+        :param pyote.utils.State last_state: The state of the most recently applied operation
+        :param InsertColumns inserts: The insert history
+        :param DeleteColumns deletes: The delete history
+        """
+        self.site_id = site_id
+        self.time_stamp = time_stamp
+        self.last_state = last_state
+        self.inserts = inserts if inserts is not None else InsertColumns()
+        """:type: InsertColumns"""
+        self.deletes = deletes if deletes is not None else DeleteColumns()
+        """:type: DeleteColumns"""
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes taken up by the columns and the text buffer
+        :rtype: int
+        """
+        return self.inserts.nbytes + self.deletes.nbytes
+
+    @classmethod
+    def from_engine(cls, engine):
+        """
+        Packs the history of an engine.  The engine itself isn't changed.
+        :param pyote.engine.Engine engine: The engine whose history should be packed
+        :rtype: ColumnarHistory
+        """
+        inserts = InsertColumns.from_sequence(engine._inserts)
+        deletes = DeleteColumns.from_sequence(engine._deletes)
+        if engine.pruned_deletes:
+            # The states of the deletes that were left out of the history are only in the state index.  They are
+            # packed as deletes with a length of zero after the rest, so that a restored engine can still find them.
+            packed = set(zip(inserts.site_id, inserts.remote_time)) | set(zip(deletes.site_id, deletes.remote_time))
+            position = deletes.position[-1] if len(deletes) else 0
+            pruned = sorted((local_time, key) for key, local_time in engine._state_index.items() if key not in packed)
+            for local_time, (site_id, remote_time) in pruned:
+                operation = DeleteOperation(position, 0)
+                operation.state = State(site_id, local_time, remote_time)
+                deletes.append(operation)
+        return cls(engine.site_id, engine._time_stamp, engine.last_state.__copy__() if engine.last_state else None,
+                   inserts, deletes)
+
+    def restore(self, engine):
+        """
+        Unpacks this history into an engine, replacing the engine's history
+        :param pyote.engine.Engine engine: The engine to restore the history into.  Its site id must match the site id
+                                           of the history.
+        :return: The engine
+        :rtype: pyote.engine.Engine
+        """
+        if engine.site_id != self.site_id:
+            raise ValueError("The history belongs to site {}, not site {}".format(self.site_id, engine.site_id))
+        engine._inserts = self.inserts.to_sequence()
+        engine._deletes = self.deletes.to_sequence()
+        engine._time_stamp = self.time_stamp
+        engine.last_state = self.last_state.__copy__() if self.last_state else None
+        engine._state_index = {}
+        for columns in (self.inserts, self.deletes):
+            engine._state_index.update(zip(zip(columns.site_id, columns.remote_time), columns.local_time))
+        engine.memory_usage = MemoryUsage(len(self.inserts), len(self.deletes), sum(self.inserts.text_length))
+        engine._history_replaced()
+        return engine
+
+    def save(self, path):
+        """
+        Writes this history to a file that can be opened with :meth:`MappedHistory.open`.  The file is written under a
+        temporary name and then renamed, so an existing file at `path` is only replaced once the new one is complete.
+        :param str path: The path of the file to write
+        """
+        last_state = self.last_state
+        header = _HEADER.pack(_MAGIC, _VERSION, sys.byteorder == 'little', self.site_id, self.time_stamp,
+                              last_state is not None, last_state.site_id if last_state else 0,
+                              last_state.local_time if last_state else 0, last_state.remote_time if last_state else 0,
+                              len(self.inserts), len(self.deletes), len(self.inserts.text))
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as history_file:
+            history_file.write(header.ljust(_HEADER_SIZE, b'\0'))
+            for column in self.inserts.columns() + self.deletes.columns():
+                history_file.write(column)
+            history_file.write(self.inserts.text)
+            history_file.flush()
+            os.fsync(history_file.fileno())
+        os.replace(temporary_path, path)
+
+
+class MappedHistory(ColumnarHistory):
+    def __init__(self, site_id, time_stamp, last_state, inserts, deletes, history_map):
+        """
+        A packed history whose columns are views onto a memory mapped file.  The columns can be read, and the history
+        can be restored into an engine, but the columns can't be added to.  Use :meth:`open` to create one.  Mapping
+        the file only saves reading it up front: restoring the history reads every operation, so starting an engine
+        from a mapped history still takes time in proportion to the size of the history.
+        :param mmap.mmap history_map: The mapped file
+        """
+        ColumnarHistory.__init__(self, site_id, time_stamp, last_state, inserts, deletes)
+        self._map = history_map
+        self._views = []
+
+    @classmethod
+    def open(cls, path):
+        """
+        Maps a history written by :meth:`ColumnarHistory.save` into memory.  None of the history is read until it is
+        used.
+        :param str path: The path of the file to open
+        :rtype: MappedHistory
+        :raises ValueError: If the file is not a saved history, or was saved on a machine with a different byte order
+        """
+        with open(path, 'rb') as history_file:
+            history_map = mmap.mmap(history_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(history_map) < _HEADER_SIZE:
+            history_map.close()
+            raise ValueError("{} is not a saved history".format(path))
+        (magic, version, little_endian, site_id, time_stamp, has_last_state, last_site_id, last_local_time,
+         last_remote_time, insert_count, delete_count, text_size) = _HEADER.unpack_from(history_map)
+        if magic != _MAGIC or version != _VERSION:
+            history_map.close()
+            raise ValueError("{} is not a saved history".format(path))
+        if bool(little_endian) != (sys.byteorder == 'little'):
+            history_map.close()
+            raise ValueError("{} was saved on a machine with a different byte order".format(path))
+
+        history = cls(site_id, time_stamp,
+                      State(last_site_id, last_local_time, last_remote_time) if has_last_state else None,
+                      InsertColumns.__new__(InsertColumns), DeleteColumns.__new__(DeleteColumns), history_map)
+        offset = _HEADER_SIZE
+        whole = memoryview(history_map)
+        history._views.append(whole)
+        for columns, count in ((history.inserts, insert_count), (history.deletes, delete_count)):
+            for name in columns.COLUMNS:
+                size = count * struct.calcsize(COLUMN_TYPE)
+                view = whole[offset:offset + size].cast(COLUMN_TYPE)
+                history._views.append(view)
+                setattr(columns, name, view)
+                offset += size
+        history.inserts.text = whole[offset:offset + text_size]
+        history._views.append(history.inserts.text)
+        return history
+
+    def close(self):
+        """
+        Unmaps the file.  Neither the history nor any of its columns can be used afterwards.
+        """
+        for view in reversed(self._views):
+            view.release()
+        del self._views[:]
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
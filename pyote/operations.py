@@ -1,7 +1,6 @@
-import json
-
-
 class Operation(object):
+    __slots__ = ['state', 'position']
+
     def __init__(self, position):
         """
         Creates a new operation that is based on the given state
@@ -24,7 +23,27 @@ class Operation(object):
         self.state = state['state']
         self.position = state['position']
 
+    def __copy__(self):
+        new_operation = Operation(self.position)
+        if self.state:
+            new_operation.state = self.state.__copy__()
+        return new_operation
+
+    def copy_from(self, other):
+        """
+        Overwrites this operation with the values from `other`, reusing this operation's state object if it has one
+        :param Operation other: The operation to copy
+        """
+        self.position = other.position
+        if not other.state:
+            self.state = None
+        elif self.state:
+            self.state.copy_from(other.state)
+        else:
+            self.state = other.state.__copy__()
+
     def __repr__(self):
+        import json
         return json.dumps(self, default=lambda o: o.__getstate__())
 
     def __eq__(self, other):
@@ -41,7 +60,7 @@ class InsertOperation(Operation):
     """
     Inserts a value into the buffer at the specified position
     """
-    __slots__ = ['state', 'position', 'value']
+    __slots__ = ['value']
 
     def __init__(self, position, value):
         Operation.__init__(self, position)
@@ -58,6 +77,16 @@ class InsertOperation(Operation):
         Operation.__setstate__(self, state)
         self.value = state['value']
 
+    def __copy__(self):
+        new_operation = InsertOperation(self.position, self.value)
+        if self.state:
+            new_operation.state = self.state.__copy__()
+        return new_operation
+
+    def copy_from(self, other):
+        Operation.copy_from(self, other)
+        self.value = other.value
+
     def get_increment(self):
         """
         Gets the amount that this operation will adjust the position of operations that come after it
@@ -72,7 +101,7 @@ class DeleteOperation(Operation):
     """
     Deletes some amount of values from the buffer at the specified position
     """
-    __slots__ = ['state', 'position', 'length']
+    __slots__ = ['length']
 
     def __init__(self, position, length):
         Operation.__init__(self, position)
@@ -89,6 +118,16 @@ class DeleteOperation(Operation):
         Operation.__setstate__(self, state)
         self.length = state['length']
 
+    def __copy__(self):
+        new_operation = DeleteOperation(self.position, self.length)
+        if self.state:
+            new_operation.state = self.state.__copy__()
+        return new_operation
+
+    def copy_from(self, other):
+        Operation.copy_from(self, other)
+        self.length = other.length
+
     def get_increment(self):
         """
         Gets the amount that this operation will adjust the position of operations that come after it
@@ -97,3 +136,151 @@ class DeleteOperation(Operation):
 
     def __repr__(self):
         return "{{'position': {}, 'length': {}}}".format(self.position, self.length)
+
+
+class ReplaceOperation(Operation):
+    """
+    Replaces some amount of values in the buffer at the specified position with a new value.  The history only holds
+    inserts and deletes, so a replace is turned into those by
+    :meth:`pyote.utils.TransactionSequence.from_operations`, which only keeps the part of the value that changes.  The
+    engine has no transformations of its own for replaces or moves, so an edit that another site makes inside a
+    replaced range at the same time is only ever transformed against the inserts and deletes that the replace was turned
+    into, not against the replace as a whole.
+    """
+    __slots__ = ['length', 'value']
+
+    def __init__(self, position, length, value):
+        Operation.__init__(self, position)
+        self.length = length
+        self.value = value
+
+    def __getstate__(self):
+        sstate = Operation.__getstate__(self)
+        sstate.update({
+            'length': self.length,
+            'value': self.value
+        })
+        return sstate
+
+    def __setstate__(self, state):
+        Operation.__setstate__(self, state)
+        self.length = state['length']
+        self.value = state['value']
+
+    def __copy__(self):
+        new_operation = ReplaceOperation(self.position, self.length, self.value)
+        if self.state:
+            new_operation.state = self.state.__copy__()
+        return new_operation
+
+    def copy_from(self, other):
+        Operation.copy_from(self, other)
+        self.length = other.length
+        self.value = other.value
+
+    def get_increment(self):
+        """
+        Gets the amount that this operation will adjust the position of operations that come after it
+        """
+        return len(self.value) - self.length
+
+    def __repr__(self):
+        return "{{'position': {}, 'length': {}, 'value': \"{}\"}}".format(self.position, self.length, self.value)
+
+
+class MoveOperation(Operation):
+    """
+    Moves some amount of values in the buffer from the specified position to a destination, which is given as a
+    position in the buffer before the move.  Like :class:`ReplaceOperation`, a move is turned into inserts and deletes
+    by :meth:`pyote.utils.TransactionSequence.from_operations`: the text is inserted at the destination and deleted
+    where it was, so an edit that another site makes inside the moved text at the same time doesn't move with it.
+    """
+    __slots__ = ['length', 'destination']
+
+    def __init__(self, position, length, destination):
+        Operation.__init__(self, position)
+        self.length = length
+        self.destination = destination
+
+    def __getstate__(self):
+        sstate = Operation.__getstate__(self)
+        sstate.update({
+            'length': self.length,
+            'destination': self.destination
+        })
+        return sstate
+
+    def __setstate__(self, state):
+        Operation.__setstate__(self, state)
+        self.length = state['length']
+        self.destination = state['destination']
+
+    def __copy__(self):
+        new_operation = MoveOperation(self.position, self.length, self.destination)
+        if self.state:
+            new_operation.state = self.state.__copy__()
+        return new_operation
+
+    def copy_from(self, other):
+        Operation.copy_from(self, other)
+        self.length = other.length
+        self.destination = other.destination
+
+    def get_increment(self):
+        """
+        Gets the amount that this operation will adjust the position of operations that come after it, which is zero,
+        since a move takes out as much text as it puts back
+        """
+        return 0
+
+    def __repr__(self):
+        return "{{'position': {}, 'length': {}, 'destination': {}}}".format(self.position, self.length,
+                                                                            self.destination)
+
+
+class MultiReplaceOperation(Operation):
+    """
+    Replaces many ranges of the buffer at once, such as every match of a find and replace.  The ranges are kept as
+    (position, length, value) triples in order, all located in the buffer before any of them are replaced, and the
+    position of the operation is the position of the first range.  Like :class:`ReplaceOperation`, it is turned into
+    inserts and deletes by :meth:`pyote.utils.TransactionSequence.from_operations`, so the engine never transforms it
+    as one operation.  Ranges that were found in an older version of the buffer can be brought up to date first with
+    :func:`pyote.cursors.transform_replacements`, which drops any range that has been edited since and says where
+    it is now.
+    """
+    __slots__ = ['ranges']
+
+    def __init__(self, ranges):
+        Operation.__init__(self, ranges[0][0] if ranges else 0)
+        self.ranges = ranges
+
+    def __getstate__(self):
+        sstate = Operation.__getstate__(self)
+        sstate.update({
+            'ranges': [list(triple) for triple in self.ranges]
+        })
+        return sstate
+
+    def __setstate__(self, state):
+        Operation.__setstate__(self, state)
+        self.ranges = [tuple(triple) for triple in state['ranges']]
+
+    def __copy__(self):
+        new_operation = MultiReplaceOperation(list(self.ranges))
+        if self.state:
+            new_operation.state = self.state.__copy__()
+        return new_operation
+
+    def copy_from(self, other):
+        Operation.copy_from(self, other)
+        self.ranges = list(other.ranges)
+
+    def get_increment(self):
+        """
+        Gets the amount that this operation will adjust the position of operations that come after it
+        """
+        return sum(len(value) - length for _, length, value in self.ranges)
+
+    def __repr__(self):
+        import json
+        return json.dumps(self.__getstate__(), default=lambda o: o.__getstate__())
@@ -0,0 +1,201 @@
+"""
+Recording slow calls to an engine, so that they can be reproduced and profiled offline.
+
+A :class:`SlowCallRecorder` is attached to an engine, and times every call to
+:meth:`pyote.engine.Engine.integrate_remote` and :meth:`pyote.engine.Engine.process_transaction`, including the calls
+made by :meth:`pyote.engine.Engine.deliver_remote`, along with each of the transformation steps inside them.  The
+history is packed every so often as a checkpoint, and every call made since is kept in its encoded form.  When a call
+takes longer than the threshold, the checkpoint, the calls since and the timings are written to a directory, which
+contains everything needed to rebuild the engine exactly as it was and make the call again.
+
+A recording is replayed under :mod:`cProfile` with::
+
+    python -m pyote.profiling replay RECORDING
+"""
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+
+from pyote.engine import Engine
+from pyote.history import MappedHistory
+from pyote.utils import TransactionSequence
+
+#: The steps of a call which are timed separately
+STEPS = ('_get_concurrent', '_transform_insert_insert', '_transform_insert_delete', '_transform_delete_insert',
+         '_transform_delete_delete', '_swap_sequence_delete_insert', '_swap_sequence_delete_delete',
+         '_assign_timestamps', '_merge_sequence')
+
+#: The arguments of the engine which are written with a recording, so that it is rebuilt with the same settings.  The
+#: callback, cache and stats can't be written, so the rebuilt engine doesn't have them.
+CONFIG = ('max_pending', 'soft_limit', 'hard_limit', 'prune_deletes')
+
+_HISTORY_FILE = 'history.bin'
+_CALLS_FILE = 'calls.jsonl'
+_RECORD_FILE = 'record.json'
+
+
+class SlowCallRecorder(object):
+    def __init__(self, directory, threshold=0.1, checkpoint_interval=1000, max_recordings=10):
+        """
+        Records calls to an engine which take longer than a threshold.  Nothing is recorded until the recorder is
+        attached to an engine with :meth:`attach`.
+        :param str directory: The directory to write the recordings to, one subdirectory for each
+        :param float threshold: The number of seconds a call may take before it is recorded
+        :param int checkpoint_interval: The number of calls between each time the history is packed.  Recording a call
+                                        means making every call since the last checkpoint again when it is replayed.
+        :param int max_recordings: The number of recordings to write before the recorder stops recording
+        """
+        self.directory = directory
+        self.threshold = threshold
+        self.checkpoint_interval = checkpoint_interval
+        self.max_recordings = max_recordings
+        #: The directories of the recordings that have been written
+        self.recordings = []
+        """:type: list[str]"""
+        self._engine = None
+        # The history at the last checkpoint, and every call made since, as (kind, encoded sequence)
+        self._checkpoint = None
+        self._calls = []
+        # The time taken by each step of the current call
+        self._timings = {}
+
+    def attach(self, engine):
+        """
+        Starts recording the calls made to an engine
+        :param pyote.engine.Engine engine: The engine to record
+        """
+        if self._engine is not None:
+            raise ValueError("The recorder is already attached to an engine")
+        self._engine = engine
+        for step in STEPS:
+            setattr(engine, step, self._timed(step, getattr(engine, step)))
+        engine.integrate_remote = self._recorded('remote', engine.integrate_remote)
+        engine.process_transaction = self._recorded('local', engine.process_transaction)
+        self._take_checkpoint()
+
+    def detach(self):
+        """
+        Stops recording the engine's calls, leaving the engine as it was before it was attached
+        """
+        for name in STEPS + ('integrate_remote', 'process_transaction'):
+            delattr(self._engine, name)
+        self._engine = None
+        self._checkpoint = None
+        self._calls = []
+
+    def _take_checkpoint(self):
+        self._checkpoint = self._engine.pack_history()
+        self._calls = []
+
+    def _timed(self, step, method):
+        timings = self._timings
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                timings[step] = timings.get(step, 0.0) + time.perf_counter() - start
+        return timed
+
+    def _recorded(self, kind, method):
+        def recorded(sequence):
+            if len(self._calls) >= self.checkpoint_interval:
+                self._take_checkpoint()
+            # The sequence is encoded before the call, because processing a local sequence changes its states
+            self._calls.append((kind, sequence.to_json()))
+            self._timings.clear()
+            start = time.perf_counter()
+            result = method(sequence)
+            duration = time.perf_counter() - start
+            if duration > self.threshold and len(self.recordings) < self.max_recordings:
+                self._write(kind, duration)
+            return result
+        return recorded
+
+    def _write(self, kind, duration):
+        """
+        Writes the checkpoint, and the calls made since, including the one that was slow
+        """
+        path = os.path.join(self.directory, 'slow-{}-{}'.format(self._engine.site_id, len(self.recordings)))
+        os.makedirs(path, exist_ok=True)
+        self._checkpoint.save(os.path.join(path, _HISTORY_FILE))
+        with open(os.path.join(path, _CALLS_FILE), 'w', encoding='utf-8') as calls_file:
+            for call_kind, encoded in self._calls:
+                calls_file.write('{{"kind":"{}","sequence":{}}}\n'.format(call_kind, encoded))
+        steps = dict(self._timings)
+        steps['other'] = duration - sum(steps.values())
+        with open(os.path.join(path, _RECORD_FILE), 'w', encoding='utf-8') as record_file:
+            json.dump({'site_id': self._engine.site_id, 'kind': kind, 'duration': duration, 'steps': steps,
+                       'calls': len(self._calls), 'config': {name: getattr(self._engine, name) for name in CONFIG}},
+                      record_file, indent=2, sort_keys=True)
+        self.recordings.append(path)
+
+
+def load_recording(path):
+    """
+    Rebuilds the engine from a recording, with the settings in :data:`CONFIG` that it was recorded with, and makes
+    every call before the slow one
+    :param str path: The directory of the recording
+    :return: The engine, the kind of the slow call (``"local"`` or ``"remote"``), and the sequence passed to it
+    :rtype: (pyote.engine.Engine, str, pyote.utils.TransactionSequence)
+    """
+    with open(os.path.join(path, _RECORD_FILE), encoding='utf-8') as record_file:
+        config = json.load(record_file).get('config', {})
+    with MappedHistory.open(os.path.join(path, _HISTORY_FILE)) as history:
+        engine = Engine.from_history(history, **config)
+    with open(os.path.join(path, _CALLS_FILE), encoding='utf-8') as calls_file:
+        calls = [json.loads(line) for line in calls_file]
+    for call in calls[:-1]:
+        _call(engine, call['kind'], TransactionSequence.from_message(call['sequence']))
+    return engine, calls[-1]['kind'], TransactionSequence.from_message(calls[-1]['sequence'])
+
+
+def _call(engine, kind, sequence):
+    if kind == 'local':
+        return engine.process_transaction(sequence)
+    return engine.integrate_remote(sequence)
+
+
+def replay(path, sort='cumulative', limit=30, stream=None):
+    """
+    Makes the slow call from a recording again under :mod:`cProfile`, and prints the profile
+    :param str path: The directory of the recording
+    :param str sort: The column to sort the profile by
+    :param int limit: The number of functions to print
+    :param stream: Where to print the profile, which is standard output by default
+    :return: The profile
+    :rtype: pstats.Stats
+    """
+    engine, kind, sequence = load_recording(path)
+    profile = cProfile.Profile()
+    profile.runcall(_call, engine, kind, sequence)
+    stats = pstats.Stats(profile, stream=stream or sys.stdout)
+    stats.sort_stats(sort).print_stats(limit)
+    return stats
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Replays calls recorded by a SlowCallRecorder")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    replay_parser = subparsers.add_parser('replay', help="Makes a recorded call again under cProfile")
+    replay_parser.add_argument('recording', help="The directory of the recording")
+    replay_parser.add_argument('--sort', default='cumulative')
+    replay_parser.add_argument('--limit', type=int, default=30)
+    options = parser.parse_args(args)
+    with open(os.path.join(options.recording, _RECORD_FILE), encoding='utf-8') as record_file:
+        record = json.load(record_file)
+    print("Recorded {} call at site {} took {:.1f} ms".format(record['kind'], record['site_id'],
+                                                              record['duration'] * 1000))
+    for step, seconds in sorted(record['steps'].items(), key=lambda item: -item[1]):
+        print("  {:30} {:8.1f} ms".format(step, seconds * 1000))
+    replay(options.recording, options.sort, options.limit)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
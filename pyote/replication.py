@@ -0,0 +1,224 @@
+"""
+Keeping several engines, such as redundant collaboration servers, up to date with each other.
+
+Each :class:`Replica` remembers every sequence that has been delivered to its engine, in the encoded form that was
+sent between sites.  Every operation's state records the site that made it, and the time at that site.  A site's
+sequences are each made after the one before, so the engine integrates them in the order they were made, and the
+sequences a replica has integrated from each site are summarized by the latest time it has integrated from that site.
+Two replicas exchange these summaries, and each then ships the other only the sequences that are missing from its
+summary, as a log in the encoding from :mod:`pyote.streaming`.  The receiver integrates the whole log in one batch,
+holding back any sequence that arrives before the sequence it was made after.
+
+A sequence can still arrive out of order, such as when a client sends it straight to a replica, so a replica remembers
+the times of every sequence it has seen from each site, rather than just the latest, to tell which ones are new.  A
+sequence that is being held back isn't included in the summary, so it is shipped again until it can be integrated.
+"""
+import bisect
+import json
+
+from pyote.streaming import LogDecoder, integrate_log
+
+
+class Replica(object):
+    def __init__(self, engine):
+        """
+        Keeps track of the sequences integrated into `engine`, so that they can be shipped to other replicas.  Every
+        sequence must go through the replica, rather than straight to the engine.
+        :param pyote.engine.Engine engine: The engine for this replica
+        """
+        #: The engine that the sequences are integrated into
+        self.engine = engine
+        """:type: pyote.engine.Engine"""
+        #: The latest time integrated from each site
+        self._versions = {}
+        """:type: dict[int, int]"""
+        #: The sequences seen from each site, as sorted lists of times and the positions of the sequences in the log
+        self._site_times = {}
+        """:type: dict[int, list[int]]"""
+        self._site_positions = {}
+        """:type: dict[int, list[int]]"""
+        #: The times seen from each site
+        self._seen = {}
+        """:type: dict[int, set[int]]"""
+        #: The sites with sequences that have been seen, but not integrated yet
+        self._waiting = set()
+        """:type: set[int]"""
+        #: Every encoded sequence, in the order it was seen
+        self._log = []
+        """:type: list[str]"""
+
+    def summary(self):
+        """
+        Summarizes the sequences this replica has integrated
+        :return: The latest time integrated from each site
+        :rtype: dict[int, int]
+        """
+        return dict(self._versions)
+
+    def process_transaction(self, outgoing_sequence):
+        """
+        Processes a transaction made at this replica, as in :meth:`pyote.engine.Engine.process_transaction`
+        :param pyote.utils.TransactionSequence outgoing_sequence: The sequence of operations to process
+        :return: A transaction sequence appropriate to send to other peers
+        :rtype: pyote.utils.TransactionSequence
+        """
+        sequence = self.engine.process_transaction(outgoing_sequence)
+        self._record(sequence)
+        self._advance()
+        return sequence
+
+    def deliver_remote(self, remote_sequence):
+        """
+        Delivers a sequence sent straight to this replica, such as one from a client, as in
+        :meth:`pyote.engine.Engine.deliver_remote`.  Sequences which have already been seen are ignored.
+        :param pyote.utils.TransactionSequence remote_sequence: The sequence to deliver
+        :return: The transaction sequences that can now be applied to the local data, in the order they must be applied
+        :rtype: list[pyote.utils.TransactionSequence]
+        """
+        return self._integrate([remote_sequence])
+
+    def missing(self, summary):
+        """
+        Encodes the sequences that are missing from another replica
+        :param dict[int, int] summary: The other replica's :meth:`summary`
+        :return: The missing sequences, as a log in the order they were seen here
+        :rtype: str
+        """
+        positions = []
+        for site_id, times in self._site_times.items():
+            start = bisect.bisect_right(times, summary.get(site_id, 0))
+            positions.extend(self._site_positions[site_id][start:])
+        positions.sort()
+        return ''.join(self._log[position] + '\n' for position in positions)
+
+    def receive(self, data):
+        """
+        Integrates the sequences shipped from another replica by :meth:`missing`, in one batch
+        :param data: The encoded sequences
+        :type data: str | bytes
+        :return: The transaction sequences that can now be applied to the local data, in the order they must be applied
+        :rtype: list[pyote.utils.TransactionSequence]
+        """
+        decoder = LogDecoder()
+        sequences = decoder.feed(data)
+        sequences.extend(decoder.close())
+        return self._integrate(sequences)
+
+    def _integrate(self, sequences):
+        applied = list(integrate_log(self.engine, self._unseen(sequences)))
+        self._advance()
+        return applied
+
+    def _unseen(self, sequences):
+        """
+        Records each sequence that hasn't been seen yet, and yields it to be integrated
+        """
+        for sequence in sequences:
+            if self._record(sequence):
+                yield sequence
+
+    def _record(self, sequence):
+        """
+        Remembers a sequence, unless it has already been seen
+        :return: Whether the sequence is new
+        :rtype: bool
+        """
+        version = _version(sequence)
+        if not version:
+            return False
+        site_id, time = version
+        seen = self._seen.setdefault(site_id, set())
+        if time in seen:
+            return False
+        seen.add(time)
+        times = self._site_times.setdefault(site_id, [])
+        index = bisect.bisect(times, time)
+        times.insert(index, time)
+        self._site_positions.setdefault(site_id, []).insert(index, len(self._log))
+        self._log.append(sequence.to_json())
+        self._waiting.add(site_id)
+        return True
+
+    def _advance(self):
+        """
+        Moves the latest time integrated from each site past the sequences the engine has integrated since
+        """
+        for site_id in list(self._waiting):
+            times = self._site_times[site_id]
+            index = bisect.bisect_right(times, self._versions.get(site_id, 0))
+            while index < len(times) and (site_id, times[index]) in self.engine._state_index:
+                self._versions[site_id] = times[index]
+                index += 1
+            if index == len(times):
+                self._waiting.discard(site_id)
+
+
+def _version(sequence):
+    """
+    Finds the site that made a sequence, and the latest time of its operations at that site
+    :rtype: (int, int)
+    """
+    version = None
+    for node in (sequence.inserts, sequence.deletes):
+        while node:
+            state = node.value.state
+            if state and (not version or state.remote_time > version[1]):
+                version = (state.site_id, state.remote_time)
+            node = node.next
+    return version
+
+
+class LoopbackTransport(object):
+    def __init__(self):
+        """
+        Carries messages between replicas in the same process, as bytes, counting how much is sent
+        """
+        #: The number of messages that have been sent
+        self.messages = 0
+        """:type: int"""
+        #: The total size of the messages that have been sent
+        self.bytes_sent = 0
+        """:type: int"""
+
+    def send(self, data):
+        """
+        Sends a message
+        :param bytes data: The message
+        :return: The message as it is received
+        :rtype: bytes
+        """
+        self.messages += 1
+        self.bytes_sent += len(data)
+        return bytes(data)
+
+
+def sync(first, second, transport=None):
+    """
+    Brings two replicas up to date with each other.  The first replica sends its summary, the second replies with its
+    own summary and the sequences the first is missing, and the first finishes by sending the sequences the second is
+    missing.
+    :param Replica first: The replica starting the exchange
+    :param Replica second: The other replica
+    :param transport: Carries the messages between the replicas, with a `send` method like
+                      :meth:`LoopbackTransport.send`.  By default, they are carried by a new :class:`LoopbackTransport`.
+    :return: The sequences to apply to the first replica's data, and the sequences to apply to the second's
+    :rtype: (list[pyote.utils.TransactionSequence], list[pyote.utils.TransactionSequence])
+    """
+    transport = transport or LoopbackTransport()
+    request = json.loads(transport.send(_encode_summary(first.summary())))
+    reply = transport.send(b'%s\n%s' % (_encode_summary(second.summary()),
+                                        second.missing(_decode_summary(request)).encode('utf-8')))
+    summary, _, data = reply.partition(b'\n')
+    applied_first = first.receive(data)
+    applied_second = second.receive(transport.send(first.missing(_decode_summary(json.loads(summary)))
+                                                   .encode('utf-8')))
+    return applied_first, applied_second
+
+
+def _encode_summary(summary):
+    return json.dumps(summary, separators=(',', ':')).encode('utf-8')
+
+
+def _decode_summary(message):
+    # JSON object keys are always strings
+    return {int(site_id): time for site_id, time in message.items()}
@@ -0,0 +1,202 @@
+"""
+A fast path for converting transaction sequences to and from JSON.
+
+The JSON produced here has the same layout as :meth:`pyote.utils.TransactionSequence.__getstate__`, but is written
+straight from the linked lists rather than from intermediate dictionaries.  If `orjson <https://github.com/ijl/orjson>`_
+is installed, it is used to parse incoming messages.
+
+Large inserted values, such as pastes, are the most expensive part of a message to encode, and the same value is
+usually sent many times: once to every peer, and again inside every sequence that it's transformed into.  Their
+encoded forms are kept in a :class:`ContentStore`, so that each value is only encoded once no matter how many messages
+it appears in.
+"""
+import json
+from collections import OrderedDict
+from json.encoder import encode_basestring_ascii
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+_STATE_FORMAT = '{{"site_id":{},"local_time":{},"remote_time":{}}}'
+_INSERT_FORMAT = '{{"state":{},"position":{},"value":{}}}'
+_DELETE_FORMAT = '{{"state":{},"position":{},"length":{}}}'
+_MULTI_REPLACE_FORMAT = '{{"state":{},"position":{},"ranges":[{}]}}'
+_RANGE_FORMAT = '[{},{},{}]'
+# Stands in for the state before the first operation, which can't be None, since None is a state that must be encoded
+_NO_STATE = object()
+
+#: Inserted values at least this long have their encoded form kept in the content store
+LARGE_VALUE = 4096
+
+
+class ContentStore(object):
+    def __init__(self, threshold=LARGE_VALUE, capacity=32 * 1024 * 1024):
+        """
+        Keeps the encoded form of large inserted values, so that a value which appears in many messages is only
+        encoded once.  Values are looked up by equality, so a value decoded from a message will find the encoding of
+        the value it was decoded from.  Looking up the same string object again only compares the object's identity
+        and its cached hash, rather than its contents.  The least recently used encodings are dropped once the store
+        holds more than `capacity` characters.
+        :param int threshold: The shortest value that will be stored
+        :param int capacity: The number of encoded characters to keep
+        """
+        self.threshold = threshold
+        self.capacity = capacity
+        #: The total length of the encoded values in the store
+        self.size = 0
+        """:type: int"""
+        self._encoded = OrderedDict()
+        """:type: OrderedDict[str, str]"""
+
+    def __len__(self):
+        return len(self._encoded)
+
+    def encode(self, value):
+        """
+        Encodes an inserted value as JSON, reusing the stored encoding if there is one
+        :param value: The value to encode
+        :rtype: str
+        """
+        if not isinstance(value, str) or len(value) < self.threshold:
+            return _encode_value(value)
+        encoded = self._encoded.get(value)
+        if encoded is not None:
+            self._encoded.move_to_end(value)
+            return encoded
+        encoded = _encode_value(value)
+        if len(encoded) <= self.capacity:
+            self._encoded[value] = encoded
+            self.size += len(encoded)
+            while self.size > self.capacity:
+                self.size -= len(self._encoded.popitem(last=False)[1])
+        return encoded
+
+    def clear(self):
+        """
+        Removes all the values from the store
+        """
+        self._encoded.clear()
+        self.size = 0
+
+
+#: The store used when encoding sequences
+content_store = ContentStore()
+
+
+def loads(text):
+    """
+    Parses JSON text, using orjson if it is available
+    :param text: The JSON to parse
+    :type text: str | bytes
+    :rtype: object
+    """
+    if orjson:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def encode_state(state):
+    """
+    Encodes a state as JSON
+    :param pyote.utils.State state: The state to encode, or None
+    :rtype: str
+    """
+    if not state:
+        return 'null'
+    return _STATE_FORMAT.format(state.site_id, state.local_time, state.remote_time)
+
+
+def _encode_value(value):
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    return json.dumps(value)
+
+
+def encode_insert(operation, encoded_state=None):
+    """
+    Encodes a single insert operation as JSON
+    :param pyote.operations.InsertOperation operation: The operation to encode
+    :param str encoded_state: The operation's state, if it has already been encoded
+    :rtype: str
+    """
+    if encoded_state is None:
+        encoded_state = encode_state(operation.state)
+    return _INSERT_FORMAT.format(encoded_state, operation.position, content_store.encode(operation.value))
+
+
+def encode_delete(operation, encoded_state=None):
+    """
+    Encodes a single delete operation as JSON
+    :param pyote.operations.DeleteOperation operation: The operation to encode
+    :param str encoded_state: The operation's state, if it has already been encoded
+    :rtype: str
+    """
+    if encoded_state is None:
+        encoded_state = encode_state(operation.state)
+    return _DELETE_FORMAT.format(encoded_state, operation.position, operation.length)
+
+
+def encode_multi_replace(operation, encoded_state=None):
+    """
+    Encodes a multi-range replace as JSON, with each range as a [position, length, value] array.  A replace-all usually
+    uses the same value for every range, so each distinct value is only encoded once.
+    :param pyote.operations.MultiReplaceOperation operation: The operation to encode
+    :param str encoded_state: The operation's state, if it has already been encoded
+    :rtype: str
+    """
+    if encoded_state is None:
+        encoded_state = encode_state(operation.state)
+    encoded_values = {}
+    ranges = []
+    for position, length, value in operation.ranges:
+        if not isinstance(value, str):
+            encoded = _encode_value(value)
+        else:
+            encoded = encoded_values.get(value)
+            if encoded is None:
+                encoded = encoded_values[value] = content_store.encode(value)
+        ranges.append(_RANGE_FORMAT.format(position, length, encoded))
+    return _MULTI_REPLACE_FORMAT.format(encoded_state, operation.position, ','.join(ranges))
+
+
+def encode_sequence(sequence):
+    """
+    Encodes a transaction sequence as JSON
+    :param pyote.utils.TransactionSequence sequence: The sequence to encode
+    :return: The same JSON object that encoding ``sequence.__getstate__()`` would produce
+    :rtype: str
+    """
+    encode_value = content_store.encode
+    parts = ['{"inserts":[']
+    node = sequence.inserts
+    # The state of the previous operation, along with its encoded form, so that runs of operations with the same
+    # state only encode it once
+    state = encoded_state = _NO_STATE
+    while node:
+        operation = node.value
+        if operation.state is not state:
+            state = operation.state
+            encoded_state = encode_state(state)
+        parts.append(_INSERT_FORMAT.format(encoded_state, operation.position, encode_value(operation.value)))
+        parts.append(',')
+        node = node.next
+    if sequence.inserts:
+        parts.pop()
+    parts.append('],"deletes":[')
+    node = sequence.deletes
+    while node:
+        operation = node.value
+        if operation.state is not state:
+            state = operation.state
+            encoded_state = encode_state(state)
+        parts.append(_DELETE_FORMAT.format(encoded_state, operation.position, operation.length))
+        parts.append(',')
+        node = node.next
+    if sequence.deletes:
+        parts.pop()
+    parts.append('],"starting_state":')
+    parts.append(encode_state(sequence.starting_state))
+    parts.append('}')
+    return ''.join(parts)
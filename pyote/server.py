@@ -0,0 +1,210 @@
+"""
+A server which puts every client's transactions into one total order, so that it doesn't need an engine per client.
+
+In a star topology, every transaction goes through the server.  The server gives each transaction it accepts the next
+revision number, and clients say which revision their transactions were made at.  A transaction made at an older
+revision is only transformed past the transactions accepted since, and is then sent to every other client exactly as
+it was accepted, so sending it costs the same for every client.  Each :class:`Client` keeps the transactions that the
+server hasn't accepted yet, and the only work it does for a transaction from the server is to transform it past those.
+The history itself is kept by a single :class:`pyote.engine.Engine`, which receives every accepted transaction in order.
+
+Transactions are transformed as lists of `(start, end, text)` edits, as in :mod:`pyote.edits`.  When two sites insert
+text at the same position, the text from the site with the lower id goes first, as in the engine.
+"""
+from collections import deque
+
+from pyote.edits import edits_from_sequence, add_edit, sequence_from_edits
+from pyote.engine import Engine, OTException
+
+
+class Server(object):
+    #: The number of accepted transactions to keep for transforming transactions made at older revisions
+    MAX_LOG = 4096
+
+    def __init__(self, engine=None):
+        """
+        Creates a server for a single document
+        :param pyote.engine.Engine engine: The engine which keeps the history of the document.  By default, this is a
+                                           new engine with the site id 0, which must not be used by any client.
+        """
+        #: The engine which receives every accepted transaction, in order
+        self.engine = engine if engine is not None else Engine(0)
+        """:type: pyote.engine.Engine"""
+        #: The number of transactions that have been accepted
+        self.revision = 0
+        """:type: int"""
+        #: The site id and edits of the most recently accepted transactions
+        self._log = []
+        """:type: list[(int, list[(int, int, str)])]"""
+        #: The revision of the first transaction in the log
+        self._log_offset = 0
+        """:type: int"""
+
+    def receive(self, site_id, revision, sequence):
+        """
+        Accepts a transaction from a client.  The sender should be told that it has been accepted, with
+        :meth:`Client.server_ack`, and every other client sent the transaction that is returned, with
+        :meth:`Client.server_operation`.
+        :param int site_id: The site id of the client which sent the transaction
+        :param int revision: The revision that the transaction was made at
+        :param pyote.utils.TransactionSequence sequence: The transaction, in effect order
+        :return: The transaction as it applies to the document at the latest revision
+        :rtype: pyote.utils.TransactionSequence
+        :raises OTException: If the revision is newer than the server's, or too old to transform
+        """
+        if revision > self.revision or revision < self._log_offset:
+            raise OTException("Can't accept a transaction made at revision {}, the server is at revision {} and can "
+                              "only transform from revision {}".format(revision, self.revision, self._log_offset))
+        edits = edits_from_sequence(sequence)
+        for other_site, other_edits in self._log[revision - self._log_offset:]:
+            edits = _transform(edits, other_edits, other_site < site_id)
+        self._log.append((site_id, edits))
+        self.revision += 1
+        if len(self._log) > self.MAX_LOG:
+            dropped = len(self._log) // 2
+            del self._log[:dropped]
+            self._log_offset += dropped
+        self.engine.process_transaction(sequence_from_edits(edits))
+        return sequence_from_edits(edits)
+
+    def operations_since(self, revision):
+        """
+        Gets the transactions accepted since a revision, for bringing a client that has been disconnected up to date
+        :param int revision: The revision the client has
+        :return: The site id of each transaction, and the transaction itself, in the order they were accepted
+        :rtype: list[(int, pyote.utils.TransactionSequence)]
+        :raises OTException: If the revision is too old
+        """
+        if revision < self._log_offset:
+            raise OTException("The transactions since revision {} are no longer kept".format(revision))
+        return [(site_id, sequence_from_edits(edits)) for site_id, edits in self._log[revision - self._log_offset:]]
+
+
+class Client(object):
+    def __init__(self, site_id, revision=0):
+        """
+        The state a client keeps for talking to a :class:`Server`.  Only one transaction is sent at a time, and the
+        rest wait until it has been accepted.
+        :param int site_id: An id which uniquely identifies this client
+        :param int revision: The revision of the document that the client starts with
+        """
+        #: The unique id for this client
+        self.site_id = site_id
+        """:type: int"""
+        #: The number of the server's transactions that have been applied here
+        self.revision = revision
+        """:type: int"""
+        #: The edits of the local transactions that haven't been accepted yet.  The first has been sent to the server.
+        self._pending = deque()
+        """:type: collections.deque"""
+
+    @property
+    def pending_count(self):
+        return len(self._pending)
+
+    def local_edit(self, sequence):
+        """
+        Records a transaction that has been applied to the local text
+        :param pyote.utils.TransactionSequence sequence: The transaction, in effect order
+        :return: The revision and transaction to send to the server, or None if they have to wait until the
+                 transaction that has already been sent is accepted
+        :rtype: (int, pyote.utils.TransactionSequence)
+        """
+        self._pending.append(edits_from_sequence(sequence))
+        if len(self._pending) == 1:
+            return self.revision, sequence
+        return None
+
+    def server_ack(self):
+        """
+        Records that the server has accepted the transaction that was sent to it
+        :return: The revision and transaction to send to the server next, or None if there isn't one
+        :rtype: (int, pyote.utils.TransactionSequence)
+        """
+        self._pending.popleft()
+        self.revision += 1
+        if self._pending:
+            return self.revision, sequence_from_edits(self._pending[0])
+        return None
+
+    def server_operation(self, site_id, sequence):
+        """
+        Transforms a transaction accepted by the server past the local transactions that it hasn't accepted yet
+        :param int site_id: The site id of the client which made the transaction
+        :param pyote.utils.TransactionSequence sequence: The transaction, as returned by :meth:`Server.receive`
+        :return: The transaction to apply to the local text
+        :rtype: pyote.utils.TransactionSequence
+        """
+        self.revision += 1
+        if not self._pending:
+            return sequence
+        edits = edits_from_sequence(sequence)
+        for index, pending in enumerate(self._pending):
+            self._pending[index] = _transform(pending, edits, site_id < self.site_id)
+            edits = _transform(edits, pending, self.site_id < site_id)
+        return sequence_from_edits(edits)
+
+
+class _PositionMap(object):
+    def __init__(self, edits):
+        """
+        Finds where positions end up once a list of edits has been applied, for positions in ascending order
+        :param list[(int, int, str)] edits: The edits
+        """
+        self._edits = edits
+        self._index = 0
+        # The amount the edits before the current one have moved the text after them
+        self._shift = 0
+
+    def map(self, position, after_insert):
+        """
+        :param int position: The position before the edits
+        :param bool after_insert: Whether the position goes after text inserted exactly at it
+        :rtype: int
+        """
+        edits = self._edits
+        while self._index < len(edits) and (edits[self._index][1] < position or
+                                            edits[self._index][0] < edits[self._index][1] == position):
+            start, end, text = edits[self._index]
+            self._shift += len(text) - (end - start)
+            self._index += 1
+        if self._index < len(edits):
+            start, end, text = edits[self._index]
+            if start < position < end:
+                # The position was replaced, so it ends up after the text that replaced it
+                return start + self._shift + len(text)
+            if start == position and after_insert:
+                return position + self._shift + len(text)
+        return position + self._shift
+
+
+def _transform(edits, other, other_first):
+    """
+    Moves edits past other edits made to the same text.  Text is deleted if either list deletes it, and the text
+    inserted by one list is never deleted by the other.
+    :param list[(int, int, str)] edits: The edits to move
+    :param list[(int, int, str)] other: The edits that have been applied to the text first
+    :param bool other_first: Whether the other text goes first when both lists insert text at the same position
+    :return: The edits, located in the text as it is after `other`
+    :rtype: list[(int, int, str)]
+    """
+    moved = []
+    positions = _PositionMap(other)
+    index = 0
+    for start, end, text in edits:
+        insert_at = positions.map(start, other_first)
+        add_edit(moved, insert_at, insert_at, text)
+        while index < len(other) and (other[index][1] < start or other[index][0] < other[index][1] == start):
+            index += 1
+        # Delete whatever is left of the range, around the other edits inside it
+        run_start = start
+        overlapping = index
+        while overlapping < len(other) and other[overlapping][0] < end:
+            other_start, other_end, _ = other[overlapping]
+            if other_start > run_start:
+                add_edit(moved, positions.map(run_start, True), positions.map(other_start, False), '')
+            run_start = max(run_start, other_end)
+            overlapping += 1
+        if run_start < end:
+            add_edit(moved, positions.map(run_start, True), positions.map(end, False), '')
+    return moved
@@ -0,0 +1,337 @@
+"""
+Runs several engines in one process, connected by a simulated network, to check that they converge and to measure
+how quickly they integrate each other's changes.
+
+Time in the simulation is measured in ticks.  On every tick, messages which have reached their destination are
+delivered, and then a number of sites make a random local edit, which is broadcast to every other site.  Each message
+is delayed by a random latency, may be delayed further so that later messages overtake it, and is held back for as
+long as a partition separates its sender from its receiver.  Once all the edits have been made, the network is drained
+and the text at every site is compared.  Concurrent edits don't always converge yet, since a sequence only names the
+last operation its sender had seen, which doesn't say whether the sender had seen the receiver's own recent edits.
+
+Run a load test from the root of the repository with::
+
+    python -m pyote.simulation --sites 4 --operations 2000 --reorder 0.2
+"""
+import argparse
+import heapq
+import random
+import time
+
+from pyote.engine import Engine
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode
+
+_ALPHABET = 'abcdefghijklmnopqrstuvwxyz '
+
+
+class Partition(object):
+    def __init__(self, start, end, groups):
+        """
+        A period of time during which the network is split into groups of sites, and messages can only be delivered
+        between sites in the same group.  Messages sent across the partition are delivered once it ends.
+        :param int start: The first tick of the partition
+        :param int end: The tick at which the partition heals
+        :param groups: The sets of site ids which can still reach each other.  Sites which are not in any group are
+                       cut off from every other site.
+        :type groups: list[set[int]]
+        """
+        self.start = start
+        self.end = end
+        self.groups = [frozenset(group) for group in groups]
+
+    def separates(self, sender, receiver, tick):
+        """
+        Determines whether this partition stops a message being delivered at the given tick
+        :param int sender: The site id of the sender
+        :param int receiver: The site id of the receiver
+        :param int tick: The tick at which the message would be delivered
+        :rtype: bool
+        """
+        if not self.start <= tick < self.end:
+            return False
+        return not any(sender in group and receiver in group for group in self.groups)
+
+
+class SimulatedSite(object):
+    def __init__(self, site_id, text=''):
+        """
+        A single peer in the simulation, with its own engine and copy of the text
+        :param int site_id: The id of the site
+        :param str text: The text that every site starts with
+        """
+        self.site_id = site_id
+        self.engine = Engine(site_id)
+        """:type: pyote.engine.Engine"""
+        self.text = text
+        """:type: str"""
+        #: The time taken by each call to :meth:`pyote.engine.Engine.deliver_remote`, in seconds
+        self.integration_times = []
+        """:type: list[float]"""
+        #: The number of ticks between a sequence being sent and it being applied here
+        self.delivery_latencies = []
+        """:type: list[int]"""
+        #: Pairs of (tick, history nodes), recorded every time the history is sampled
+        self.history_sizes = []
+        """:type: list[(int, int)]"""
+
+    def history_size(self):
+        """
+        Gets the number of nodes in this site's history
+        :rtype: int
+        """
+        usage = self.engine.memory_usage
+        return usage.insert_nodes + usage.delete_nodes
+
+
+class SimulationReport(object):
+    def __init__(self, sites, operations, messages, elapsed, ticks):
+        """
+        The results of a simulation run
+        :param list[SimulatedSite] sites: The sites that took part
+        :param int operations: The number of local edits that were made
+        :param int messages: The number of messages that were delivered
+        :param float elapsed: The wall clock time the run took, in seconds
+        :param int ticks: The number of ticks the run took, including draining the network
+        """
+        self.sites = sites
+        self.operations = operations
+        self.messages = messages
+        self.elapsed = elapsed
+        self.ticks = ticks
+        #: Whether every site ended up with the same text
+        self.converged = len(set(site.text for site in sites)) == 1
+        """:type: bool"""
+
+    @property
+    def operations_per_second(self):
+        return self.operations / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def messages_per_second(self):
+        return self.messages / self.elapsed if self.elapsed else 0.0
+
+    def integration_percentiles(self, percentiles=(50, 90, 99)):
+        """
+        Gets percentiles of the time taken to integrate a delivered message, across all sites
+        :param percentiles: The percentiles to calculate
+        :return: The time at each percentile, in milliseconds
+        :rtype: dict[int, float]
+        """
+        times = [t * 1000 for site in self.sites for t in site.integration_times]
+        return _percentiles(times, percentiles)
+
+    def latency_percentiles(self, percentiles=(50, 90, 99)):
+        """
+        Gets percentiles of the number of ticks from a sequence being sent to it being applied, including any time it
+        spent held back waiting for its starting state
+        :param percentiles: The percentiles to calculate
+        :rtype: dict[int, float]
+        """
+        latencies = [latency for site in self.sites for latency in site.delivery_latencies]
+        return _percentiles(latencies, percentiles)
+
+    def summary(self):
+        """
+        Describes the results of the run
+        :rtype: str
+        """
+        lines = [
+            "sites:               {}".format(len(self.sites)),
+            "operations:          {}".format(self.operations),
+            "messages:            {}".format(self.messages),
+            "ticks:               {}".format(self.ticks),
+            "converged:           {}".format(self.converged),
+            "ops/sec:             {:.0f}".format(self.operations_per_second),
+            "messages/sec:        {:.0f}".format(self.messages_per_second),
+            "integration ms:      {}".format(_format_percentiles(self.integration_percentiles())),
+            "latency ticks:       {}".format(_format_percentiles(self.latency_percentiles())),
+        ]
+        for site in self.sites:
+            lines.append("site {} history:      {} nodes, {} characters".format(
+                site.site_id, site.history_sizes[-1][1] if site.history_sizes else 0, len(site.text)))
+        return "\n".join(lines)
+
+
+def _percentiles(values, percentiles):
+    values = sorted(values)
+    if not values:
+        return dict((percentile, 0.0) for percentile in percentiles)
+    return dict((percentile, values[min(len(values) - 1, len(values) * percentile // 100)])
+                for percentile in percentiles)
+
+
+def _format_percentiles(percentiles):
+    return ", ".join("p{}={:.3g}".format(percentile, value) for percentile, value in sorted(percentiles.items()))
+
+
+class Simulation(object):
+    def __init__(self, sites=3, text='', latency=(1, 1), reorder=0.0, reorder_delay=10, partitions=(),
+                 edits_per_tick=1, max_operations=3, sample_interval=100, seed=None):
+        """
+        A set of engines connected by a simulated network
+        :param int sites: The number of sites, which are given the ids 1 through `sites`
+        :param str text: The text that every site starts with
+        :param (int, int) latency: The smallest and largest number of ticks a message takes to be delivered
+        :param float reorder: The chance that a message is held up for longer, so that later messages overtake it
+        :param int reorder_delay: The largest number of extra ticks a reordered message is held up for
+        :param list[Partition] partitions: The times at which the network is split
+        :param int edits_per_tick: The number of sites which make an edit on each tick.  With one edit per tick and a
+                                   latency of one tick, every site has seen every edit before it makes its own, so
+                                   no edits are concurrent.
+        :param int max_operations: The largest number of operations in a single edit
+        :param int sample_interval: The number of ticks between samples of the history size at each site
+        :param seed: The seed for the random edits and network delays, so that a run can be repeated
+        """
+        self.rng = random.Random(seed)
+        self.sites = [SimulatedSite(site_id, text) for site_id in range(1, sites + 1)]
+        self.latency = latency
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.partitions = list(partitions)
+        self.edits_per_tick = edits_per_tick
+        self.max_operations = max_operations
+        self.sample_interval = sample_interval
+        self.tick = 0
+        self.operations = 0
+        self.messages = 0
+        # The messages in flight, as (delivery tick, message number, sender, receiver, sent tick, encoded sequence)
+        self._network = []
+        self._message_count = 0
+        self._elapsed = 0.0
+
+    def random_edit(self, text):
+        """
+        Creates a random edit of the given text, made up of either inserts or deletes in effect order
+        :param str text: The text to edit
+        :rtype: pyote.utils.TransactionSequence
+        """
+        rng = self.rng
+        count = rng.randint(1, self.max_operations)
+        if len(text) > 2 * count and rng.random() < 0.4:
+            # Choose non-overlapping ranges, and shift each one by the deletes that come before it
+            positions = sorted(rng.sample(range(len(text) - 1), count))
+            deletes = []
+            removed = 0
+            end = 0
+            for position in positions:
+                if position < end:
+                    continue
+                length = min(rng.randint(1, 4), len(text) - position)
+                deletes.append(DeleteOperation(position - removed, length))
+                removed += length
+                end = position + length
+            return TransactionSequence(None, None, DeleteOperationNode.from_list(deletes))
+        positions = sorted(rng.randint(0, len(text)) for _ in range(count))
+        inserts = []
+        added = 0
+        for position in positions:
+            value = ''.join(rng.choice(_ALPHABET) for _ in range(rng.randint(1, 5)))
+            inserts.append(InsertOperation(position + added, value))
+            added += len(value)
+        return TransactionSequence(None, InsertOperationNode.from_list(inserts), None)
+
+    def _delay(self):
+        delay = self.rng.randint(*self.latency)
+        if self.reorder and self.rng.random() < self.reorder:
+            delay += self.rng.randint(1, self.reorder_delay)
+        return delay
+
+    def _send(self, sender, sequence):
+        # Every receiver decodes its own copy of the message, just as it would from the wire
+        encoded = sequence.to_json()
+        for receiver in self.sites:
+            if receiver is not sender:
+                self._message_count += 1
+                heapq.heappush(self._network, (self.tick + self._delay(), self._message_count, sender.site_id,
+                                               receiver, self.tick, encoded))
+
+    def _blocked_until(self, sender_id, receiver_id):
+        for partition in self.partitions:
+            if partition.separates(sender_id, receiver_id, self.tick):
+                return partition.end
+        return None
+
+    def _deliver(self):
+        network = self._network
+        while network and network[0][0] <= self.tick:
+            _, number, sender_id, receiver, sent, encoded = heapq.heappop(network)
+            blocked_until = self._blocked_until(sender_id, receiver.site_id)
+            if blocked_until is not None:
+                heapq.heappush(network, (blocked_until, number, sender_id, receiver, sent, encoded))
+                continue
+            sequence = TransactionSequence.from_json(encoded)
+            start = time.perf_counter()
+            applied = receiver.engine.deliver_remote(sequence)
+            receiver.integration_times.append(time.perf_counter() - start)
+            for result in applied:
+                receiver.text = result.apply_to(receiver.text)
+                receiver.delivery_latencies.append(self.tick - sent)
+            self.messages += 1
+
+    def _edit(self):
+        for sender in self.rng.sample(self.sites, min(self.edits_per_tick, len(self.sites))):
+            sequence = self.random_edit(sender.text)
+            sender.text = sequence.apply_to(sender.text)
+            self.operations += sum(1 for node in (sequence.inserts, sequence.deletes) for _ in _iterate(node))
+            self._send(sender, sender.engine.process_transaction(sequence))
+
+    def _sample(self):
+        for site in self.sites:
+            site.history_sizes.append((self.tick, site.history_size()))
+
+    def step(self, edit=True):
+        """
+        Advances the simulation by one tick, delivering the messages which have arrived and then making new edits
+        :param bool edit: Whether the sites should make new edits on this tick
+        """
+        start = time.perf_counter()
+        self._deliver()
+        if edit:
+            self._edit()
+        self._elapsed += time.perf_counter() - start
+        if self.sample_interval and self.tick % self.sample_interval == 0:
+            self._sample()
+        self.tick += 1
+
+    def run(self, ticks):
+        """
+        Makes edits for the given number of ticks, and then delivers every message still in flight
+        :param int ticks: The number of ticks on which edits are made
+        :rtype: SimulationReport
+        """
+        for _ in range(ticks):
+            self.step()
+        while self._network:
+            self.step(edit=False)
+        self._sample()
+        return SimulationReport(self.sites, self.operations, self.messages, self._elapsed, self.tick)
+
+
+def _iterate(node):
+    while node:
+        yield node
+        node = node.next
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Runs engines against each other over a simulated network")
+    parser.add_argument('--sites', type=int, default=3)
+    parser.add_argument('--operations', type=int, default=1000, help="The number of ticks on which edits are made")
+    parser.add_argument('--edits-per-tick', type=int, default=1)
+    parser.add_argument('--latency', type=int, nargs=2, default=(1, 1), metavar=('MIN', 'MAX'))
+    parser.add_argument('--reorder', type=float, default=0.0)
+    parser.add_argument('--partition', type=int, nargs=2, action='append', default=[], metavar=('START', 'END'),
+                        help="Cuts every site off from the others between the two ticks")
+    parser.add_argument('--seed', type=int, default=None)
+    options = parser.parse_args(args)
+    partitions = [Partition(start, end, []) for start, end in options.partition]
+    simulation = Simulation(options.sites, latency=tuple(options.latency), reorder=options.reorder,
+                            partitions=partitions, edits_per_tick=options.edits_per_tick, seed=options.seed)
+    report = simulation.run(options.operations)
+    print(report.summary())
+    return 0 if report.converged else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,185 @@
+"""
+Measuring how much the transformations fragment the history.
+
+Transforming a sequence of deletes past another sequence of deletes can split one delete into several, where one of
+the other deletes falls inside it, and can leave deletes with a length of zero, where another site already deleted the
+same text.  Those deletes are merged into the history, which grows by more nodes than the sequence that was integrated,
+and every later transformation has to walk past them.  An :class:`EngineStats` given to an engine counts the nodes
+going into and out of each of those transformations, the zero-length deletes they produce, and how much the history
+grows with each call, so that a workload which fragments the history can be spotted before it slows everything down.
+Moving deletes past inserts only changes their positions, so those transformations aren't counted.
+
+Collecting the stats walks every sequence that is transformed, which costs about as much again as the transformations,
+so an engine only collects them when it is given an :class:`EngineStats`.
+"""
+
+
+class Histogram(object):
+    def __init__(self):
+        """
+        Counts values in buckets which double in size: 0, 1, 2-3, 4-7, 8-15 and so on.  Values below zero are counted in
+        the 0 bucket.
+        """
+        #: The number of values in each bucket, keyed by the smallest value in the bucket
+        self.buckets = {}
+        """:type: dict[int, int]"""
+        #: The number of values that have been added
+        self.count = 0
+        """:type: int"""
+        #: The sum of the values that have been added
+        self.total = 0
+        """:type: int"""
+        #: The largest value that has been added
+        self.max = 0
+        """:type: int"""
+
+    def add(self, value):
+        """
+        Adds a value to the histogram
+        :param int value: The value to add
+        """
+        bucket = 1 << (value.bit_length() - 1) if value > 0 else 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value) if self.count > 1 else value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def as_dict(self):
+        """
+        :return: The histogram as plain values, with the buckets in order
+        :rtype: dict
+        """
+        return {'count': self.count, 'total': self.total, 'max': self.max, 'mean': self.mean,
+                'buckets': sorted(self.buckets.items())}
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+class TransformStats(object):
+    def __init__(self):
+        """
+        The nodes that have gone into and come out of one kind of transformation
+        """
+        #: The number of times the transformation has been done
+        self.calls = 0
+        """:type: int"""
+        #: The total number of nodes in the sequences that were transformed
+        self.nodes_in = 0
+        """:type: int"""
+        #: The total number of nodes in the sequences that were produced
+        self.nodes_out = 0
+        """:type: int"""
+        #: The total number of deletes with a length of zero that were produced
+        self.zero_length = 0
+        """:type: int"""
+        #: The number of nodes added by splitting operations, for each transformation
+        self.splits = Histogram()
+        """:type: Histogram"""
+
+    @property
+    def amplification(self):
+        """
+        The number of nodes produced for each node transformed, which is 1 when nothing is ever split
+        :rtype: float
+        """
+        return self.nodes_out / self.nodes_in if self.nodes_in else 1.0
+
+    def as_dict(self):
+        return {'calls': self.calls, 'nodes_in': self.nodes_in, 'nodes_out': self.nodes_out,
+                'zero_length': self.zero_length, 'amplification': self.amplification, 'splits': self.splits.as_dict()}
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+class EngineStats(object):
+    #: The delete transformations that are measured, which are the ones that can split a delete.  The transformations
+    #: of deletes past inserts never split or shorten a delete, so they aren't measured.
+    TRANSFORMS = ('transform_delete_delete', 'swap_sequence_delete_delete')
+
+    def __init__(self):
+        """
+        Counts how much an engine's transformations fragment its history.  An engine collects these when it is created
+        with `stats`, and the same stats can be shared by several engines to measure them together.
+        """
+        #: The nodes in and out of each delete transformation, keyed by the name of the transformation
+        self.transforms = {name: TransformStats() for name in self.TRANSFORMS}
+        """:type: dict[str, TransformStats]"""
+        #: The number of remote sequences that have been integrated
+        self.remote_calls = 0
+        """:type: int"""
+        #: The number of local transactions that have been processed
+        self.local_calls = 0
+        """:type: int"""
+        #: The number of nodes the history grew by with each remote sequence or local transaction
+        self.history_growth = Histogram()
+        """:type: Histogram"""
+
+    def record_transform(self, name, incoming, outgoing):
+        """
+        Records a delete transformation
+        :param str name: The transformation, one of :attr:`TRANSFORMS`
+        :param pyote.utils.DeleteOperationNode incoming: The deletes that were transformed
+        :param pyote.utils.DeleteOperationNode outgoing: The deletes that were produced
+        :return: The number of nodes that were added by the transformation
+        :rtype: int
+        """
+        nodes_in = _count(incoming)
+        nodes_out = 0
+        zero_length = 0
+        node = outgoing
+        while node:
+            nodes_out += 1
+            if not node.value.length:
+                zero_length += 1
+            node = node.next
+        stats = self.transforms[name]
+        stats.calls += 1
+        stats.nodes_in += nodes_in
+        stats.nodes_out += nodes_out
+        stats.zero_length += zero_length
+        stats.splits.add(nodes_out - nodes_in)
+        return nodes_out - nodes_in
+
+    def record_call(self, remote, growth):
+        """
+        Records a remote sequence being integrated, or a local transaction being processed
+        :param bool remote: Whether the sequence was remote
+        :param int growth: The number of nodes the history grew by
+        """
+        if remote:
+            self.remote_calls += 1
+        else:
+            self.local_calls += 1
+        self.history_growth.add(growth)
+
+    def reset(self):
+        """
+        Sets every count back to zero
+        """
+        self.__init__()
+
+    def as_dict(self):
+        """
+        :return: The stats as plain values, for logging or exporting to a monitoring system
+        :rtype: dict
+        """
+        return {'remote_calls': self.remote_calls, 'local_calls': self.local_calls,
+                'history_growth': self.history_growth.as_dict(),
+                'transforms': {name: stats.as_dict() for name, stats in self.transforms.items()}}
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+def _count(sequence):
+    count = 0
+    while sequence:
+        count += 1
+        sequence = sequence.next
+    return count
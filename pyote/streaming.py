@@ -0,0 +1,573 @@
+"""
+Incremental encoding and decoding of transaction sequences.
+
+The messages produced here have the same layout as :meth:`pyote.utils.TransactionSequence.__getstate__`, so they can
+still be read with ``json.loads`` and :meth:`pyote.utils.TransactionSequence.from_message`.  The difference is that
+operations are written out one at a time as the linked lists are walked, and read back one at a time as the data
+arrives, so that a large sequence never has to exist as one big string or as one big list of dictionaries.  A log of
+many sequences, such as the catch-up log for a client that reconnects, is read and integrated one sequence at a time in
+the same way.
+"""
+import codecs
+import io
+import json
+import re
+
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.serialization import encode_insert, encode_delete, encode_state
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode, State
+
+#: The number of characters that are gathered up before they are written to a stream, or read from a stream at once
+CHUNK_SIZE = 65536
+
+_decoder = json.JSONDecoder()
+# The characters which can start or end a string, object or list, and the characters which can end a string
+_STRUCTURE = re.compile(r'[]["{}]')
+_STRING_END = re.compile(r'["\\]')
+
+
+def _is_binary(stream):
+    """
+    Determines whether `stream` expects bytes rather than text
+    :param stream: A file-like object
+    :rtype: bool
+    """
+    if isinstance(stream, io.TextIOBase):
+        return False
+    return isinstance(stream, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(stream, 'mode', '')
+
+
+def iter_encoded(sequence, chunk_size=CHUNK_SIZE):
+    """
+    Encodes `sequence` as JSON, a piece at a time.  Only the operation being encoded and the current chunk are held in
+    memory at once.
+    :param pyote.utils.TransactionSequence sequence: The sequence to encode
+    :param int chunk_size: The number of characters to gather before yielding them
+    :return: An iterator over pieces of the encoded sequence, which together form one JSON object
+    :rtype: collections.Iterator[str]
+    """
+    chunk = ['{"starting_state":', encode_state(sequence.starting_state)]
+    size = 0
+    for name, sequence_nodes, encode in (('inserts', sequence.inserts, encode_insert),
+                                         ('deletes', sequence.deletes, encode_delete)):
+        chunk.append(',"{}":['.format(name))
+        node = sequence_nodes
+        while node:
+            encoded = encode(node.value)
+            chunk.append(encoded)
+            size += len(encoded)
+            node = node.next
+            if node:
+                chunk.append(',')
+            if size >= chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+                size = 0
+        chunk.append(']')
+    chunk.append('}')
+    yield ''.join(chunk)
+
+
+def write_sequence(sequence, stream, chunk_size=CHUNK_SIZE):
+    """
+    Writes `sequence` to a file-like object as JSON, without building the whole message in memory first
+    :param pyote.utils.TransactionSequence sequence: The sequence to write
+    :param stream: A text or binary file-like object to write to.  Binary streams receive UTF-8.
+    :param int chunk_size: The number of characters to gather before each write
+    """
+    binary = _is_binary(stream)
+    for chunk in iter_encoded(sequence, chunk_size):
+        stream.write(chunk.encode('utf-8') if binary else chunk)
+
+
+async def write_sequence_async(sequence, writer, chunk_size=CHUNK_SIZE):
+    """
+    Writes `sequence` as UTF-8 encoded JSON to an asynchronous writer, such as an :class:`asyncio.StreamWriter`,
+    waiting for the writer to drain after every chunk so that the amount of buffered data stays bounded.
+    :param pyote.utils.TransactionSequence sequence: The sequence to write
+    :param asyncio.StreamWriter writer: The writer to write to
+    :param int chunk_size: The number of characters to gather before each write
+    """
+    for chunk in iter_encoded(sequence, chunk_size):
+        writer.write(chunk.encode('utf-8'))
+        await writer.drain()
+
+
+def _operation_from_message(kind, message):
+    if kind == 'insert':
+        operation = InsertOperation(message['position'], message['value'])
+    else:
+        operation = DeleteOperation(message['position'], message['length'])
+    operation.state = State.from_message(message['state'])
+    return operation
+
+
+class SequenceDecoder(object):
+    # The kind of operation held in each list
+    _LIST_KINDS = {
+        'inserts': 'insert',
+        'deletes': 'delete',
+    }
+
+    def __init__(self):
+        """
+        Decodes a JSON encoded transaction sequence as data is fed into it.  Every time more data is fed in, the
+        operations that have been completed are returned as events, so that a receiver can start working with a
+        sequence before all of it has arrived.
+
+        The events are tuples of ``(kind, value)``, where `kind` is one of ``"starting_state"`` (with a
+        :class:`pyote.utils.State` or None), ``"insert"`` (with an :class:`pyote.operations.InsertOperation`) or
+        ``"delete"`` (with a :class:`pyote.operations.DeleteOperation`).
+        """
+        self._buffer = ''
+        self._position = 0
+        # What we expect to find next in the buffer
+        self._expecting = 'start'
+        # The key of the value that is currently being decoded
+        self._key = None
+        # Whether the value being decoded was incomplete, and is being scanned for its end as it arrives.  If it is,
+        # the pieces that have arrived since are kept in a list, and only joined onto the buffer once the value is
+        # complete, so that a large value isn't copied every time another piece of it arrives.  The scan also keeps
+        # the depth of the objects and lists, whether it is inside a string, and whether the next character is escaped.
+        self._scanning = False
+        self._pieces = []
+        self._scan_depth = 0
+        self._scan_in_string = False
+        self._scan_escaped = False
+        self._bytes_decoder = None
+        #: Whether a complete sequence has been decoded
+        self.done = False
+        """:type: bool"""
+
+    def feed(self, data):
+        """
+        Adds more encoded data to the decoder
+        :param data: The next piece of the encoded sequence.  Bytes are decoded as UTF-8.
+        :type data: str | bytes
+        :return: The events for every value that was completed by this data
+        :rtype: list[(str, object)]
+        """
+        if isinstance(data, bytes):
+            if not self._bytes_decoder:
+                self._bytes_decoder = codecs.getincrementaldecoder('utf-8')()
+            data = self._bytes_decoder.decode(data)
+        self._append(data)
+        return self._decode(False)
+
+    def close(self):
+        """
+        Signals that all of the encoded data has been fed to the decoder
+        :return: The events for any values that were still waiting to be completed
+        :rtype: list[(str, object)]
+        :raises ValueError: If the data didn't contain a complete sequence
+        """
+        events = self._finish()
+        if self._buffer[self._position:].strip():
+            raise ValueError("The data does not contain exactly one complete transaction sequence")
+        return events
+
+    def _finish(self):
+        """
+        Decodes whatever is left of the sequence once all of the data has been fed in, leaving any data after the end
+        of it to be fetched with :meth:`leftover`
+        :rtype: list[(str, object)]
+        :raises ValueError: If the data didn't contain a complete sequence
+        """
+        if self._bytes_decoder:
+            self._append(self._bytes_decoder.decode(b'', True))
+            self._bytes_decoder = None
+        events = self._decode(True)
+        if not self.done:
+            raise ValueError("The data does not contain exactly one complete transaction sequence")
+        return events
+
+    def leftover(self):
+        """
+        Gets the data that was fed in after the end of the sequence, such as the start of the next sequence in a log
+        :rtype: str
+        """
+        return self._buffer[self._position:] if self.done else ''
+
+    def _skip_whitespace(self):
+        buffer = self._buffer
+        position = self._position
+        while position < len(buffer) and buffer[position] in ' \t\r\n':
+            position += 1
+        self._position = position
+        return buffer[position] if position < len(buffer) else None
+
+    def _append(self, data):
+        if self._scanning:
+            self._pieces.append(data)
+            if not self._scan(data, 0):
+                return
+            self._scanning = False
+            data = ''.join(self._pieces)
+            self._pieces = []
+        # Drop everything that has already been decoded, so that the buffer only holds the value being decoded
+        self._buffer = self._buffer[self._position:] + data if self._position else self._buffer + data
+        self._position = 0
+
+    def _scan(self, data, index):
+        """
+        Looks through `data` for the end of the string, object or list being scanned, carrying on from wherever the
+        scan of the previous piece stopped, so that a large value is only scanned once however many pieces it arrives
+        in
+        :param str data: The next piece of the value
+        :param int index: Where to start in `data`
+        :return: Whether the value ends in `data`
+        :rtype: bool
+        """
+        depth = self._scan_depth
+        in_string = self._scan_in_string
+        if self._scan_escaped:
+            # The piece before ended with a backslash, so the first character here is escaped
+            index += 1
+            self._scan_escaped = False
+        while True:
+            match = (_STRING_END if in_string else _STRUCTURE).search(data, index)
+            if not match:
+                break
+            character = match.group()
+            index = match.end()
+            if in_string:
+                if character == '\\':
+                    if index == len(data):
+                        self._scan_escaped = True
+                        break
+                    index += 1
+                    continue
+                in_string = False
+            elif character == '"':
+                in_string = True
+                continue
+            elif character in '{[':
+                depth += 1
+                continue
+            else:
+                depth -= 1
+            if depth == 0:
+                self._scan_depth = 0
+                self._scan_in_string = False
+                return True
+        self._scan_depth = depth
+        self._scan_in_string = in_string
+        return False
+
+    def _decode_value(self, final):
+        """
+        Decodes the next JSON value in the buffer.  A string, object or list that turns out to be incomplete is scanned
+        for its end as the rest of it arrives, and is only decoded again once it is complete, so it is returned as soon
+        as it can be, without being decoded over and over.
+        :param bool final: Whether no more data will arrive
+        :return: A tuple with whether a value was decoded, and the value itself
+        """
+        if not self._scanning:
+            try:
+                value, self._position = _decoder.raw_decode(self._buffer, self._position)
+                return True, value
+            except ValueError:
+                # Anything other than a string, object or list, such as null, is short, so it is simply tried again
+                if final or self._buffer[self._position] not in '"{[':
+                    if final:
+                        raise
+                    return False, None
+            if self._scan(self._buffer, self._position):
+                # The value is complete, so it can't be decoded because it isn't valid
+                value, self._position = _decoder.raw_decode(self._buffer, self._position)
+                return True, value
+            self._scanning = True
+        if final:
+            raise ValueError("The data ends part of the way through a value")
+        return False, None
+
+    def _expect(self, expected, next_state):
+        character = self._skip_whitespace()
+        if character is None:
+            return False
+        if character not in expected:
+            raise ValueError("Expected one of {!r} at {!r}".format(expected, self._buffer[self._position:][:20]))
+        self._position += 1
+        self._expecting = next_state[character]
+        return True
+
+    def _decode(self, final):
+        events = []
+        while not self.done:
+            if self._expecting == 'start':
+                if not self._expect('{', {'{': 'key'}):
+                    break
+            elif self._expecting == 'key':
+                character = self._skip_whitespace()
+                if character is None:
+                    break
+                if character == '}':
+                    self._position += 1
+                    self.done = True
+                    break
+                decoded, key = self._decode_value(final)
+                if not decoded:
+                    break
+                self._key = key
+                self._expecting = 'colon'
+            elif self._expecting == 'colon':
+                if not self._expect(':', {':': 'list' if self._key in self._LIST_KINDS else 'value'}):
+                    break
+            elif self._expecting == 'value':
+                if self._skip_whitespace() is None:
+                    break
+                decoded, value = self._decode_value(final)
+                if not decoded:
+                    break
+                if self._key == 'starting_state':
+                    events.append(('starting_state', State.from_message(value)))
+                self._expecting = 'after value'
+            elif self._expecting == 'list':
+                if not self._expect('[', {'[': 'first item'}):
+                    break
+            elif self._expecting in ('first item', 'item'):
+                character = self._skip_whitespace()
+                if character is None:
+                    break
+                if character == ']' and self._expecting == 'first item':
+                    self._position += 1
+                    self._expecting = 'after value'
+                    continue
+                decoded, value = self._decode_value(final)
+                if not decoded:
+                    break
+                kind = self._LIST_KINDS[self._key]
+                events.append((kind, _operation_from_message(kind, value)))
+                self._expecting = 'after item'
+            elif self._expecting == 'after item':
+                if not self._expect(',]', {',': 'item', ']': 'after value'}):
+                    break
+            elif self._expecting == 'after value':
+                if not self._expect(',}', {',': 'key', '}': 'end'}):
+                    break
+                if self._expecting == 'end':
+                    self.done = True
+        return events
+
+
+class _SequenceBuilder(object):
+    def __init__(self):
+        """
+        Assembles a transaction sequence from the events of a :class:`SequenceDecoder`, one event at a time
+        """
+        self.sequence = TransactionSequence()
+        self._last_insert = None
+        self._last_delete = None
+
+    def add(self, event):
+        kind, value = event
+        if kind == 'insert':
+            node = InsertOperationNode(value)
+            if self._last_insert:
+                self._last_insert.next = node
+            else:
+                self.sequence.inserts = node
+            self._last_insert = node
+        elif kind == 'delete':
+            node = DeleteOperationNode(value)
+            if self._last_delete:
+                self._last_delete.next = node
+            else:
+                self.sequence.deletes = node
+            self._last_delete = node
+        else:
+            self.sequence.starting_state = value
+
+
+def iter_decoded(stream, chunk_size=CHUNK_SIZE):
+    """
+    Reads a JSON encoded transaction sequence from a file-like object, yielding each part of it as soon as it has
+    been read
+    :param stream: A text or binary file-like object to read from
+    :param int chunk_size: The number of characters or bytes to read at once
+    :return: An iterator over the events described in :class:`SequenceDecoder`
+    :rtype: collections.Iterator[(str, object)]
+    """
+    decoder = SequenceDecoder()
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        for event in decoder.feed(data):
+            yield event
+    for event in decoder.close():
+        yield event
+
+
+def read_sequence(stream, chunk_size=CHUNK_SIZE):
+    """
+    Reads a JSON encoded transaction sequence from a file-like object, building the linked lists as the operations are
+    decoded rather than decoding the whole message first
+    :param stream: A text or binary file-like object to read from
+    :param int chunk_size: The number of characters or bytes to read at once
+    :rtype: pyote.utils.TransactionSequence
+    """
+    builder = _SequenceBuilder()
+    for event in iter_decoded(stream, chunk_size):
+        builder.add(event)
+    return builder.sequence
+
+
+async def read_sequence_async(reader, chunk_size=CHUNK_SIZE):
+    """
+    Reads a UTF-8, JSON encoded transaction sequence from an asynchronous reader, such as an
+    :class:`asyncio.StreamReader`.  The reader must reach the end of its data once the sequence is complete.
+    :param asyncio.StreamReader reader: The reader to read from
+    :param int chunk_size: The number of bytes to read at once
+    :rtype: pyote.utils.TransactionSequence
+    """
+    decoder = SequenceDecoder()
+    builder = _SequenceBuilder()
+    while True:
+        data = await reader.read(chunk_size)
+        if not data:
+            break
+        for event in decoder.feed(data):
+            builder.add(event)
+    for event in decoder.close():
+        builder.add(event)
+    return builder.sequence
+
+
+class LogDecoder(object):
+    def __init__(self):
+        """
+        Decodes a log of JSON encoded transaction sequences written one after another, such as the sequences that a
+        client missed while it was disconnected, as data is fed into it.  Every time more data is fed in, the sequences
+        that have been completed are returned, so only the sequence currently being decoded is held in memory.
+        """
+        self._decoder = SequenceDecoder()
+        self._builder = _SequenceBuilder()
+        self._bytes_decoder = None
+        # Whether any of the current sequence has been fed in
+        self._started = False
+
+    def feed(self, data):
+        """
+        Adds more of the log to the decoder
+        :param data: The next piece of the log.  Bytes are decoded as UTF-8.
+        :type data: str | bytes
+        :return: The sequences that were completed by this data
+        :rtype: list[pyote.utils.TransactionSequence]
+        """
+        if isinstance(data, bytes):
+            if not self._bytes_decoder:
+                self._bytes_decoder = codecs.getincrementaldecoder('utf-8')()
+            data = self._bytes_decoder.decode(data)
+        sequences = []
+        while data:
+            if not self._started:
+                data = data.lstrip()
+                if not data:
+                    break
+                self._started = True
+            for event in self._decoder.feed(data):
+                self._builder.add(event)
+            if not self._decoder.done:
+                break
+            sequences.append(self._builder.sequence)
+            data = self._decoder.leftover()
+            self._reset()
+        return sequences
+
+    def close(self):
+        """
+        Signals that all of the log has been fed to the decoder
+        :return: The last sequence, if it was still waiting to be completed
+        :rtype: list[pyote.utils.TransactionSequence]
+        :raises ValueError: If the log ends part of the way through a sequence
+        """
+        sequences = self.feed(self._bytes_decoder.decode(b'', True) if self._bytes_decoder else '')
+        # Finishing a sequence can leave the start of the next one behind, so carry on until none is left
+        while self._started:
+            for event in self._decoder._finish():
+                self._builder.add(event)
+            sequences.append(self._builder.sequence)
+            data = self._decoder.leftover()
+            self._reset()
+            sequences.extend(self.feed(data))
+        return sequences
+
+    def _reset(self):
+        self._decoder = SequenceDecoder()
+        self._builder = _SequenceBuilder()
+        self._started = False
+
+
+def write_log(sequences, stream, chunk_size=CHUNK_SIZE):
+    """
+    Writes transaction sequences to a file-like object one after another, each on its own line, so that they can be
+    read back with :func:`iter_log`
+    :param collections.Iterable[pyote.utils.TransactionSequence] sequences: The sequences to write
+    :param stream: A text or binary file-like object to write to.  Binary streams receive UTF-8.
+    :param int chunk_size: The number of characters to gather before each write
+    """
+    newline = b'\n' if _is_binary(stream) else '\n'
+    for sequence in sequences:
+        write_sequence(sequence, stream, chunk_size)
+        stream.write(newline)
+
+
+def iter_log(stream, chunk_size=CHUNK_SIZE):
+    """
+    Reads transaction sequences written one after another to a file-like object, yielding each one as soon as it has
+    been read, so that they can be integrated while the rest of the log is still arriving
+    :param stream: A text or binary file-like object to read from
+    :param int chunk_size: The number of characters or bytes to read at once
+    :rtype: collections.Iterator[pyote.utils.TransactionSequence]
+    """
+    decoder = LogDecoder()
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        for sequence in decoder.feed(data):
+            yield sequence
+    for sequence in decoder.close():
+        yield sequence
+
+
+def integrate_log(engine, sequences):
+    """
+    Integrates a log of remote sequences into an engine as it is read, such as the sequences a client missed while it
+    was disconnected, yielding the sequences to apply to the local data as soon as each one has been integrated.
+    Sequences are delivered with :meth:`pyote.engine.Engine.deliver_remote`, so a log which is out of order is
+    integrated as soon as it can be.  Nothing is read from `sequences` until the previous results have been consumed,
+    so reading, integrating and applying a long log can all happen together.
+    :param pyote.engine.Engine engine: The engine to integrate the sequences into
+    :param sequences: The remote sequences, such as those from :func:`iter_log`, or their JSON encodings
+    :type sequences: collections.Iterable[pyote.utils.TransactionSequence | str | bytes]
+    :return: The sequences that can be applied to the local data, in the order they must be applied
+    :rtype: collections.Iterator[pyote.utils.TransactionSequence]
+    """
+    for sequence in sequences:
+        if not isinstance(sequence, TransactionSequence):
+            sequence = TransactionSequence.from_json(sequence)
+        for applied in engine.deliver_remote(sequence):
+            yield applied
+
+
+async def integrate_log_async(engine, reader, chunk_size=CHUNK_SIZE):
+    """
+    Reads a UTF-8, JSON encoded log of remote sequences from an asynchronous reader, such as an
+    :class:`asyncio.StreamReader`, and integrates each one as soon as it has arrived, as in :func:`integrate_log`
+    :param pyote.engine.Engine engine: The engine to integrate the sequences into
+    :param asyncio.StreamReader reader: The reader to read from
+    :param int chunk_size: The number of bytes to read at once
+    :return: The sequences that can be applied to the local data, in the order they must be applied
+    :rtype: collections.AsyncIterator[pyote.utils.TransactionSequence]
+    """
+    decoder = LogDecoder()
+    while True:
+        data = await reader.read(chunk_size)
+        if not data:
+            break
+        for applied in integrate_log(engine, decoder.feed(data)):
+            yield applied
+    for applied in integrate_log(engine, decoder.close()):
+        yield applied
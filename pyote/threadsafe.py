@@ -0,0 +1,195 @@
+"""
+An engine which can be shared between threads.
+
+:class:`pyote.engine.Engine` changes its history in place: merging a sequence relinks the nodes of the history and
+shifts their positions, and the nodes it replaces are handed back to a pool to be reused.  A thread which walks the
+history while another thread integrates a sequence can see it half changed, so every use of a plain engine, even just
+reading it, has to hold the same lock as the writers.
+
+A :class:`ConcurrentEngine` still lets only one thread change its history at a time, but it publishes an
+:class:`EngineSnapshot` once every change is finished.  A snapshot never changes once it has been published, so
+readers can take one at any time without locking, and look up states and measure the history from it while the writer
+carries on.  The history itself is only copied when a reader asks for it, by packing it into a
+:class:`pyote.history.ColumnarHistory`.  The packed history is kept with the snapshot, so every reader of the same
+version shares one copy.  Packing walks the history, so it needs the writer's lock, but a reader never waits for it
+behind a change: if the writer is busy, the reader gets the latest snapshot which already has its history packed, and
+the writer packs the history of the next snapshot it publishes for the readers after it::
+
+    engine = ConcurrentEngine(1)
+
+    # In any number of reader threads
+    snapshot = engine.snapshot()
+    usage = snapshot.memory_usage
+    history = engine.snapshot(history=True).history
+"""
+import threading
+
+from pyote.engine import Engine
+from pyote.utils import MemoryUsage
+
+
+class EngineSnapshot(object):
+    __slots__ = ['version', 'site_id', 'time_stamp', 'last_state', 'memory_usage', 'pending_count',
+                 'pruned_deletes', 'stats', 'history', '_state_index']
+
+    def __init__(self, engine, version):
+        """
+        The state of an engine between two changes to its history.  Nothing in a snapshot is shared with the engine,
+        apart from the index of states, which only ever has states added to it, and from which the states added since
+        the snapshot are ignored.
+        :param pyote.engine.Engine engine: The engine to take the snapshot of.  It must not be changed while the
+                                           snapshot is being taken.
+        :param int version: The number of times the engine's history had been changed
+        """
+        #: The number of times the engine's history had been changed when the snapshot was taken
+        self.version = version
+        """:type: int"""
+        self.site_id = engine.site_id
+        """:type: int"""
+        #: The local time of the most recent operation in the history
+        self.time_stamp = engine._time_stamp
+        """:type: int"""
+        #: The state of the most recently applied operation
+        self.last_state = engine.last_state.__copy__() if engine.last_state else None
+        """:type: pyote.utils.State"""
+        usage = engine.memory_usage
+        self.memory_usage = MemoryUsage(usage.insert_nodes, usage.delete_nodes, usage.insert_characters)
+        """:type: pyote.utils.MemoryUsage"""
+        self.pending_count = engine.pending_count
+        """:type: int"""
+        self.pruned_deletes = engine.pruned_deletes
+        """:type: int"""
+        #: The engine's stats, as plain values, if it collects them
+        self.stats = engine.stats.as_dict() if engine.stats is not None else None
+        """:type: dict"""
+        #: The packed history, once a reader has asked for it
+        self.history = None
+        """:type: pyote.history.ColumnarHistory"""
+        self._state_index = engine._state_index
+
+    def local_time(self, state):
+        """
+        Finds the local time of the operation that `state` refers to, if it had been integrated when the snapshot was
+        taken.  Only the operations added through :meth:`pyote.engine.Engine.integrate_remote` and
+        :meth:`pyote.engine.Engine.process_transaction`, or restored from a packed history, can be found.
+        :param pyote.utils.State state: The state of the operation to look for
+        :return: The local time of the operation, or None if it wasn't in the history
+        :rtype: int
+        """
+        local_time = self._state_index.get((state.site_id, state.remote_time))
+        if local_time is None or local_time > self.time_stamp:
+            return None
+        return local_time
+
+    def __repr__(self):
+        return "{{'version': {}, 'site_id': {}, 'time_stamp': {}, 'last_state': {}, 'memory_usage': {}}}".format(
+            self.version, self.site_id, self.time_stamp, self.last_state, self.memory_usage)
+
+
+class ConcurrentEngine(Engine):
+    def __init__(self, site_id, **kwargs):
+        """
+        An engine whose history can be changed by one thread at a time, and read by any number of threads at once
+        through its snapshots.  Every method which changes the history holds the engine's lock, and publishes a new
+        snapshot when it is done, even if it failed part of the way through.  A packed history should be restored into
+        the engine with :meth:`from_history`, before it is shared.
+        :param int site_id: An id which uniquely identifies this site across all peers
+        :param kwargs: Any other arguments for the engine, such as its limits
+        """
+        #: Held while the history is being changed, or packed for a snapshot.  It is reentrant, because
+        #: :meth:`deliver_remote` integrates sequences through :meth:`integrate_remote`.
+        self._lock = threading.RLock()
+        #: The number of times the history has been changed
+        self.version = 0
+        """:type: int"""
+        self._snapshot = None
+        #: The latest snapshot with its history packed
+        self._packed = None
+        """:type: EngineSnapshot"""
+        #: Whether a reader asked for the history while the writer was busy, so the next snapshot should be packed
+        self._history_wanted = False
+        Engine.__init__(self, site_id, **kwargs)
+        self._publish()
+
+    def snapshot(self, history=False):
+        """
+        Gets the most recently published snapshot.  If the history is wanted, and no reader has asked for the history
+        of this version yet, it is packed if the lock is free.  Otherwise the writer is changing the history, so the
+        latest snapshot that already has its history packed is returned instead, which may be a version or more behind.
+        Only a reader which asks before any history has been packed waits for the writer.
+        :param bool history: Whether the snapshot should include the packed history
+        :rtype: EngineSnapshot
+        """
+        snapshot = self._snapshot
+        if not history or snapshot.history is not None:
+            return snapshot
+        if not self._lock.acquire(blocking=False):
+            packed = self._packed
+            if packed is not None:
+                self._history_wanted = True
+                return packed
+            self._lock.acquire()
+        try:
+            return self._pack()
+        finally:
+            self._lock.release()
+
+    def _pack(self):
+        """
+        Packs the history into the latest snapshot, if it hasn't been already.  The lock must be held, to keep the
+        history the same as the snapshot while it is packed.
+        :rtype: EngineSnapshot
+        """
+        snapshot = self._snapshot
+        if snapshot.history is None:
+            snapshot.history = Engine.pack_history(self)
+            self._packed = snapshot
+        return snapshot
+
+    def integrate_remote(self, remote_sequence):
+        with self._lock:
+            try:
+                return Engine.integrate_remote(self, remote_sequence)
+            finally:
+                self._publish()
+
+    def deliver_remote(self, remote_sequence):
+        with self._lock:
+            try:
+                return Engine.deliver_remote(self, remote_sequence)
+            finally:
+                self._publish()
+
+    def process_transaction(self, outgoing_sequence):
+        with self._lock:
+            try:
+                return Engine.process_transaction(self, outgoing_sequence)
+            finally:
+                self._publish()
+
+    def recount_memory_usage(self):
+        with self._lock:
+            # The snapshot is published when the history is replaced
+            return Engine.recount_memory_usage(self)
+
+    def pack_history(self):
+        """
+        Packs the history into columns, waiting for the writer if it is busy, so that the history is always the latest.
+        The packed history is shared with every snapshot of the same version, so it must not be changed.
+        :rtype: pyote.history.ColumnarHistory
+        """
+        with self._lock:
+            return self._pack().history
+
+    def _history_replaced(self):
+        Engine._history_replaced(self)
+        if self._snapshot is not None:
+            # A restored history replaces the one in the latest snapshot
+            self._publish()
+
+    def _publish(self):
+        self.version += 1
+        self._snapshot = EngineSnapshot(self, self.version)
+        if self._history_wanted:
+            self._history_wanted = False
+            self._pack()
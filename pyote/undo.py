@@ -0,0 +1,311 @@
+"""
+Undoing and redoing local transactions while other sites carry on editing.
+
+Undoing a transaction means applying its inverse, after transforming the inverse past everything that has been applied
+to the text since.  Rather than running the inverse back through the whole history, :class:`UndoManager` remembers
+the inverse of each transaction as a short list of edits, and keeps a log of the sequences applied after it, marked
+with the engine's time stamp.  An undo only transforms the inverse past the sequences applied after the transaction it
+undoes, so it costs about as much as those sequences, however long the history is.
+
+A transaction and the undo which reverses it (or an undo and the redo which reverses that) cancel each other out.  An
+older inverse isn't moved past either of them, since moving it past a transaction which deleted some of the same text
+would lose that part of it for good, even though the undo puts the text back.  Instead, the sequences applied between
+the two are moved back to where they would have been if neither had happened.
+
+Every inverse is kept as a list of `(start, end, text)` edits, as in :mod:`pyote.edits`, and the log keeps every
+sequence as a list of edits too.
+"""
+from collections import deque
+
+from pyote.edits import operations, to_sequence, edits_from_operations, add_edit, operations_from_edits
+
+
+class UndoManager(object):
+    def __init__(self, engine, max_undo=100):
+        """
+        Keeps track of the local transactions on `engine` that can be undone.  Every sequence applied to the text must
+        go through the manager, rather than straight to the engine, so that it can be taken into account when undoing.
+        :param pyote.engine.Engine engine: The engine for this site
+        :param int max_undo: The number of transactions that can be undone.  Older transactions are forgotten.
+        """
+        #: The engine that the transactions are processed by
+        self.engine = engine
+        """:type: pyote.engine.Engine"""
+        #: The inverses of the transactions that can be undone, along with the time stamp they were made at
+        self._undo = deque(maxlen=max_undo)
+        """:type: collections.deque"""
+        #: The inverses of the undos that can be redone, along with the time stamp they were made at
+        self._redo = deque(maxlen=max_undo)
+        """:type: collections.deque"""
+        #: Every sequence applied to the text since the oldest inverse was made, as (time_stamp, site_id, edits,
+        #: inverse, reverses), where `inverse` undoes a local sequence, and `reverses` is the time stamp of the sequence
+        #: that an undo or redo reversed
+        self._log = deque()
+        """:type: collections.deque"""
+
+    @property
+    def can_undo(self):
+        return len(self._undo) > 0
+
+    @property
+    def can_redo(self):
+        return len(self._redo) > 0
+
+    def process_transaction(self, outgoing_sequence, text):
+        """
+        Processes a local transaction, as in :meth:`pyote.engine.Engine.process_transaction`, and remembers how to undo
+        it.  Any undos that could have been redone are forgotten.
+        :param pyote.utils.TransactionSequence outgoing_sequence: The sequence of operations to process
+        :param str text: The text before `outgoing_sequence` was applied to it, which the deleted text is taken from
+        :return: A transaction sequence appropriate to send to other peers
+        :rtype: pyote.utils.TransactionSequence
+        """
+        inserts, deletes = operations(outgoing_sequence)
+        inverse = _inverse_edits(text, inserts, deletes)
+        transformed = self.engine.process_transaction(outgoing_sequence)
+        self._record(self.engine.site_id, edits_from_operations(inserts, deletes), inverse)
+        self._undo.append((self.engine._time_stamp, inverse))
+        self._redo.clear()
+        self._trim_log()
+        return transformed
+
+    def integrate_remote(self, remote_sequence):
+        """
+        Integrates a remote sequence, as in :meth:`pyote.engine.Engine.integrate_remote`
+        :param pyote.utils.TransactionSequence remote_sequence: The sequence to integrate
+        :return: A transaction sequence that can be applied to the local data
+        :rtype: pyote.utils.TransactionSequence
+        """
+        sequence = self.engine.integrate_remote(remote_sequence)
+        self._record_remote(sequence)
+        return sequence
+
+    def deliver_remote(self, remote_sequence):
+        """
+        Delivers a remote sequence, as in :meth:`pyote.engine.Engine.deliver_remote`
+        :param pyote.utils.TransactionSequence remote_sequence: The sequence to deliver
+        :return: The transaction sequences that can now be applied to the local data, in the order they must be applied
+        :rtype: list[pyote.utils.TransactionSequence]
+        """
+        sequences = self.engine.deliver_remote(remote_sequence)
+        for sequence in sequences:
+            self._record_remote(sequence)
+        return sequences
+
+    def undo(self, text):
+        """
+        Undoes the most recent local transaction that hasn't already been undone, keeping every change made since by
+        any site
+        :param str text: The current text
+        :return: The sequence to apply to the local text, and the sequence to send to other peers
+        :rtype: (pyote.utils.TransactionSequence, pyote.utils.TransactionSequence)
+        :raises IndexError: If there is nothing to undo
+        """
+        if not self._undo:
+            raise IndexError("There is nothing to undo")
+        return self._apply(self._undo.pop(), text, self._redo)
+
+    def redo(self, text):
+        """
+        Redoes the most recent undo, keeping every change made since by any site
+        :param str text: The current text
+        :return: The sequence to apply to the local text, and the sequence to send to other peers
+        :rtype: (pyote.utils.TransactionSequence, pyote.utils.TransactionSequence)
+        :raises IndexError: If there is nothing to redo
+        """
+        if not self._redo:
+            raise IndexError("There is nothing to redo")
+        return self._apply(self._redo.pop(), text, self._undo)
+
+    def _apply(self, entry, text, inverses):
+        """
+        Brings an inverse up to date with the text, processes it as a local transaction, and remembers how to reverse
+        it in `inverses`
+        """
+        time_stamp, edits = entry
+        for site_id, logged_edits in self._applied_since(time_stamp):
+            _, edits = _transform_pair(logged_edits, edits, self._goes_first(site_id))
+        inserts, deletes = operations_from_edits(edits)
+        outgoing = self.engine.process_transaction(to_sequence(inserts, deletes))
+        inverse = _invert(edits, text)
+        self._record(self.engine.site_id, edits, inverse, time_stamp)
+        inverses.append((self.engine._time_stamp, inverse))
+        self._trim_log()
+        return to_sequence(inserts, deletes), outgoing
+
+    def _applied_since(self, time_stamp):
+        """
+        Finds the edits that take the text from how it was at `time_stamp` to how it is now, leaving out every
+        sequence that was reversed since, along with the undo or redo which reversed it
+        :param int time_stamp: The time stamp of an inverse
+        :return: The site that made each sequence, and its edits, in the order they must be applied
+        :rtype: list[(int, list[(int, int, str)])]
+        """
+        applied = []
+        for logged_time, site_id, edits, inverse, reverses in self._log:
+            if logged_time <= time_stamp:
+                continue
+            index = len(applied) - 1
+            while reverses is not None and index >= 0 and applied[index][0] != reverses:
+                index -= 1
+            if reverses is None or index < 0:
+                applied.append([logged_time, site_id, edits, inverse])
+                continue
+            # Undo the reversed sequence where it was applied instead, and move the sequences after it back past that,
+            # just as the undo itself was moved forward past them
+            undone = applied.pop(index)[3]
+            for later in applied[index:]:
+                later[2], undone = _transform_pair(later[2], undone, self._goes_first(later[1]))
+        return [(site_id, edits) for _, site_id, edits, _ in applied]
+
+    def _goes_first(self, site_id):
+        """
+        :return: Whether text inserted by `site_id` goes before local text inserted at the same place, as the engine
+                 orders concurrent inserts
+        :rtype: bool
+        """
+        return site_id is None or site_id <= self.engine.site_id
+
+    def _record(self, site_id, edits, inverse=None, reverses=None):
+        if edits and (self._undo or self._redo):
+            self._log.append((self.engine._time_stamp, site_id, edits, inverse, reverses))
+
+    def _record_remote(self, sequence):
+        self._record(self.engine._sender(sequence), edits_from_operations(*operations(sequence)))
+
+    def _trim_log(self):
+        """
+        Drops the sequences that every remembered inverse already takes into account
+        """
+        oldest = min([inverses[0][0] for inverses in (self._undo, self._redo) if inverses] or [None])
+        while self._log and (oldest is None or self._log[0][0] <= oldest):
+            self._log.popleft()
+
+
+def _inverse_edits(text, inserts, deletes):
+    """
+    Finds the edits which undo a sequence.  The inserts and the deletes are both located in the text as it is after
+    the inserts, where the text that was inserted and the text that was deleted are each a list of intervals in order.
+    Anything that is in both cancels out.
+    :param str text: The text before the sequence was applied
+    :param list[(int, str)] inserts: The inserts in the sequence, in effect order
+    :param list[(int, int)] deletes: The deletes in the sequence, in effect order
+    :return: The edits which undo the sequence, located in the text as it is after the sequence
+    :rtype: list[(int, int, str)]
+    """
+    inserted = []
+    for position, value in inserts:
+        # An insert in effect order either falls inside or at the end of the last inserted text, or after it
+        if inserted and position <= inserted[-1][1]:
+            inserted[-1][1] += len(value)
+        elif value:
+            inserted.append([position, position + len(value)])
+    deleted = []
+    removed = 0
+    for position, length in deletes:
+        deleted.append((position + removed, position + removed + length))
+        removed += length
+
+    boundaries = sorted(set([point for interval in inserted for point in interval] +
+                            [point for interval in deleted for point in interval]))
+    edits = []
+    # The amount of inserted and deleted text before the current point
+    inserted_before = deleted_before = 0
+    insert_index = delete_index = 0
+    for start, end in zip(boundaries, boundaries[1:]):
+        while insert_index < len(inserted) and inserted[insert_index][1] <= start:
+            insert_index += 1
+        while delete_index < len(deleted) and deleted[delete_index][1] <= start:
+            delete_index += 1
+        is_inserted = insert_index < len(inserted) and inserted[insert_index][0] <= start
+        is_deleted = delete_index < len(deleted) and deleted[delete_index][0] <= start
+        if is_inserted or is_deleted:
+            position = start - deleted_before
+            restored = text[start - inserted_before:end - inserted_before] if is_deleted and not is_inserted else ''
+            length = end - start if is_inserted and not is_deleted else 0
+            if edits and edits[-1][1] == position:
+                edit_start, edit_end, edit_text = edits[-1]
+                edits[-1] = (edit_start, edit_end + length, edit_text + restored)
+            elif length or restored:
+                edits.append((position, position + length, restored))
+        if is_inserted:
+            inserted_before += end - start
+        if is_deleted:
+            deleted_before += end - start
+    return edits
+
+
+def _transform_pair(first, second, first_goes_first):
+    """
+    Moves two lists of edits made to the same text past each other, so that applying `first` and then the moved
+    `second` gives the same text as applying `second` and then the moved `first`.  Text that both delete is only
+    deleted once, and text that either inserts is kept, even inside text that the other deletes.
+    :param list[(int, int, str)] first: The first list of edits
+    :param list[(int, int, str)] second: The second list of edits
+    :param bool first_goes_first: Whether text inserted by `first` goes before text inserted by `second` at the same
+                                  place
+    :return: `first` located in the text after `second`, and `second` located in the text after `first`
+    :rtype: (list[(int, int, str)], list[(int, int, str)])
+    """
+    points = sorted(set([point for edit in first + second for point in edit[:2]]))
+    first_moved = []
+    second_moved = []
+    # How far through the text after `first`, and the text after `second`, the current point is
+    after_first = after_second = 0
+    previous = 0
+    first_index = second_index = 0
+    for point in points:
+        # The text since the previous point is either deleted completely by each list, or not at all
+        length = point - previous
+        first_deletes = first_index < len(first) and first[first_index][0] <= previous < first[first_index][1]
+        second_deletes = second_index < len(second) and second[second_index][0] <= previous < second[second_index][1]
+        if first_deletes and not second_deletes:
+            add_edit(first_moved, after_second, after_second + length, '')
+            after_second += length
+        elif second_deletes and not first_deletes:
+            add_edit(second_moved, after_first, after_first + length, '')
+            after_first += length
+        elif not first_deletes:
+            after_first += length
+            after_second += length
+        while first_index < len(first) and first[first_index][0] < point and first[first_index][1] <= point:
+            first_index += 1
+        while second_index < len(second) and second[second_index][0] < point and second[second_index][1] <= point:
+            second_index += 1
+
+        first_text = second_text = ''
+        if first_index < len(first) and first[first_index][0] == point:
+            first_text = first[first_index][2]
+            if first[first_index][1] == point:
+                first_index += 1
+        if second_index < len(second) and second[second_index][0] == point:
+            second_text = second[second_index][2]
+            if second[second_index][1] == point:
+                second_index += 1
+        if first_goes_first:
+            add_edit(first_moved, after_second, after_second, first_text)
+            after_first += len(first_text)
+            add_edit(second_moved, after_first, after_first, second_text)
+            after_second += len(second_text)
+        else:
+            add_edit(second_moved, after_first, after_first, second_text)
+            after_second += len(second_text)
+            add_edit(first_moved, after_second, after_second, first_text)
+            after_first += len(first_text)
+        previous = point
+    return first_moved, second_moved
+
+
+def _invert(edits, text):
+    """
+    Finds the edits which undo `edits`
+    :param list[(int, int, str)] edits: The edits
+    :param str text: The text that the edits are applied to
+    :rtype: list[(int, int, str)]
+    """
+    inverse = []
+    offset = 0
+    for start, end, value in edits:
+        inverse.append((start + offset, start + offset + len(value), text[start:end]))
+        offset += len(value) - (end - start)
+    return inverse
@@ -1,5 +1,7 @@
-from copy import deepcopy
-from pyote.operations import InsertOperation, DeleteOperation
+import struct
+import sys
+
+from pyote.operations import InsertOperation, DeleteOperation, ReplaceOperation, MoveOperation, MultiReplaceOperation
 
 
 class TransactionSequence(object):
@@ -17,6 +19,7 @@ class TransactionSequence(object):
         """:type: pyote.utils.InsertOperationNode"""
         self.deletes = deletes
         """:type: pyote.utils.DeleteOperationNode"""
+        self._fingerprint = None
 
     def __repr__(self):
         return "inserts: {}\ndeletes: {}".format(self._print_nodes(self.inserts), self._print_nodes(self.deletes))
@@ -39,43 +42,206 @@ class TransactionSequence(object):
 
     @classmethod
     def from_message(cls, message):
-        if message['starting_state']:
-            starting_state = State.__new__(State)
-            starting_state.__setstate__(message['starting_state'])
-        else:
-            starting_state = None
-        if len(message['inserts']) > 0:
-            inserts = InsertOperationNode(InsertOperation(message['inserts'][0]['position'],
-                                                          message['inserts'][0]['value']))
-            state = State.__new__(State)
-            state.__setstate__(message['inserts'][0]['state'])
-            inserts.value.state = state
-            inode = inserts
-            for insert in message['inserts'][1:]:
-                inode.next = InsertOperationNode(InsertOperation(insert['position'], insert['value']))
-                state = State.__new__(State)
-                state.__setstate__(insert['state'])
-                inode.value.state = state
-                inode = inode.next
-        else:
-            inserts = None
-        if len(message['deletes']) > 0:
-            deletes = DeleteOperationNode(DeleteOperation(message['deletes'][0]['position'],
-                                                          message['deletes'][0]['length']))
-            state = State.__new__(State)
-            state.__setstate__(message['deletes'][0]['state'])
-            deletes.value.state = state
-            dnode = deletes
-            for delete in message['deletes'][1:]:
-                dnode.next = DeleteOperationNode(DeleteOperation(delete['position'], delete['length']))
-                state = State.__new__(State)
-                state.__setstate__(delete['state'])
-                dnode.value.state = state
-                dnode = dnode.next
-        else:
-            deletes = None
+        """
+        Creates a transaction sequence from the dictionary produced by :meth:`__getstate__`, after it has been through
+        a JSON round trip.  Consecutive operations with identical states share one State object, so the resulting
+        sequence should only be integrated (with :meth:`pyote.engine.Engine.integrate_remote` or
+        :meth:`pyote.engine.Engine.deliver_remote`), which never modifies the states of the remote sequence.
+        :param dict message: The decoded message
+        :rtype: TransactionSequence
+        """
+        return cls(State.from_message(message['starting_state']),
+                   _nodes_from_message(InsertOperationNode, InsertOperation, 'value', message['inserts']),
+                   _nodes_from_message(DeleteOperationNode, DeleteOperation, 'length', message['deletes']))
 
-        return TransactionSequence(starting_state, inserts, deletes)
+    @classmethod
+    def from_operations(cls, operations, text=None):
+        """
+        Creates a transaction sequence, ready for :meth:`pyote.engine.Engine.process_transaction`, out of inserts,
+        deletes, replaces and moves, including :class:`pyote.operations.MultiReplaceOperation`.  Unlike the operations
+        in a transaction sequence, these are all located in the same text, the text before any of them are applied, so
+        they can be given in any order, but they must not overlap.  Operations which touch are combined, and if `text`
+        is given, the part of a replaced value which is the same as the text it replaces is left out, so that a
+        replace-all only adds the changes to the history.
+        :param list[pyote.operations.Operation] operations: The operations to apply
+        :param str text: The text that the operations are applied to, which is needed to move text
+        :rtype: TransactionSequence
+        :raises ValueError: If two operations overlap, or text is moved without `text` being given
+        """
+        edits = []
+        for operation in operations:
+            if isinstance(operation, InsertOperation):
+                edits.append((operation.position, operation.position, operation.value))
+            elif isinstance(operation, DeleteOperation):
+                edits.append((operation.position, operation.position + operation.length, ''))
+            elif isinstance(operation, ReplaceOperation):
+                edits.append((operation.position, operation.position + operation.length, operation.value))
+            elif isinstance(operation, MultiReplaceOperation):
+                edits.extend((position, position + length, value) for position, length, value in operation.ranges)
+            elif isinstance(operation, MoveOperation):
+                if text is None:
+                    raise ValueError("The text is needed to move part of it")
+                end = operation.position + operation.length
+                if operation.position < operation.destination < end:
+                    raise ValueError("Text can't be moved inside itself")
+                edits.append((operation.position, end, ''))
+                edits.append((operation.destination, operation.destination, text[operation.position:end]))
+            else:
+                raise ValueError("Unknown operation {}".format(operation))
+        # A stable sort keeps inserts at the same position in the order they were given, and before a delete there
+        edits.sort(key=lambda edit: (edit[0], edit[1]))
+
+        combined = []
+        for start, end, value in edits:
+            if combined and start < combined[-1][1]:
+                raise ValueError("Operations overlap at position {}".format(start))
+            if combined and start == combined[-1][1]:
+                previous_start, _, previous_value = combined.pop()
+                start, value = previous_start, previous_value + value
+            combined.append((start, end, value))
+
+        inserts = []
+        deletes = []
+        inserted = removed = 0
+        for edit in combined:
+            start, end, value = _trim_replace(text, *edit)
+            if value:
+                inserts.append(InsertOperation(start + inserted, value))
+                inserted += len(value)
+            if end > start:
+                deletes.append(DeleteOperation(start + inserted - removed, end - start))
+                removed += end - start
+        return cls(None, InsertOperationNode.from_list(inserts), DeleteOperationNode.from_list(deletes))
+
+    def to_json(self):
+        """
+        Encodes this sequence as JSON, without building the dictionaries from :meth:`__getstate__` first
+        :rtype: str
+        """
+        from pyote.serialization import encode_sequence
+        return encode_sequence(self)
+
+    @classmethod
+    def from_json(cls, text):
+        """
+        Decodes a sequence encoded by :meth:`to_json`, or by JSON encoding :meth:`__getstate__`
+        :param text: The encoded sequence
+        :type text: str | bytes
+        :rtype: TransactionSequence
+        """
+        from pyote.serialization import loads
+        return cls.from_message(loads(text))
+
+    def fingerprint(self):
+        """
+        Computes a digest of everything in this sequence: the starting state, and the position, state and value or
+        length of every operation.  Two sequences with the same fingerprint are identical.  The fingerprint is only
+        computed once, so the sequence must not be changed afterwards.
+        :rtype: bytes
+        """
+        if self._fingerprint is None:
+            import hashlib
+            digest = hashlib.blake2b(digest_size=16)
+            _hash_state(digest, self.starting_state)
+            node = self.inserts
+            while node:
+                operation = node.value
+                value = operation.value if isinstance(operation.value, str) else repr(operation.value)
+                encoded = value.encode('utf-8')
+                digest.update(b'i')
+                _hash_state(digest, operation.state)
+                digest.update(_PAIR.pack(operation.position, len(encoded)))
+                digest.update(encoded)
+                node = node.next
+            node = self.deletes
+            while node:
+                operation = node.value
+                digest.update(b'd')
+                _hash_state(digest, operation.state)
+                digest.update(_PAIR.pack(operation.position, operation.length))
+                node = node.next
+            self._fingerprint = digest.digest()
+        return self._fingerprint
+
+    def apply_to(self, text):
+        """
+        Applies the operations in this sequence to a string, first the inserts and then the deletes, each in order
+        :param str text: The text to apply the operations to
+        :return: The text after the operations have been applied
+        :rtype: str
+        """
+        node = self.inserts
+        while node:
+            operation = node.value
+            text = text[:operation.position] + operation.value + text[operation.position:]
+            node = node.next
+        node = self.deletes
+        while node:
+            operation = node.value
+            text = text[:operation.position] + text[operation.position + operation.length:]
+            node = node.next
+        return text
+
+
+_PAIR = struct.Struct('<qq')
+_STATE = struct.Struct('<qqq')
+
+
+def _hash_state(digest, state):
+    if state:
+        digest.update(b's')
+        digest.update(_STATE.pack(state.site_id, state.local_time, state.remote_time))
+    else:
+        digest.update(b'n')
+
+
+def _trim_replace(text, start, end, value):
+    """
+    Leaves out the beginning and the end of a replaced value which are the same as the text that they replace
+    :param str text: The text being replaced, or None if it isn't known
+    :return: The start, end and value of what is left of the replace
+    :rtype: (int, int, str)
+    """
+    if text is None:
+        return start, end, value
+    replaced = text[start:end]
+    prefix = 0
+    limit = min(len(replaced), len(value))
+    while prefix < limit and replaced[prefix] == value[prefix]:
+        prefix += 1
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and replaced[-1 - suffix] == value[-1 - suffix]:
+        suffix += 1
+    return start + prefix, end - suffix, value[prefix:len(value) - suffix]
+
+
+def _nodes_from_message(node_class, operation_class, field, messages):
+    """
+    Builds a linked list of operations from their decoded messages
+    :param type node_class: The class of node to build the list out of
+    :param type operation_class: The class of operation to create
+    :param str field: The name of the field that is passed to `operation_class` along with the position
+    :param list[dict] messages: The decoded operations
+    :return: The head of the linked list
+    :rtype: OperationNode
+    """
+    head = None
+    node = None
+    state = None
+    state_message = None
+    for message in messages:
+        operation = operation_class(message['position'], message[field])
+        if message['state'] is not state_message and message['state'] != state_message:
+            state_message = message['state']
+            state = State(state_message['site_id'], state_message['local_time'], state_message['remote_time'])
+        operation.state = state
+        if node:
+            node.next = node_class(operation)
+            node = node.next
+        else:
+            node = head = node_class(operation)
+    return head
 
 
 class OperationNode(object):
@@ -89,7 +255,7 @@ class OperationNode(object):
         return self.value == other.value and self.next == other.next
 
     def __copy__(self):
-        new_node = OperationNode(deepcopy(self.value))
+        new_node = OperationNode(self.value.__copy__())
         new_node.next = self.next
         return new_node
 
@@ -146,7 +312,19 @@ class InsertOperationNode(OperationNode):
         return head
 
     def __copy__(self):
-        new_node = InsertOperationNode(deepcopy(self.value))
+        # This is the same as copying the operation with copy_from or __copy__, written out in full because the
+        # transformations copy a node for nearly every step they take
+        operation = self.value
+        try:
+            new_node = InsertOperationNode.pool._free.pop()
+        except IndexError:
+            new_operation = InsertOperation(operation.position, operation.value)
+            new_node = InsertOperationNode(new_operation)
+        else:
+            new_operation = new_node.value
+            new_operation.position = operation.position
+            new_operation.value = operation.value
+        _copy_state(new_operation, operation.state)
         new_node.next = self.next
         return new_node
 
@@ -180,12 +358,41 @@ class DeleteOperationNode(OperationNode):
         return head
 
     def __copy__(self):
-        new_node = DeleteOperationNode(deepcopy(self.value))
+        # Written out in full, as in InsertOperationNode.__copy__
+        operation = self.value
+        try:
+            new_node = DeleteOperationNode.pool._free.pop()
+        except IndexError:
+            new_operation = DeleteOperation(operation.position, operation.length)
+            new_node = DeleteOperationNode(new_operation)
+        else:
+            new_operation = new_node.value
+            new_operation.position = operation.position
+            new_operation.length = operation.length
+        _copy_state(new_operation, operation.state)
         new_node.next = self.next
         return new_node
 
 
+def _copy_state(operation, state):
+    """
+    Gives `operation` a copy of `state`, reusing the state the operation already has, as
+    :meth:`pyote.operations.Operation.copy_from` does
+    """
+    if state is None:
+        operation.state = None
+    elif operation.state is None:
+        operation.state = State(state.site_id, state.local_time, state.remote_time)
+    else:
+        new_state = operation.state
+        new_state.site_id = state.site_id
+        new_state.local_time = state.local_time
+        new_state.remote_time = state.remote_time
+
+
 class State(object):
+    __slots__ = ['site_id', 'local_time', 'remote_time']
+
     def __init__(self, site_id, local_time, remote_time):
         self.site_id = site_id
         self.local_time = local_time
@@ -203,5 +410,172 @@ class State(object):
         self.local_time = state['local_time']
         self.remote_time = state['remote_time']
 
+    @classmethod
+    def from_message(cls, message):
+        """
+        Creates a state from the dictionary produced by :meth:`__getstate__`
+        :param dict message: The decoded state, or None
+        :return: The state, or None if `message` is None
+        :rtype: State
+        """
+        if not message:
+            return None
+        return cls(message['site_id'], message['local_time'], message['remote_time'])
+
+    def __copy__(self):
+        return State(self.site_id, self.local_time, self.remote_time)
+
+    def copy_from(self, other):
+        """
+        Overwrites this state with the values from `other`
+        :param State other: The state to copy
+        """
+        self.site_id = other.site_id
+        self.local_time = other.local_time
+        self.remote_time = other.remote_time
+
     def __repr__(self):
         return str(self.__getstate__())
+
+
+class MemoryUsage(object):
+    __slots__ = ['insert_nodes', 'delete_nodes', 'insert_characters']
+
+    def __init__(self, insert_nodes=0, delete_nodes=0, insert_characters=0):
+        """
+        The approximate amount of memory held by a history.  Every node in a history holds its own operation and
+        state, so the number of states is the same as the number of nodes.
+        :param int insert_nodes: The number of nodes in the insert history
+        :param int delete_nodes: The number of nodes in the delete history
+        :param int insert_characters: The total length of the values of the inserts
+        """
+        self.insert_nodes = insert_nodes
+        self.delete_nodes = delete_nodes
+        self.insert_characters = insert_characters
+
+    @property
+    def states(self):
+        return self.insert_nodes + self.delete_nodes
+
+    @property
+    def bytes(self):
+        """
+        An estimate of the number of bytes held by the history, assuming one byte for each inserted character
+        :rtype: int
+        """
+        return (self.states * (_NODE_SIZE + _OPERATION_SIZE + _STATE_SIZE) + self.insert_nodes * _VALUE_SIZE +
+                self.insert_characters)
+
+    def add(self, inserts, deletes):
+        """
+        Records that the operations in `inserts` and `deletes` have been added to the history
+        :param InsertOperationNode inserts: The inserts that were added
+        :param DeleteOperationNode deletes: The deletes that were added
+        """
+        usage = MemoryUsage.of(inserts, deletes)
+        self.insert_nodes += usage.insert_nodes
+        self.delete_nodes += usage.delete_nodes
+        self.insert_characters += usage.insert_characters
+
+    @classmethod
+    def of(cls, inserts, deletes):
+        """
+        Measures a pair of sequences by walking them
+        :param InsertOperationNode inserts: The inserts to measure
+        :param DeleteOperationNode deletes: The deletes to measure
+        :rtype: MemoryUsage
+        """
+        usage = cls()
+        node = inserts
+        while node:
+            usage.insert_nodes += 1
+            usage.insert_characters += len(node.value.value)
+            node = node.next
+        node = deletes
+        while node:
+            usage.delete_nodes += 1
+            node = node.next
+        return usage
+
+    def __repr__(self):
+        return "{{'insert_nodes': {}, 'delete_nodes': {}, 'insert_characters': {}, 'bytes': {}}}".format(
+            self.insert_nodes, self.delete_nodes, self.insert_characters, self.bytes)
+
+
+class NodePool(object):
+    def __init__(self, node_class, operation_class, capacity=4096):
+        """
+        A free list of nodes which are no longer part of any sequence.  Copying a node takes a node from the pool
+        (along with the operation and state it holds) and overwrites it, rather than allocating new objects, which
+        keeps the garbage collector from running over and over while sequences are transformed and merged.
+
+        Only the engine releases nodes into the pool, and only nodes from sequences which it owns and will never
+        use again.  The pool is shared by every engine, including engines in different threads, so it only takes and
+        returns nodes with single calls to :meth:`list.pop` and :meth:`list.append`, which are atomic.
+
+        :param type node_class: The class of node that this pool holds
+        :param type operation_class: The class of operation that the nodes in this pool hold
+        :param int capacity: The maximum number of nodes to keep in the pool
+        """
+        self.node_class = node_class
+        self.operation_class = operation_class
+        #: The maximum number of nodes to keep in the pool
+        self.capacity = capacity
+        """:type: int"""
+        self._free = []
+        """:type: list[OperationNode]"""
+
+    def __len__(self):
+        return len(self._free)
+
+    def acquire(self):
+        """
+        Takes a node out of the pool.  The node's operation will still hold its old values.
+        :return: A node, or None if the pool is empty
+        :rtype: OperationNode
+        """
+        try:
+            return self._free.pop()
+        except IndexError:
+            # Another thread may have taken the last node since this one checked, so the pool isn't checked first
+            return None
+
+    def release(self, sequence):
+        """
+        Returns every node in `sequence` to the pool, until the pool is full.  Neither the nodes nor their operations
+        may be used by the caller afterwards.
+        :param OperationNode sequence: The sequence to release
+        """
+        free = self._free
+        node = sequence
+        while node and len(free) < self.capacity:
+            next_node = node.next
+            node.next = None
+            free.append(node)
+            node = next_node
+
+    def reserve(self, count):
+        """
+        Fills the pool ahead of time so that the first `count` copies don't need to allocate anything
+        :param int count: The number of nodes that should be available in the pool
+        """
+        count = min(count, self.capacity)
+        while len(self._free) < count:
+            operation = self.operation_class.__new__(self.operation_class)
+            operation.state = State(0, 0, 0)
+            self._free.append(self.node_class(operation))
+
+    def clear(self):
+        """
+        Removes all the nodes from the pool
+        """
+        del self._free[:]
+
+
+InsertOperationNode.pool = NodePool(InsertOperationNode, InsertOperation)
+DeleteOperationNode.pool = NodePool(DeleteOperationNode, DeleteOperation)
+
+_NODE_SIZE = sys.getsizeof(InsertOperationNode(None))
+_OPERATION_SIZE = sys.getsizeof(InsertOperation(0, ''))
+_STATE_SIZE = sys.getsizeof(State(0, 0, 0))
+_VALUE_SIZE = sys.getsizeof('')
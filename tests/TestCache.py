@@ -0,0 +1,70 @@
+from unittest import TestCase
+from pyote.cache import TransformCache
+from pyote.engine import Engine
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode
+
+
+def edit(engine, inserts=(), deletes=()):
+    return engine.process_transaction(TransactionSequence(
+        None, InsertOperationNode.from_list(list(inserts)), DeleteOperationNode.from_list(list(deletes))))
+
+
+class TransformCacheTests(TestCase):
+
+    def get_stream(self):
+        """
+        Creates the sequences sent by two sites which edit at the same time
+        """
+        site1 = Engine(1)
+        site2 = Engine(2)
+        outgoing1 = edit(site1, [InsertOperation(0, "The quick brown fox")])
+        site2.integrate_remote(outgoing1)
+        outgoing2 = edit(site1, [InsertOperation(4, "very ")], [DeleteOperation(0, 4)])
+        outgoing3 = edit(site2, [InsertOperation(19, "!")], [DeleteOperation(4, 6)])
+        outgoing4 = edit(site2, [InsertOperation(0, "A ")])
+        return [outgoing1, outgoing3, outgoing4, outgoing2]
+
+    def test_engines_with_the_same_history_share_results(self):
+        cache = TransformCache()
+        uncached = Engine(10)
+        cached = [Engine(11, transform_cache=cache), Engine(12, transform_cache=cache)]
+        for sequence in self.get_stream():
+            expected = uncached.integrate_remote(sequence).to_json()
+            for engine in cached:
+                self.assertEqual(engine.integrate_remote(sequence).to_json(), expected)
+        for engine in cached:
+            self.assertEqual(repr(engine), repr(uncached))
+        self.assertEqual((cache.hits, cache.misses), (4, 4))
+        self.assertEqual(len(cache), 4)
+
+    def test_different_histories_do_not_share_results(self):
+        cache = TransformCache()
+        engine1 = Engine(11, transform_cache=cache)
+        engine2 = Engine(12, transform_cache=cache)
+        edit(engine2, [InsertOperation(0, "abc")])
+        stream = self.get_stream()
+        engine1.integrate_remote(stream[0])
+        engine2.integrate_remote(stream[0])
+        self.assertEqual(cache.hits, 0)
+
+        # A replaced history matches no other history, even one with the same operations
+        engine3 = Engine(13, transform_cache=cache)
+        engine3.integrate_remote(stream[0])
+        self.assertEqual(cache.hits, 1)
+        engine1.recount_memory_usage()
+        engine1.integrate_remote(stream[1])
+        engine3.integrate_remote(stream[1])
+        self.assertEqual(cache.hits, 1)
+
+    def test_least_recently_used_results_are_dropped(self):
+        cache = TransformCache(capacity=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
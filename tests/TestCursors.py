@@ -0,0 +1,75 @@
+from unittest import TestCase
+from pyote.cursors import transform_positions, transform_ranges, transform_replacements, STAY_BEFORE
+from pyote.operations import InsertOperation, DeleteOperation, MultiReplaceOperation
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode, State
+
+
+class CursorTests(TestCase):
+
+    def get_sequence(self):
+        # Turns "The quick brown fox" into "very quickish fox"
+        inserts = [InsertOperation(4, "very "), InsertOperation(14, "ish")]
+        inserts[0].state = State(2, 1, 0)
+        inserts[1].state = State(2, 1, 0)
+        deletes = [DeleteOperation(0, 4), DeleteOperation(14, 6)]
+        deletes[0].state = State(2, 1, 0)
+        deletes[1].state = State(2, 1, 0)
+        return TransactionSequence(State(2, 0, 0), InsertOperationNode.from_list(inserts),
+                                   DeleteOperationNode.from_list(deletes))
+
+    def test_positions(self):
+        sequence = self.get_sequence()
+        self.assertEqual(sequence.apply_to("The quick brown fox"), "very quickish fox")
+        # 'T', 'q', 'o' in "brown", 'f'
+        self.assertEqual(transform_positions(sequence, [0, 4, 12, 16], 3), [0, 5, 14, 14])
+        self.assertEqual(transform_positions(sequence, [], 3), [])
+
+    def test_inserts_at_a_position(self):
+        sequence = self.get_sequence()
+        # Text from a site with a lower id goes before the cursor
+        self.assertEqual(transform_positions(sequence, [9], 3), [13])
+        self.assertEqual(transform_positions(sequence, [9], 1), [10])
+        # A cursor without a site always goes after the text
+        self.assertEqual(transform_positions(sequence, [9]), [13])
+        self.assertEqual(transform_positions(sequence, [4, 4, 9, 9], [3, 1, 1, None]), [5, 0, 10, 13])
+
+    def test_unordered_positions(self):
+        with self.assertRaises(ValueError):
+            transform_positions(self.get_sequence(), [4, 2], 3)
+        with self.assertRaises(ValueError):
+            transform_positions(self.get_sequence(), [4, 2], [3, 1])
+
+    def test_ranges(self):
+        sequence = self.get_sequence()
+        text = sequence.apply_to("The quick brown fox")
+        ranges = transform_ranges(sequence, [(4, 9), (10, 15), (16, 19), (4, 9)], [3, 3, 3, 1])
+        self.assertEqual(ranges, [(5, 13), (14, 14), (14, 17), (0, 10)])
+        self.assertEqual([text[start:end] for start, end in ranges], ["quickish", "", "fox", "very quick"])
+        self.assertEqual(transform_ranges(sequence, [(0, 19)]), [(0, 17)])
+
+    def test_stay_before(self):
+        sequence = self.get_sequence()
+        self.assertEqual(transform_positions(sequence, [9, 9], [None, STAY_BEFORE]), [13, 10])
+        self.assertEqual(transform_positions(sequence, [9], STAY_BEFORE), [10])
+
+    def test_replacements(self):
+        sequence = self.get_sequence()
+        # "quick" and "fox" are kept, "brown" has been deleted, and the insert at the start stays an insert
+        replacements = MultiReplaceOperation([(0, 0, ">"), (4, 5, "slow"), (10, 5, "red"), (16, 3, "dog")])
+        moved, dropped = transform_replacements(sequence, replacements)
+        self.assertEqual(moved.ranges, [(0, 0, ">"), (5, 5, "slow"), (14, 3, "dog")])
+        # All of "brown" was deleted, so its range is empty
+        self.assertEqual(dropped, [(2, 14, 14)])
+        text = sequence.apply_to("The quick brown fox")
+        self.assertEqual(TransactionSequence.from_operations([moved], text).apply_to(text), ">very slowish dog")
+
+    def test_replacements_with_the_same_length(self):
+        # Turns "quick" into "quACk", which is still five characters long
+        sequence = TransactionSequence(None, InsertOperationNode.from_list([InsertOperation(6, "AC")]),
+                                       DeleteOperationNode.from_list([DeleteOperation(8, 2)]))
+        self.assertEqual(sequence.apply_to("The quick brown fox"), "The quACk brown fox")
+        replacements = MultiReplaceOperation([(4, 5, "slow"), (10, 5, "red")])
+        moved, dropped = transform_replacements(sequence, replacements)
+        self.assertEqual(moved.ranges, [(10, 5, "red")])
+        self.assertEqual(dropped, [(0, 4, 9)])
+        self.assertEqual(sequence.apply_to("The quick brown fox")[4:9], "quACk")
@@ -0,0 +1,33 @@
+from unittest import TestCase
+from pyote.edits import edits_from_sequence, sequence_from_edits, add_edit
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode
+
+
+class EditTests(TestCase):
+
+    def get_sequence(self):
+        # Turns "The quick brown fox" into "very quickish fox"
+        return TransactionSequence(None, InsertOperationNode.from_list([
+            InsertOperation(4, "very "), InsertOperation(14, "ish")
+        ]), DeleteOperationNode.from_list([DeleteOperation(0, 4), DeleteOperation(14, 6)]))
+
+    def test_edits_from_sequence(self):
+        edits = edits_from_sequence(self.get_sequence())
+        self.assertEqual(edits, [(0, 4, "very "), (9, 9, "ish"), (10, 16, "")])
+        self.assertEqual(sequence_from_edits(edits).apply_to("The quick brown fox"), "very quickish fox")
+
+    def test_inserted_text_that_is_deleted_cancels_out(self):
+        sequence = TransactionSequence(None, InsertOperationNode.from_list([InsertOperation(3, "abc")]),
+                                       DeleteOperationNode.from_list([DeleteOperation(4, 3)]))
+        # "bc" is deleted again, along with the character after it
+        self.assertEqual(edits_from_sequence(sequence), [(3, 4, "a")])
+
+    def test_add_edit(self):
+        edits = []
+        add_edit(edits, 2, 2, "")
+        self.assertEqual(edits, [])
+        add_edit(edits, 2, 4, "x")
+        add_edit(edits, 4, 4, "y")
+        add_edit(edits, 6, 7, "")
+        self.assertEqual(edits, [(2, 4, "xy"), (6, 7, "")])
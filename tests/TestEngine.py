@@ -1,8 +1,8 @@
 import random
 from unittest import TestCase
-from pyote.engine import Engine
+from pyote.engine import Engine, OTException, MemoryLimitExceeded
 from pyote.operations import InsertOperation, DeleteOperation
-from pyote.utils import TransactionSequence, State, InsertOperationNode, DeleteOperationNode
+from pyote.utils import TransactionSequence, State, InsertOperationNode, DeleteOperationNode, MemoryUsage
 
 
 def get_dummy_state(site_id):
@@ -54,6 +54,8 @@ class EngineTests(TestCase):
             insert_with_state(20, 3, State(2, 10, 16)),
             insert_with_state(21, 2, State(1, 11, 20)),
         ])
+        # The history was assigned directly, so its states have to be indexed
+        engine._index_history()
         result = engine._get_concurrent(State(1, 5, 3), engine._inserts).to_list()
         self.assertEqual(result, [
             insert_with_state(8, 4, State(1, 7, 4)),
@@ -352,6 +354,7 @@ class EngineTests(TestCase):
         ], 1)
 
         # After the deletes are applied, we would have "Th vry qckly brwn fx"
+        engine.recount_memory_usage()
 
         sequence = TransactionSequence(State(1, 0, 0), convert_insert_list([
             # Add an "ee" after "the"
@@ -759,3 +762,168 @@ class EngineTests(TestCase):
             DeleteOperation(24, 1),
         ])
         # After all the deletes are applied, we should have "Tee vry qcklyk wnwnwnwn xxx!"
+
+    def test_deliver_remote_holds_early_sequences(self):
+        sender = Engine(2)
+        # Starting with an empty buffer, insert "The fox"
+        first = sender.process_transaction(TransactionSequence(None, InsertOperationNode.from_list([
+            InsertOperation(0, "The fox"),
+        ]), None))
+        # Then insert "quick " before "fox", having seen the first insert
+        second = sender.process_transaction(TransactionSequence(None, InsertOperationNode.from_list([
+            InsertOperation(4, "quick "),
+        ]), None))
+
+        engine = Engine(1)
+        self.assertEqual(engine.deliver_remote(second), [])
+        self.assertEqual(engine.pending_count, 1)
+
+        applied = engine.deliver_remote(first)
+        self.assertEqual(engine.pending_count, 0)
+        self.assertEqual(len(applied), 2)
+        self.assertListEqual(applied[0].inserts.to_list(), [InsertOperation(0, "The fox")])
+        self.assertListEqual(applied[1].inserts.to_list(), [InsertOperation(4, "quick ")])
+        self.assertEqual(engine._inserts.to_list(), [
+            InsertOperation(0, "The fox"),
+            InsertOperation(4, "quick "),
+        ])
+
+    def test_deliver_remote_limits_pending_sequences(self):
+        engine = Engine(1, max_pending=1)
+        waiting = TransactionSequence(State(2, 5, 5), convert_insert_list([InsertOperation(0, "a")], 2), None)
+        self.assertEqual(engine.deliver_remote(waiting), [])
+        with self.assertRaises(OTException):
+            engine.deliver_remote(TransactionSequence(State(2, 6, 6),
+                                                      convert_insert_list([InsertOperation(0, "b")], 2), None))
+
+    def test_directly_assigned_history_is_indexed(self):
+        engine = Engine(1)
+        engine._inserts = InsertOperationNode.from_list([insert_with_state(0, "The fox", State(2, 1, 1))])
+        waiting = TransactionSequence(State(2, 1, 1), convert_insert_list([InsertOperation(4, "quick ")], 2), None)
+        # Starting states are only looked up in the index, not in the history itself
+        self.assertEqual(engine.deliver_remote(waiting), [])
+        self.assertEqual(engine.pending_count, 1)
+
+        engine._pending.clear()
+        engine.pending_count = 0
+        engine.recount_memory_usage()
+        self.assertEqual(engine._lookup_local_time(State(2, 1, 1)), 1)
+        self.assertEqual(len(engine.deliver_remote(waiting)), 1)
+
+    def test_memory_usage(self):
+        engine1 = Engine(1)
+        engine2 = Engine(2)
+        outgoing = engine1.process_transaction(TransactionSequence(
+            None, InsertOperationNode.from_list([InsertOperation(0, "The quick brown fox")]), None))
+        self.assertEqual(engine1.memory_usage.insert_nodes, 1)
+        self.assertEqual(engine1.memory_usage.insert_characters, 19)
+        engine2.integrate_remote(outgoing)
+        outgoing = engine2.process_transaction(TransactionSequence(
+            None, InsertOperationNode.from_list([InsertOperation(4, "very "), InsertOperation(14, "ish")]),
+            DeleteOperationNode.from_list([DeleteOperation(0, 4)])))
+        engine1.integrate_remote(outgoing)
+        for engine in (engine1, engine2):
+            usage = engine.memory_usage
+            self.assertEqual((usage.insert_nodes, usage.delete_nodes, usage.insert_characters), (3, 1, 27))
+            self.assertEqual(usage.states, 4)
+            self.assertEqual(repr(usage), repr(MemoryUsage.of(engine._inserts, engine._deletes)))
+            self.assertGreater(usage.bytes, 27)
+
+    def test_hard_limit_rejects_sequence(self):
+        engine = Engine(1, hard_limit=1000)
+        engine.process_transaction(TransactionSequence(
+            None, InsertOperationNode.from_list([InsertOperation(0, "abc")]), None))
+        usage = repr(engine.memory_usage)
+        with self.assertRaises(MemoryLimitExceeded):
+            engine.integrate_remote(TransactionSequence(
+                engine.last_state, convert_insert_list([InsertOperation(0, "x" * 1000)], 2), None))
+        self.assertEqual(repr(engine.memory_usage), usage)
+        self.assertEqual(engine._inserts.to_list(), [InsertOperation(0, "abc")])
+
+    def test_soft_limit_calls_callback(self):
+        calls = []
+
+        def compact(engine):
+            calls.append(engine.memory_usage.bytes)
+
+        engine = Engine(1, soft_limit=2000, on_soft_limit=compact)
+        for _ in range(20):
+            engine.process_transaction(TransactionSequence(
+                None, InsertOperationNode.from_list([InsertOperation(0, "abcdefghij")]), None))
+        self.assertEqual(len(calls), 1)
+        self.assertGreater(calls[0], 2000)
+
+        # Once the history has been compacted, the callback is called again the next time the limit is passed
+        engine._inserts = None
+        self.assertEqual(engine.recount_memory_usage().bytes, 0)
+        for _ in range(20):
+            engine.process_transaction(TransactionSequence(
+                None, InsertOperationNode.from_list([InsertOperation(0, "abcdefghij")]), None))
+        self.assertEqual(len(calls), 2)
+
+    def test_concurrent_views(self):
+        engine1 = Engine(1)
+        engine2 = Engine(2)
+
+        def edit(engine, position, value):
+            return engine.process_transaction(TransactionSequence(
+                None, InsertOperationNode.from_list([InsertOperation(position, value)]), None))
+
+        for position in range(5):
+            engine2.integrate_remote(edit(engine1, position, "a"))
+        for count in range(4):
+            outgoing = edit(engine2, count, "b")
+            edit(engine1, 5 + 2 * count, "c")
+            expected = engine1._get_concurrent(outgoing.starting_state, engine1._inserts)
+            result = engine1._get_concurrent(outgoing.starting_state, engine1._inserts, 2)
+            self.assertEqual([id(op) for op in result.to_list()], [id(op) for op in expected.to_list()])
+            self.assertIn(2, engine1._concurrent_views)
+            engine1.integrate_remote(outgoing)
+
+        # Replacing the history forgets the views
+        engine1.recount_memory_usage()
+        self.assertEqual(engine1._concurrent_views, {})
+        self.assertEqual(engine1._landed, [])
+
+    def test_concurrent_views_are_not_used_for_older_states(self):
+        engine = Engine(1)
+        for position in range(3):
+            engine.process_transaction(TransactionSequence(
+                None, InsertOperationNode.from_list([InsertOperation(position, "a")]), None))
+        self.assertEqual(len(engine._get_concurrent(State(1, 2, 2), engine._inserts, 2).to_list()), 1)
+        self.assertEqual(len(engine._get_concurrent(State(1, 1, 1), engine._inserts, 2).to_list()), 2)
+        self.assertEqual(len(engine._get_concurrent(State(1, 3, 3), engine._inserts, 2) or []), 0)
+
+    def test_transform_insert_delete_inside_last_delete(self):
+        deletes = convert_delete_list([DeleteOperation(2, 3)], 1)
+        inserts = convert_insert_list([InsertOperation(4, "abc"), InsertOperation(8, "d"), InsertOperation(10, "e")],
+                                      2)
+        result = Engine._transform_insert_delete(inserts, deletes)
+        # The inserts inside the deleted text end up where it was, and the insert after it moves back
+        self.assertEqual(result.to_list(), [InsertOperation(2, "abc"), InsertOperation(5, "d"),
+                                            InsertOperation(7, "e")])
+
+    def test_prune_deletes(self):
+        engine1 = Engine(1, prune_deletes=True)
+        engine2 = Engine(2)
+
+        def edit(engine, inserts=(), deletes=()):
+            return engine.process_transaction(TransactionSequence(
+                None, InsertOperationNode.from_list(list(inserts)), DeleteOperationNode.from_list(list(deletes))))
+
+        engine2.integrate_remote(edit(engine1, [InsertOperation(0, "abcdefghij")]))
+        edit(engine1, deletes=[DeleteOperation(2, 4)])
+        outgoing2 = edit(engine2, deletes=[DeleteOperation(3, 2)])
+        # The second site carries on from its delete, which is covered by the first site's delete
+        outgoing3 = edit(engine2, [InsertOperation(3, "x")])
+
+        result = engine1.integrate_remote(outgoing2)
+        self.assertEqual(result.deletes.to_list(), [DeleteOperation(2, 0)])
+        self.assertEqual(engine1._deletes.to_list(), [DeleteOperation(2, 4)])
+        self.assertEqual(engine1.pruned_deletes, 1)
+        self.assertEqual(repr(engine1.memory_usage), repr(MemoryUsage.of(engine1._inserts, engine1._deletes)))
+        self.assertEqual((engine1.last_state.site_id, engine1.last_state.remote_time), (2, 2))
+
+        # The pruned delete's state can still be looked up
+        result = engine1.integrate_remote(outgoing3)
+        self.assertEqual(result.apply_to("abghij"), "abxghij")
@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from pyote.engine import Engine
+from pyote.history import ColumnarHistory, MappedHistory, InsertColumns, DeleteColumns
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode, State
+
+
+def with_state(operation, state):
+    operation.state = state
+    return operation
+
+
+class ColumnsTests(TestCase):
+
+    def test_insert_columns(self):
+        inserts = [
+            with_state(InsertOperation(0, "The "), State(1, 1, 1)),
+            with_state(InsertOperation(4, "naïve "), State(2, 2, 1)),
+            with_state(InsertOperation(10, "fox"), State(1, 3, 2)),
+        ]
+        columns = InsertColumns.from_sequence(InsertOperationNode.from_list(list(inserts)))
+        self.assertEqual(len(columns), 3)
+        self.assertEqual(list(columns.position), [0, 4, 10])
+        self.assertEqual(list(columns.site_id), [1, 2, 1])
+        self.assertEqual(columns.text, "The naïve fox".encode('utf-8'))
+        self.assertEqual(columns.value(1), "naïve ")
+        self.assertEqual(columns.get_increment(1), 6)
+        self.assertEqual(columns[-1], inserts[2])
+        self.assertEqual(columns[1].state.__getstate__(), inserts[1].state.__getstate__())
+        self.assertEqual(columns.to_sequence().to_list(), inserts)
+        self.assertEqual(columns.concurrent_indices(1), [1, 2])
+        with self.assertRaises(IndexError):
+            columns[3]
+
+    def test_delete_columns(self):
+        deletes = [
+            with_state(DeleteOperation(1, 2), State(1, 4, 3)),
+            with_state(DeleteOperation(5, 1), State(3, 5, 1)),
+        ]
+        columns = DeleteColumns.from_sequence(DeleteOperationNode.from_list(list(deletes)))
+        self.assertEqual(list(columns.length), [2, 1])
+        self.assertEqual(columns.get_increment(0), -2)
+        self.assertEqual(list(columns), deletes)
+        self.assertEqual(columns.nbytes, 2 * 5 * columns.length.itemsize)
+
+
+class ColumnarHistoryTests(TestCase):
+
+    def edit(self, sender, receiver, inserts=(), deletes=()):
+        outgoing = sender.process_transaction(TransactionSequence(
+            None, InsertOperationNode.from_list(list(inserts)), DeleteOperationNode.from_list(list(deletes))))
+        return receiver.integrate_remote(outgoing)
+
+    def test_pack_and_restore(self):
+        engine1 = Engine(1)
+        engine2 = Engine(2)
+        self.edit(engine1, engine2, [InsertOperation(0, "The quick brown fox")])
+        self.edit(engine2, engine1, [InsertOperation(4, "very ")], [DeleteOperation(0, 4)])
+        self.edit(engine1, engine2, [InsertOperation(10, "ish")])
+
+        history = engine1.pack_history()
+        self.assertIsInstance(history, ColumnarHistory)
+        self.assertLess(history.nbytes, engine1.memory_usage.bytes)
+        restored = Engine.from_history(history, max_pending=10)
+        self.assertEqual(repr(restored), repr(engine1))
+        self.assertEqual(restored.last_state.__getstate__(), engine1.last_state.__getstate__())
+        self.assertEqual(restored._state_index, engine1._state_index)
+        self.assertEqual(repr(restored.memory_usage), repr(engine1.memory_usage))
+        self.assertEqual(restored.max_pending, 10)
+
+        # The restored engine carries on exactly as the original would have
+        restored2 = Engine.from_history(engine2.pack_history())
+        result1 = self.edit(engine2, engine1, [InsertOperation(2, "!")])
+        result2 = self.edit(restored2, restored, [InsertOperation(2, "!")])
+        self.assertEqual(result1.to_json(), result2.to_json())
+        self.assertEqual(repr(restored), repr(engine1))
+
+    def test_pack_pruned_deletes(self):
+        engine1 = Engine(1, prune_deletes=True)
+        engine2 = Engine(2)
+        self.edit(engine1, engine2, [InsertOperation(0, "abcdefghij")])
+        outgoing = engine2.process_transaction(TransactionSequence(
+            None, None, DeleteOperationNode.from_list([DeleteOperation(3, 2)])))
+        self.edit(engine1, engine2, deletes=[DeleteOperation(2, 4)])
+        engine1.integrate_remote(outgoing)
+        self.assertEqual(engine1.pruned_deletes, 1)
+
+        # The pruned delete is packed with a length of zero, so the restored engine can still look up its state
+        history = engine1.pack_history()
+        self.assertEqual(list(history.deletes.length), [4, 0])
+        restored = Engine.from_history(history, prune_deletes=True)
+        self.assertEqual(set(restored._state_index), set(engine1._state_index))
+        self.assertEqual(restored._lookup_local_time(outgoing.deletes.value.state),
+                         engine1._lookup_local_time(outgoing.deletes.value.state))
+        # It is left out of the history again the next time the deletes are merged
+        self.edit(engine2, restored, deletes=[DeleteOperation(0, 1)])
+        self.assertEqual(len(restored._deletes.to_list()), 2)
+
+    def test_restore_checks_site(self):
+        with self.assertRaises(ValueError):
+            Engine(1).pack_history().restore(Engine(2))
+
+
+class MappedHistoryTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'history')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_engine(self):
+        engine1 = Engine(1)
+        engine2 = Engine(2)
+        outgoing = engine1.process_transaction(TransactionSequence(
+            None, InsertOperationNode.from_list([InsertOperation(0, "The naïve fox")]), None))
+        engine2.integrate_remote(outgoing)
+        outgoing = engine2.process_transaction(TransactionSequence(
+            None, InsertOperationNode.from_list([InsertOperation(4, "very ")]),
+            DeleteOperationNode.from_list([DeleteOperation(0, 4)])))
+        engine1.integrate_remote(outgoing)
+        return engine1
+
+    def test_save_and_open(self):
+        engine = self.get_engine()
+        packed = engine.pack_history()
+        packed.save(self.path)
+        with MappedHistory.open(self.path) as history:
+            self.assertEqual((history.site_id, history.time_stamp), (packed.site_id, packed.time_stamp))
+            self.assertEqual(history.last_state.__getstate__(), packed.last_state.__getstate__())
+            for mapped, columns in ((history.inserts, packed.inserts), (history.deletes, packed.deletes)):
+                self.assertEqual(len(mapped), len(columns))
+                for name in columns.COLUMNS:
+                    self.assertEqual(list(getattr(mapped, name)), list(getattr(columns, name)))
+            self.assertEqual(bytes(history.inserts.text), bytes(packed.inserts.text))
+            self.assertEqual(history.inserts.value(0), "The naïve fox")
+            self.assertEqual(history.inserts.concurrent_indices(1), [1])
+            restored = Engine.from_history(history)
+        self.assertEqual(repr(restored), repr(engine))
+        self.assertEqual(restored._state_index, engine._state_index)
+
+    def test_save_empty_history(self):
+        Engine(3).pack_history().save(self.path)
+        with MappedHistory.open(self.path) as history:
+            self.assertIsNone(history.last_state)
+            self.assertEqual((len(history.inserts), len(history.deletes)), (0, 0))
+            self.assertIsNone(Engine.from_history(history)._inserts)
+
+    def test_open_rejects_other_files(self):
+        with open(self.path, 'wb') as other_file:
+            other_file.write(b'{"inserts": []}'.ljust(200))
+        with self.assertRaises(ValueError):
+            MappedHistory.open(self.path)
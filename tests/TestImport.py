@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+import pyote
+from pyote import engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_modules(code):
+    """
+    Runs `code` in a fresh interpreter, and gets the names of every module that was imported
+    """
+    result = subprocess.run([sys.executable, '-c', code + '\nimport sys\nprint("\\n".join(sys.modules))'],
+                            env=dict(os.environ, PYTHONPATH=ROOT), stdout=subprocess.PIPE, universal_newlines=True,
+                            check=True)
+    return set(result.stdout.split())
+
+
+class ImportTests(TestCase):
+
+    def test_engine_imports_only_the_core(self):
+        modules = imported_modules('import pyote.engine')
+        self.assertEqual({name for name in modules if name.startswith('pyote')},
+                         {'pyote', 'pyote.engine', 'pyote.operations', 'pyote.utils', engine._transforms.__name__})
+        for name in ('json', 'hashlib', 'mmap'):
+            self.assertNotIn(name, modules)
+
+    def test_package_imports_nothing(self):
+        modules = imported_modules('import pyote')
+        self.assertEqual({name for name in modules if name.startswith('pyote')}, {'pyote'})
+
+    def test_lazy_attributes(self):
+        from pyote.engine import Engine
+        from pyote.server import Server
+        self.assertIs(pyote.Engine, Engine)
+        self.assertIs(pyote.server.Server, Server)
+        self.assertIn('serialization', dir(pyote))
+        with self.assertRaises(AttributeError):
+            pyote.nothing
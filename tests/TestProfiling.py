@@ -0,0 +1,104 @@
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+from pyote.engine import Engine
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.profiling import SlowCallRecorder, load_recording, replay, STEPS
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode
+
+
+def make_sequence(inserts=(), deletes=()):
+    return TransactionSequence(None, InsertOperationNode.from_list([InsertOperation(*insert) for insert in inserts]),
+                               DeleteOperationNode.from_list([DeleteOperation(*delete) for delete in deletes]))
+
+
+class SlowCallRecorderTests(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.engine1 = Engine(1)
+        self.engine2 = Engine(2)
+
+    def make_edits(self):
+        """
+        Makes concurrent edits at both sites, returning the sequences that site 2 sent and integrated
+        """
+        outgoing1 = self.engine1.process_transaction(make_sequence([(0, "The quick fox")]))
+        self.engine2.integrate_remote(outgoing1)
+        outgoing1 = self.engine1.process_transaction(make_sequence([(4, "very ")], [(9, 6)]))
+        outgoing2 = self.engine2.process_transaction(make_sequence([(10, "brown ")], [(0, 4)]))
+        self.engine1.integrate_remote(outgoing2)
+        return self.engine2.integrate_remote(outgoing1)
+
+    def test_records_and_replays(self):
+        recorder = SlowCallRecorder(self.temp_dir.name, threshold=0, checkpoint_interval=2)
+        recorder.attach(self.engine2)
+        result = self.make_edits()
+        self.assertEqual(len(recorder.recordings), 3)
+
+        with open(os.path.join(recorder.recordings[-1], 'record.json')) as record_file:
+            record = json.load(record_file)
+        self.assertEqual(record['kind'], 'remote')
+        self.assertEqual(record['site_id'], 2)
+        # The checkpoint was taken after the first two calls
+        self.assertEqual(record['calls'], 1)
+        self.assertEqual(set(record['steps']) - set(STEPS), {'other'})
+
+        engine, kind, sequence = load_recording(recorder.recordings[-1])
+        self.assertEqual(kind, 'remote')
+        self.assertEqual(engine.integrate_remote(sequence).to_json(), result.to_json())
+
+        engine, kind, sequence = load_recording(recorder.recordings[1])
+        self.assertEqual(kind, 'local')
+        self.assertEqual(sequence.inserts.to_list(), [InsertOperation(10, "brown ")])
+
+    def test_replays_with_the_engine_settings(self):
+        engine2 = Engine(2, max_pending=5, hard_limit=10 ** 6, prune_deletes=True)
+        engine2.integrate_remote(self.engine1.process_transaction(make_sequence([(0, "abcdef")])))
+        recorder = SlowCallRecorder(self.temp_dir.name, threshold=0)
+        recorder.attach(engine2)
+        # The delete from site 1 falls inside the delete at site 2, so it is pruned
+        outgoing1 = self.engine1.process_transaction(make_sequence(deletes=[(2, 1)]))
+        engine2.process_transaction(make_sequence(deletes=[(1, 3)]))
+        result = engine2.integrate_remote(outgoing1)
+
+        engine, kind, sequence = load_recording(recorder.recordings[-1])
+        self.assertEqual((engine.max_pending, engine.soft_limit, engine.hard_limit, engine.prune_deletes),
+                         (5, None, 10 ** 6, True))
+        self.assertEqual(engine.integrate_remote(sequence).to_json(), result.to_json())
+        self.assertEqual((engine.pruned_deletes, engine2.pruned_deletes), (1, 1))
+
+    def test_threshold(self):
+        recorder = SlowCallRecorder(self.temp_dir.name, threshold=60)
+        recorder.attach(self.engine2)
+        self.make_edits()
+        self.assertEqual(recorder.recordings, [])
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+    def test_max_recordings(self):
+        recorder = SlowCallRecorder(self.temp_dir.name, threshold=0, max_recordings=2)
+        recorder.attach(self.engine2)
+        self.make_edits()
+        self.assertEqual(len(recorder.recordings), 2)
+
+    def test_detach(self):
+        recorder = SlowCallRecorder(self.temp_dir.name, threshold=0)
+        recorder.attach(self.engine2)
+        with self.assertRaises(ValueError):
+            recorder.attach(self.engine1)
+        recorder.detach()
+        self.assertNotIn('integrate_remote', vars(self.engine2))
+        self.make_edits()
+        self.assertEqual(recorder.recordings, [])
+
+    def test_replay(self):
+        recorder = SlowCallRecorder(self.temp_dir.name, threshold=0)
+        recorder.attach(self.engine2)
+        self.make_edits()
+        output = io.StringIO()
+        stats = replay(recorder.recordings[-1], stream=output)
+        self.assertIn('integrate_remote', output.getvalue())
+        self.assertGreater(stats.total_calls, 0)
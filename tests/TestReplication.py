@@ -0,0 +1,82 @@
+from unittest import TestCase
+from pyote.engine import Engine
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.replication import Replica, LoopbackTransport, sync
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode
+
+
+def make_sequence(inserts=(), deletes=()):
+    return TransactionSequence(None, InsertOperationNode.from_list([InsertOperation(*insert) for insert in inserts]),
+                               DeleteOperationNode.from_list([DeleteOperation(*delete) for delete in deletes]))
+
+
+class ReplicationTests(TestCase):
+
+    def setUp(self):
+        self.replicas = [Replica(Engine(site_id)) for site_id in (1, 2, 3)]
+        self.texts = [""] * 3
+
+    def edit(self, index, sequence):
+        self.texts[index] = sequence.apply_to(self.texts[index])
+        return self.replicas[index].process_transaction(sequence)
+
+    def sync(self, first, second):
+        transport = LoopbackTransport()
+        applied_first, applied_second = sync(self.replicas[first], self.replicas[second], transport)
+        for sequence in applied_first:
+            self.texts[first] = sequence.apply_to(self.texts[first])
+        for sequence in applied_second:
+            self.texts[second] = sequence.apply_to(self.texts[second])
+        return transport
+
+    def test_sync(self):
+        self.edit(0, make_sequence([(0, "The quick fox")]))
+        self.edit(0, make_sequence([(10, "brown ")]))
+        self.sync(0, 1)
+        self.edit(1, make_sequence([(19, " jumps")], [(0, 4)]))
+        self.assertEqual(self.replicas[1].summary(), {1: 2, 2: 4})
+        self.sync(0, 1)
+        self.assertEqual(self.texts[:2], ["quick brown fox jumps"] * 2)
+        # Sequences are passed on from replicas that didn't make them
+        self.sync(2, 1)
+        self.assertEqual(self.texts[2], "quick brown fox jumps")
+        self.assertEqual(self.replicas[2].summary(), {1: 2, 2: 4})
+
+    def test_only_missing_sequences_are_sent(self):
+        self.edit(0, make_sequence([(0, "The quick fox" * 100)]))
+        full = self.sync(0, 1).bytes_sent
+        self.edit(0, make_sequence([(0, "!")]))
+        delta = self.sync(1, 0)
+        self.assertEqual(delta.messages, 3)
+        self.assertLess(delta.bytes_sent, full / 4)
+        self.assertEqual(self.texts[1], "!" + "The quick fox" * 100)
+        self.assertEqual(self.sync(0, 1).bytes_sent, self.sync(1, 0).bytes_sent)
+        self.assertEqual(self.sync(0, 1).bytes_sent, 2 * len(b'{"1":2}') + 1)
+
+    def test_sequences_are_only_integrated_once(self):
+        outgoing = self.edit(0, make_sequence([(0, "abc")]))
+        self.assertEqual(len(self.replicas[1].deliver_remote(outgoing)), 1)
+        self.assertEqual(self.replicas[1].deliver_remote(outgoing), [])
+        applied, _ = sync(self.replicas[1], self.replicas[0])
+        self.assertEqual(applied, [])
+
+    def test_out_of_order_delivery(self):
+        first = self.edit(0, make_sequence([(0, "abc")]))
+        second = self.edit(0, make_sequence([(3, "def")]))
+        replica = self.replicas[1]
+        self.assertEqual(replica.deliver_remote(second), [])
+        self.assertEqual(replica.engine.pending_count, 1)
+        # The sequence that is being held back isn't summarized, so other replicas still send it
+        self.assertEqual(replica.summary(), {})
+        applied = replica.deliver_remote(first)
+        self.assertEqual(len(applied), 2)
+        for sequence in applied:
+            self.texts[1] = sequence.apply_to(self.texts[1])
+        self.assertEqual(self.texts[1], "abcdef")
+        self.assertEqual(replica.engine.pending_count, 0)
+        self.assertEqual(replica.summary(), self.replicas[0].summary())
+        self.assertEqual(replica.missing({}).count('\n'), 2)
+        self.assertEqual(self.sync(1, 0).bytes_sent, 2 * len(b'{"1":2}') + 1)
+        # Both sequences are passed on to other replicas
+        self.sync(2, 1)
+        self.assertEqual(self.texts[2], "abcdef")
@@ -0,0 +1,91 @@
+from unittest import TestCase
+from pyote.engine import OTException
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.server import Server, Client
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode
+
+
+def make_sequence(inserts=(), deletes=()):
+    return TransactionSequence(None, InsertOperationNode.from_list([InsertOperation(*insert) for insert in inserts]),
+                               DeleteOperationNode.from_list([DeleteOperation(*delete) for delete in deletes]))
+
+
+class ServerTests(TestCase):
+
+    def setUp(self):
+        self.server = Server()
+        self.server.MAX_LOG = 4
+        self.clients = [Client(1), Client(2)]
+        self.texts = ["The quick brown fox"] * 2
+        self.server_text = "The quick brown fox"
+        self.outgoing = [[], []]
+
+    def edit(self, index, sequence):
+        self.texts[index] = sequence.apply_to(self.texts[index])
+        message = self.clients[index].local_edit(sequence)
+        if message:
+            self.outgoing[index].append(message)
+
+    def send(self, index):
+        """
+        Sends the oldest transaction from a client to the server, and the results back to the clients
+        """
+        revision, sequence = self.outgoing[index].pop(0)
+        accepted = self.server.receive(self.clients[index].site_id, revision, sequence)
+        self.server_text = accepted.apply_to(self.server_text)
+        message = self.clients[index].server_ack()
+        if message:
+            self.outgoing[index].append(message)
+        for other, client in enumerate(self.clients):
+            if other != index:
+                self.texts[other] = client.server_operation(self.clients[index].site_id,
+                                                            accepted).apply_to(self.texts[other])
+
+    def test_concurrent_transactions(self):
+        self.edit(0, make_sequence([(4, "very ")]))
+        self.edit(1, make_sequence([(4, "lazy ")], [(14, 6)]))
+        self.send(1)
+        self.assertEqual(self.texts[0], "The very lazy quick fox")
+        self.send(0)
+        # Both sites inserted at the same position, so the lower site id goes first everywhere
+        self.assertEqual(self.texts, ["The very lazy quick fox"] * 2)
+        self.assertEqual(self.server_text, "The very lazy quick fox")
+        self.assertEqual(self.server.revision, 2)
+        self.assertEqual([client.revision for client in self.clients], [2, 2])
+
+    def test_waiting_transactions(self):
+        self.edit(0, make_sequence([(19, "!")]))
+        self.edit(0, make_sequence(deletes=[(0, 4)]))
+        self.edit(0, make_sequence([(0, "A ")]))
+        self.assertEqual(self.clients[0].pending_count, 3)
+        # Only the first transaction is sent until it has been accepted
+        self.assertEqual(len(self.outgoing[0]), 1)
+        self.edit(1, make_sequence(deletes=[(4, 6)]))
+        self.send(1)
+        self.send(0)
+        self.send(0)
+        self.send(0)
+        self.assertEqual(self.texts, ["A brown fox!"] * 2)
+        self.assertEqual(self.server_text, "A brown fox!")
+        self.assertEqual(self.clients[0].pending_count, 0)
+
+    def test_text_inserted_in_deleted_text_is_kept(self):
+        self.edit(0, make_sequence(deletes=[(4, 6)]))
+        self.edit(1, make_sequence([(6, "-i-")]))
+        self.send(0)
+        self.send(1)
+        self.assertEqual(self.texts, ["The -i-brown fox"] * 2)
+
+    def test_revisions(self):
+        self.edit(0, make_sequence([(0, "a")]))
+        with self.assertRaises(OTException):
+            self.server.receive(1, 1, make_sequence([(0, "a")]))
+        for _ in range(5):
+            self.edit(0, make_sequence([(0, "a")]))
+            self.send(0)
+        self.assertEqual([sequence.apply_to("") for _, sequence in self.server.operations_since(4)], ["a"])
+        # Older transactions have been dropped from the log
+        with self.assertRaises(OTException):
+            self.server.operations_since(0)
+        with self.assertRaises(OTException):
+            self.server.receive(2, 0, make_sequence([(0, "b")]))
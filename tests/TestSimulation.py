@@ -0,0 +1,69 @@
+from unittest import TestCase, expectedFailure
+from pyote.simulation import Simulation, Partition
+
+
+class SingleWriterSimulation(Simulation):
+    """
+    A simulation in which only site 1 makes edits, so that no two edits are concurrent however they are delivered
+    """
+    def _edit(self):
+        sender = self.sites[0]
+        sequence = self.random_edit(sender.text)
+        sender.text = sequence.apply_to(sender.text)
+        self._send(sender, sender.engine.process_transaction(sequence))
+
+
+class SimulationTests(TestCase):
+
+    def test_sequential_edits_converge(self):
+        for seed in range(5):
+            report = Simulation(sites=3, text="The quick brown fox", seed=seed).run(200)
+            self.assertTrue(report.converged, "Sites diverged with seed {}".format(seed))
+            self.assertEqual(report.messages, 400)
+            self.assertGreater(report.operations, 0)
+
+    def test_reordered_edits_converge(self):
+        for seed in range(5):
+            simulation = SingleWriterSimulation(sites=3, text="The quick brown fox", latency=(1, 3), reorder=0.3,
+                                                seed=seed)
+            report = simulation.run(200)
+            self.assertTrue(report.converged, "Sites diverged with seed {}".format(seed))
+            self.assertEqual(report.messages, 400)
+            # Some messages were held up for longer than the latency, so later ones overtook them
+            self.assertGreater(max(max(site.delivery_latencies) for site in report.sites[1:]), 3)
+
+    # A sequence only names the last operation its sender had seen, and everything the receiver integrated before that
+    # operation is taken to have been seen by the sender too.  An edit the receiver made before it integrated that
+    # operation, which hasn't reached the sender yet, is then left out of the transformation, and the sites diverge.
+    # Deletes which span a concurrent insert aren't split around it either.  Until sequences carry more than one
+    # starting state, only edits which aren't concurrent converge when they are delivered out of order.
+    @expectedFailure
+    def test_reordered_concurrent_edits_converge(self):
+        for seed in range(5):
+            report = Simulation(sites=3, text="The quick brown fox", latency=(1, 3), reorder=0.3, seed=seed).run(100)
+            self.assertTrue(report.converged, "Sites diverged with seed {}".format(seed))
+
+    def test_every_message_is_applied(self):
+        simulation = Simulation(sites=3, latency=(1, 3), reorder=0.3, seed=1)
+        report = simulation.run(100)
+        self.assertEqual(report.messages, 200)
+        for site in report.sites:
+            self.assertEqual(site.engine.pending_count, 0)
+            self.assertEqual(site.history_sizes[-1], (report.ticks, site.history_size()))
+        self.assertEqual(sum(len(site.delivery_latencies) for site in report.sites), 200)
+        latencies = report.latency_percentiles()
+        self.assertGreaterEqual(latencies[50], 1)
+        self.assertLessEqual(latencies[50], latencies[99])
+
+    def test_partition_delays_messages(self):
+        simulation = Simulation(sites=2, partitions=[Partition(0, 20, [])], seed=1)
+        report = simulation.run(10)
+        self.assertEqual(report.ticks, 21)
+        self.assertEqual(report.latency_percentiles((0,))[0], 11)
+
+    def test_partition_separates(self):
+        partition = Partition(5, 10, [{1, 2}, {3}])
+        self.assertTrue(partition.separates(1, 3, 5))
+        self.assertFalse(partition.separates(1, 2, 5))
+        self.assertFalse(partition.separates(1, 3, 10))
+        self.assertTrue(partition.separates(4, 1, 9))
@@ -0,0 +1,69 @@
+from unittest import TestCase
+from pyote.engine import Engine
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.stats import EngineStats, Histogram
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode, MemoryUsage
+
+
+def make_sequence(inserts=(), deletes=()):
+    return TransactionSequence(None, InsertOperationNode.from_list([InsertOperation(*insert) for insert in inserts]),
+                               DeleteOperationNode.from_list([DeleteOperation(*delete) for delete in deletes]))
+
+
+class HistogramTests(TestCase):
+
+    def test_buckets(self):
+        histogram = Histogram()
+        for value in (0, 1, 2, 3, 4, 7, 8, -1):
+            histogram.add(value)
+        self.assertEqual(histogram.buckets, {0: 2, 1: 1, 2: 2, 4: 2, 8: 1})
+        self.assertEqual(histogram.count, 8)
+        self.assertEqual(histogram.total, 24)
+        self.assertEqual(histogram.max, 8)
+        self.assertEqual(histogram.mean, 3)
+
+
+class EngineStatsTests(TestCase):
+
+    def setUp(self):
+        self.engine1 = Engine(1, stats=EngineStats())
+        self.engine2 = Engine(2, stats=EngineStats())
+        self.engine2.integrate_remote(self.engine1.process_transaction(make_sequence([(0, "abcdefghij")])))
+
+    def test_overlapping_deletes(self):
+        outgoing1 = self.engine1.process_transaction(make_sequence(deletes=[(2, 4)]))
+        outgoing2 = self.engine2.process_transaction(make_sequence(deletes=[(3, 2)]))
+        result1 = self.engine1.integrate_remote(outgoing2)
+        result2 = self.engine2.integrate_remote(outgoing1)
+        self.assertEqual(result1.apply_to("abghij"), "abghij")
+        self.assertEqual(result2.apply_to("abcfghij"), "abghij")
+
+        # The delete inside the other site's delete is left with nothing to delete
+        stats1 = self.engine1.stats.transforms['transform_delete_delete']
+        self.assertEqual((stats1.calls, stats1.nodes_in, stats1.nodes_out, stats1.zero_length), (1, 1, 1, 1))
+        # The delete around the other site's delete is split in two
+        stats2 = self.engine2.stats.transforms['transform_delete_delete']
+        self.assertEqual((stats2.calls, stats2.nodes_in, stats2.nodes_out, stats2.zero_length), (2, 1, 2, 0))
+        self.assertEqual(stats2.amplification, 2)
+        self.assertEqual(stats2.splits.buckets, {0: 1, 1: 1})
+
+        for engine in (self.engine1, self.engine2):
+            self.assertEqual(engine.stats.local_calls + engine.stats.remote_calls, 3)
+            self.assertEqual(engine.stats.history_growth.total, MemoryUsage.of(engine._inserts, engine._deletes).states)
+
+    def test_reset(self):
+        stats = self.engine2.stats
+        self.assertEqual(stats.remote_calls, 1)
+        self.assertEqual(stats.as_dict()['transforms']['transform_delete_delete']['calls'], 1)
+        stats.reset()
+        self.assertEqual(stats.remote_calls, 0)
+        self.assertEqual(stats.history_growth.count, 0)
+        self.assertEqual(stats.transforms['transform_delete_delete'].calls, 0)
+
+    def test_only_delete_transforms_that_split(self):
+        self.assertEqual(set(self.engine2.stats.transforms), {'transform_delete_delete', 'swap_sequence_delete_delete'})
+
+    def test_no_stats(self):
+        engine = Engine(3)
+        self.assertIsNone(engine.stats)
+        engine.process_transaction(make_sequence([(0, "abc")], [(1, 1)]))
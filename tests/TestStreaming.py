@@ -0,0 +1,234 @@
+import asyncio
+import io
+import json
+from unittest import TestCase
+from pyote.engine import Engine
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.streaming import SequenceDecoder, read_sequence, read_sequence_async, write_sequence, \
+    write_sequence_async, LogDecoder, write_log, iter_log, integrate_log, integrate_log_async
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode, State
+
+
+def operation_with_state(operation, state):
+    operation.state = state
+    return operation
+
+
+def get_sequence():
+    return TransactionSequence(State(1, 4, 4), InsertOperationNode.from_list([
+        operation_with_state(InsertOperation(0, "The quick"), State(2, 5, 1)),
+        operation_with_state(InsertOperation(10, "brown \"fox\"\n"), State(2, 6, 2)),
+        operation_with_state(InsertOperation(22, "jumps é中"), State(2, 7, 3)),
+    ]), DeleteOperationNode.from_list([
+        operation_with_state(DeleteOperation(1, 2), State(2, 8, 4)),
+        operation_with_state(DeleteOperation(5, 0), State(2, 9, 5)),
+    ]))
+
+
+class StreamingTests(TestCase):
+
+    def assertTransactionEqual(self, first, second):
+        self.assertEqual(json.dumps(first.__getstate__(), default=lambda o: o.__getstate__()),
+                         json.dumps(second.__getstate__(), default=lambda o: o.__getstate__()))
+
+    def test_write_sequence_matches_message(self):
+        stream = io.StringIO()
+        write_sequence(get_sequence(), stream, chunk_size=10)
+        self.assertEqual(json.loads(stream.getvalue()),
+                         json.loads(json.dumps(get_sequence().__getstate__(), default=lambda o: o.__getstate__())))
+
+    def test_round_trip_text(self):
+        stream = io.StringIO()
+        write_sequence(get_sequence(), stream)
+        stream.seek(0)
+        self.assertTransactionEqual(read_sequence(stream, chunk_size=3), get_sequence())
+
+    def test_round_trip_binary(self):
+        stream = io.BytesIO()
+        write_sequence(get_sequence(), stream)
+        stream.seek(0)
+        # Reading a single byte at a time splits the multi-byte characters
+        self.assertTransactionEqual(read_sequence(stream, chunk_size=1), get_sequence())
+
+    def test_empty_sequence(self):
+        stream = io.StringIO()
+        write_sequence(TransactionSequence(), stream)
+        stream.seek(0)
+        sequence = read_sequence(stream)
+        self.assertIsNone(sequence.starting_state)
+        self.assertIsNone(sequence.inserts)
+        self.assertIsNone(sequence.deletes)
+
+    def test_decoder_yields_operations_as_they_arrive(self):
+        encoded = json.dumps(get_sequence().__getstate__(), default=lambda o: o.__getstate__())
+        decoder = SequenceDecoder()
+        cutoff = encoded.index('brown')
+        events = decoder.feed(encoded[:cutoff])
+        self.assertEqual([kind for kind, _ in events], ['insert'])
+        self.assertEqual(events[0][1], InsertOperation(0, "The quick"))
+        events += decoder.feed(encoded[cutoff:])
+        events += decoder.close()
+        self.assertEqual([kind for kind, _ in events],
+                         ['insert', 'insert', 'insert', 'delete', 'delete', 'starting_state'])
+        self.assertTrue(decoder.done)
+
+    def test_decoder_does_not_hold_back_operations(self):
+        operations = [operation_with_state(InsertOperation(index, "x" * (index * 37 % 500)), State(2, index, index))
+                      for index in range(200)]
+        encoded = json.dumps(TransactionSequence(None, InsertOperationNode.from_list(list(operations)))
+                             .__getstate__(), default=lambda o: o.__getstate__())
+        # Where each operation ends in the encoded sequence
+        ends = []
+        position = 0
+        for operation in operations:
+            position = encoded.index(operation.value + '"}', position) + len(operation.value) + 2
+            ends.append(position)
+        decoder = SequenceDecoder()
+        decoded = 0
+        for start in range(0, len(encoded), 1000):
+            decoded += sum(1 for kind, _ in decoder.feed(encoded[start:start + 1000]) if kind == 'insert')
+            # Every operation that has arrived is returned straight away, and only the rest is kept
+            self.assertEqual(decoded, sum(1 for end in ends if end <= start + 1000))
+            self.assertLess(len(decoder._buffer), 2000)
+        decoder.close()
+
+    def test_decoder_collects_a_large_value(self):
+        value = 'a "quoted" \\ value ' * 1000
+        encoded = json.dumps(TransactionSequence(None, InsertOperationNode.from_list([
+            operation_with_state(InsertOperation(0, value), State(2, 1, 1))])).__getstate__(),
+            default=lambda o: o.__getstate__())
+        decoder = SequenceDecoder()
+        events = []
+        for start in range(0, len(encoded), 7):
+            events += decoder.feed(encoded[start:start + 7])
+            if not events:
+                # The pieces of the value are kept apart until it is complete, rather than copied onto the buffer
+                self.assertLess(len(decoder._buffer), 100)
+        events += decoder.close()
+        self.assertEqual(events[0], ('insert', InsertOperation(0, value)))
+
+    def test_decoder_rejects_incomplete_data(self):
+        decoder = SequenceDecoder()
+        decoder.feed('{"starting_state": null, "inserts": [{"state": null, "position": 1, ')
+        with self.assertRaises(ValueError):
+            decoder.close()
+
+    def test_async_round_trip(self):
+        class Writer(object):
+            def __init__(self):
+                self.data = b''
+
+            def write(self, data):
+                self.data += data
+
+            async def drain(self):
+                pass
+
+        async def round_trip():
+            writer = Writer()
+            await write_sequence_async(get_sequence(), writer, chunk_size=10)
+            reader = asyncio.StreamReader()
+            reader.feed_data(writer.data)
+            reader.feed_eof()
+            return await read_sequence_async(reader, chunk_size=7)
+
+        self.assertTransactionEqual(asyncio.run(round_trip()), get_sequence())
+
+
+class LogTests(TestCase):
+
+    def get_log(self):
+        """
+        Makes a few edits at one site, and returns the sequences to send to the other sites, and the final text
+        """
+        engine = Engine(1)
+        text = ""
+        sequences = []
+        for inserts, deletes in (([InsertOperation(0, "The quick fox")], []),
+                                 ([InsertOperation(10, "brown ")], []),
+                                 ([InsertOperation(19, " jumps é中")], [DeleteOperation(0, 4)])):
+            sequence = TransactionSequence(None, InsertOperationNode.from_list(inserts),
+                                           DeleteOperationNode.from_list(deletes))
+            text = sequence.apply_to(text)
+            sequences.append(engine.process_transaction(sequence))
+        return sequences, text
+
+    def test_round_trip(self):
+        sequences, _ = self.get_log()
+        stream = io.BytesIO()
+        write_log(sequences, stream)
+        stream.seek(0)
+        decoded = list(iter_log(stream, chunk_size=1))
+        self.assertEqual([sequence.to_json() for sequence in decoded], [sequence.to_json() for sequence in sequences])
+
+    def test_round_trip_chunk_sizes(self):
+        engine = Engine(1)
+        sequences = [engine.process_transaction(TransactionSequence(None, InsertOperationNode.from_list(
+            [InsertOperation(index, "ab" * (index % 7))]))) for index in range(200)]
+        expected = [sequence.to_json() for sequence in sequences]
+        for stream in (io.StringIO(), io.BytesIO()):
+            write_log(sequences, stream)
+            for chunk_size in list(range(1, 33)) + [64, 256, 1000, 4096]:
+                stream.seek(0)
+                decoded = list(iter_log(stream, chunk_size=chunk_size))
+                self.assertEqual([sequence.to_json() for sequence in decoded], expected, chunk_size)
+
+    def test_decoder(self):
+        sequences, _ = self.get_log()
+        encoded = ''.join(sequence.to_json() for sequence in sequences)
+        decoder = LogDecoder()
+        cutoff = len(sequences[0].to_json()) + 5
+        self.assertEqual(len(decoder.feed(encoded[:cutoff])), 1)
+        self.assertEqual(len(decoder.feed(encoded[cutoff:])), 2)
+        self.assertEqual(decoder.close(), [])
+        decoder.feed(encoded[:cutoff])
+        with self.assertRaises(ValueError):
+            decoder.close()
+
+    def test_integrate_log(self):
+        sequences, expected = self.get_log()
+        read = []
+
+        def messages():
+            for sequence in sequences:
+                read.append(sequence)
+                yield sequence.to_json()
+
+        text = ""
+        integrated = integrate_log(Engine(2), messages())
+        # Each sequence is integrated as soon as it has been read
+        text = next(integrated).apply_to(text)
+        self.assertEqual(len(read), 1)
+        for sequence in integrated:
+            text = sequence.apply_to(text)
+        self.assertEqual(text, expected)
+
+    def test_integrate_log_async(self):
+        sequences, expected = self.get_log()
+
+        async def integrate():
+            reader = asyncio.StreamReader()
+            reader.feed_data(''.join(sequence.to_json() + '\n' for sequence in sequences).encode('utf-8'))
+            reader.feed_eof()
+            text = ""
+            async for sequence in integrate_log_async(Engine(2), reader, chunk_size=16):
+                text = sequence.apply_to(text)
+            return text
+
+        self.assertEqual(asyncio.run(integrate()), expected)
+
+    def test_integrate_log_async_chunk_sizes(self):
+        sequences, expected = self.get_log()
+        encoded = ''.join(sequence.to_json() + '\n' for sequence in sequences).encode('utf-8')
+
+        async def integrate(chunk_size):
+            reader = asyncio.StreamReader()
+            reader.feed_data(encoded)
+            reader.feed_eof()
+            text = ""
+            async for sequence in integrate_log_async(Engine(2), reader, chunk_size=chunk_size):
+                text = sequence.apply_to(text)
+            return text
+
+        for chunk_size in (1, 3, 5, 7, 64, 256):
+            self.assertEqual(asyncio.run(integrate(chunk_size)), expected, chunk_size)
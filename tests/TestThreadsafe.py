@@ -0,0 +1,150 @@
+import threading
+from unittest import TestCase
+
+from pyote.engine import Engine
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.threadsafe import ConcurrentEngine
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode, State
+
+
+def make_sequence(inserts=(), deletes=()):
+    return TransactionSequence(None, InsertOperationNode.from_list([InsertOperation(*insert) for insert in inserts]),
+                               DeleteOperationNode.from_list([DeleteOperation(*delete) for delete in deletes]))
+
+
+def check_snapshot(test, snapshot):
+    """
+    Checks that the packed history in a snapshot matches the rest of the snapshot
+    """
+    history = snapshot.history
+    test.assertEqual(history.time_stamp, snapshot.time_stamp)
+    test.assertEqual(repr(history.last_state), repr(snapshot.last_state))
+    test.assertEqual(len(history.inserts), snapshot.memory_usage.insert_nodes)
+    test.assertEqual(len(history.deletes), snapshot.memory_usage.delete_nodes)
+    test.assertEqual(sum(history.inserts.text_length), snapshot.memory_usage.insert_characters)
+
+
+class ConcurrentEngineTests(TestCase):
+
+    def test_snapshots_do_not_change(self):
+        engine = ConcurrentEngine(1)
+        empty = engine.snapshot()
+        self.assertIsNone(empty.last_state)
+        self.assertEqual(empty.time_stamp, 0)
+
+        engine.process_transaction(make_sequence([(0, "abc")]))
+        first = engine.snapshot()
+        self.assertGreater(first.version, empty.version)
+        self.assertEqual(first.time_stamp, 1)
+        self.assertEqual(first.memory_usage.insert_characters, 3)
+
+        engine.process_transaction(make_sequence([(3, "def")], [(0, 1)]))
+        self.assertEqual(first.time_stamp, 1)
+        self.assertEqual(first.memory_usage.insert_characters, 3)
+        self.assertEqual(first.memory_usage.delete_nodes, 0)
+        self.assertEqual(engine.snapshot().time_stamp, 3)
+        self.assertEqual(engine.snapshot().memory_usage.delete_nodes, 1)
+
+    def test_local_time(self):
+        engine = ConcurrentEngine(1)
+        remote = Engine(2)
+        before = engine.snapshot()
+        engine.integrate_remote(remote.process_transaction(make_sequence([(0, "abc")])))
+        state = State(2, 0, 1)
+        self.assertIsNone(before.local_time(state))
+        self.assertEqual(engine.snapshot().local_time(state), 1)
+        self.assertIsNone(engine.snapshot().local_time(State(3, 0, 1)))
+
+    def test_history_is_packed_once_per_version(self):
+        engine = ConcurrentEngine(1)
+        engine.process_transaction(make_sequence([(0, "abc")]))
+        history = engine.pack_history()
+        self.assertIs(engine.snapshot(history=True).history, history)
+        check_snapshot(self, engine.snapshot())
+
+        engine.process_transaction(make_sequence([(0, "d")]))
+        self.assertIsNone(engine.snapshot().history)
+        self.assertIsNot(engine.pack_history(), history)
+        self.assertEqual(len(history.inserts), 1)
+
+        restored = ConcurrentEngine.from_history(engine.pack_history())
+        self.assertEqual(restored.snapshot().time_stamp, 2)
+        self.assertEqual(restored.snapshot().memory_usage.insert_characters, 4)
+
+    def test_readers_do_not_wait_for_the_writer(self):
+        engine = ConcurrentEngine(1)
+        engine.process_transaction(make_sequence([(0, "abc")]))
+        packed = engine.snapshot(history=True)
+        engine.process_transaction(make_sequence([(0, "d")]))
+        writing = threading.Event()
+        finish = threading.Event()
+
+        def write():
+            # Hold the lock as a long change to the history would
+            with engine._lock:
+                writing.set()
+                finish.wait()
+                Engine.process_transaction(engine, make_sequence([(0, "e")]))
+                engine._publish()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            writing.wait()
+            # The latest snapshot with a packed history is returned straight away
+            self.assertIs(engine.snapshot(history=True), packed)
+            self.assertEqual(engine.snapshot().version, packed.version + 1)
+        finally:
+            finish.set()
+            writer.join()
+        # The writer packed the history of the snapshot it published for the readers after it
+        snapshot = engine.snapshot()
+        self.assertEqual(snapshot.version, packed.version + 2)
+        self.assertIsNotNone(snapshot.history)
+        self.assertIs(engine.snapshot(history=True), snapshot)
+        check_snapshot(self, snapshot)
+
+    def test_readers_while_writing(self):
+        engine = ConcurrentEngine(1)
+        remote = Engine(2)
+        failures = []
+        done = threading.Event()
+
+        def read():
+            try:
+                while not done.is_set():
+                    check_snapshot(self, engine.snapshot(history=True))
+            except AssertionError as error:
+                failures.append(error)
+
+        readers = [threading.Thread(target=read) for _ in range(3)]
+        for reader in readers:
+            reader.start()
+        try:
+            for count in range(200):
+                engine.integrate_remote(remote.process_transaction(make_sequence([(count, "ab")])))
+                if count % 3 == 0:
+                    engine.process_transaction(make_sequence(deletes=[(0, 1)]))
+        finally:
+            done.set()
+            for reader in readers:
+                reader.join()
+        self.assertEqual(failures, [])
+        check_snapshot(self, engine.snapshot(history=True))
+
+    def test_several_writers(self):
+        engine = ConcurrentEngine(1)
+
+        def write():
+            for _ in range(100):
+                engine.process_transaction(make_sequence([(0, "a")]))
+
+        writers = [threading.Thread(target=write) for _ in range(4)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        snapshot = engine.snapshot(history=True)
+        self.assertEqual(snapshot.time_stamp, 400)
+        self.assertEqual(snapshot.memory_usage.insert_nodes, 400)
+        check_snapshot(self, snapshot)
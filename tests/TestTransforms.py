@@ -0,0 +1,97 @@
+import os
+import random
+import subprocess
+import sys
+from unittest import TestCase, skipUnless
+
+from pyote import _transforms
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.utils import InsertOperationNode, DeleteOperationNode, State
+
+try:
+    from pyote import _ctransforms
+except ImportError:
+    _ctransforms = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def random_sequence(node_class, site_id, count, rng):
+    operations = []
+    position = 0
+    for local_time in range(count):
+        position += rng.randrange(4)
+        if node_class is InsertOperationNode:
+            operation = InsertOperation(position, "ab"[:rng.randrange(1, 3)])
+        else:
+            operation = DeleteOperation(position, rng.randrange(4))
+        operation.state = State(site_id, local_time, rng.randrange(count))
+        operations.append(operation)
+    return node_class.from_list(operations)
+
+
+def flatten(sequence):
+    """
+    Gets the operations in a sequence and their states as plain values, so that sequences can be compared
+    """
+    nodes = []
+    while sequence:
+        state = sequence.value.state
+        nodes.append((repr(sequence.value), state.site_id, state.local_time, state.remote_time))
+        sequence = sequence.next
+    return nodes
+
+
+class TransformTests(TestCase):
+
+    def test_compiled_only_when_asked(self):
+        code = 'from pyote import engine\nprint(engine.COMPILED)'
+        environment = dict(os.environ, PYTHONPATH=ROOT)
+        environment.pop('PYOTE_COMPILED', None)
+        result = subprocess.run([sys.executable, '-c', code], env=environment, stdout=subprocess.PIPE,
+                                universal_newlines=True, check=True)
+        self.assertEqual(result.stdout.strip(), 'False')
+        result = subprocess.run([sys.executable, '-c', code], env=dict(environment, PYOTE_COMPILED='1'),
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        self.assertEqual(result.stdout.strip(), str(_ctransforms is not None))
+
+    @skipUnless(_ctransforms, "the compiled transformations haven't been built")
+    def test_compiled_matches_pure_python(self):
+        rng = random.Random(49)
+        kinds = {
+            'transform_insert_insert': (InsertOperationNode, InsertOperationNode),
+            'transform_delete_insert': (DeleteOperationNode, InsertOperationNode),
+            'transform_insert_delete': (InsertOperationNode, DeleteOperationNode),
+            'transform_delete_delete': (DeleteOperationNode, DeleteOperationNode),
+            'swap_sequence_delete_insert': (DeleteOperationNode, InsertOperationNode),
+            'swap_sequence_delete_delete': (DeleteOperationNode, DeleteOperationNode),
+        }
+        for _ in range(50):
+            for name, (first_class, second_class) in kinds.items():
+                seed = rng.random()
+                results = []
+                for module in (_transforms, _ctransforms):
+                    sequence_rng = random.Random(seed)
+                    first = random_sequence(first_class, 1, sequence_rng.randrange(1, 20), sequence_rng)
+                    second = random_sequence(second_class, 2, sequence_rng.randrange(1, 20), sequence_rng)
+                    output = getattr(module, name)(first, second)
+                    if isinstance(output, tuple):
+                        results.append([flatten(sequence) for sequence in output])
+                    else:
+                        results.append(flatten(output))
+                self.assertEqual(results[0], results[1], name)
+
+    @skipUnless(_ctransforms, "the compiled transformations haven't been built")
+    def test_compiled_merge_matches_pure_python(self):
+        rng = random.Random(50)
+        for prune in (False, True):
+            for _ in range(50):
+                seed = rng.random()
+                results = []
+                for module in (_transforms, _ctransforms):
+                    sequence_rng = random.Random(seed)
+                    first = random_sequence(DeleteOperationNode, 1, sequence_rng.randrange(1, 20), sequence_rng)
+                    second = random_sequence(DeleteOperationNode, 2, sequence_rng.randrange(1, 20), sequence_rng)
+                    merged, last_state, pruned = module.merge_sequence(first, second, prune=prune)
+                    results.append((flatten(merged), repr(last_state), pruned))
+                self.assertEqual(results[0], results[1])
@@ -0,0 +1,161 @@
+import random
+from unittest import TestCase
+from pyote.engine import Engine
+from pyote.operations import InsertOperation, DeleteOperation
+from pyote.undo import UndoManager
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode
+
+
+def make_sequence(inserts=(), deletes=()):
+    return TransactionSequence(None, InsertOperationNode.from_list([InsertOperation(*insert) for insert in inserts]),
+                               DeleteOperationNode.from_list([DeleteOperation(*delete) for delete in deletes]))
+
+
+def random_sequence(rng, text):
+    if text and rng.random() < 0.5:
+        position = rng.randrange(len(text))
+        return make_sequence(deletes=[(position, rng.randint(1, min(4, len(text) - position)))])
+    return make_sequence([(rng.randint(0, len(text)), ''.join(rng.choice("abcXYZ") for _ in range(rng.randint(1, 4))))])
+
+
+class UndoTests(TestCase):
+
+    def setUp(self):
+        self.manager = UndoManager(Engine(1))
+        self.remote = Engine(2)
+        self.local_text = self.remote_text = "The quick brown fox"
+
+    def local_edit(self, sequence):
+        text = self.local_text
+        self.local_text = sequence.apply_to(text)
+        outgoing = self.manager.process_transaction(sequence, text)
+        self.remote_text = self.remote.integrate_remote(outgoing).apply_to(self.remote_text)
+
+    def remote_edit(self, sequence):
+        self.remote_text = sequence.apply_to(self.remote_text)
+        outgoing = self.remote.process_transaction(sequence)
+        self.local_text = self.manager.integrate_remote(outgoing).apply_to(self.local_text)
+
+    def undo(self):
+        local, outgoing = self.manager.undo(self.local_text)
+        self.local_text = local.apply_to(self.local_text)
+        self.remote_text = self.remote.integrate_remote(outgoing).apply_to(self.remote_text)
+
+    def redo(self):
+        local, outgoing = self.manager.redo(self.local_text)
+        self.local_text = local.apply_to(self.local_text)
+        self.remote_text = self.remote.integrate_remote(outgoing).apply_to(self.remote_text)
+
+    def test_undo_and_redo(self):
+        self.local_edit(make_sequence([(4, "very ")], [(14, 6)]))
+        self.assertEqual(self.local_text, "The very quick fox")
+        self.undo()
+        self.assertEqual(self.local_text, "The quick brown fox")
+        self.assertEqual(self.remote_text, "The quick brown fox")
+        self.assertFalse(self.manager.can_undo)
+        self.redo()
+        self.assertEqual(self.local_text, "The very quick fox")
+        self.assertEqual(self.remote_text, "The very quick fox")
+        self.assertFalse(self.manager.can_redo)
+        with self.assertRaises(IndexError):
+            self.manager.redo(self.local_text)
+
+    def test_undo_keeps_later_edits(self):
+        self.local_edit(make_sequence([(4, "very ")]))
+        self.local_edit(make_sequence(deletes=[(23, 1)]))
+        self.remote_edit(make_sequence([(0, "!"), (15, "ish")]))
+        self.assertEqual(self.local_text, "!The very quickish brown fo")
+        # Only the most recent local transaction is undone, and the remote edits are kept
+        self.undo()
+        self.assertEqual(self.local_text, "!The very quickish brown fox")
+        self.undo()
+        self.assertEqual(self.local_text, "!The quickish brown fox")
+        self.assertEqual(self.remote_text, self.local_text)
+
+    def test_undo_around_remote_inserts(self):
+        self.local_edit(make_sequence([(4, "very ")]))
+        # Text inserted by another site inside the text that is undone is kept
+        self.remote_edit(make_sequence([(6, "-e-")]))
+        self.assertEqual(self.local_text, "The ve-e-ry quick brown fox")
+        self.undo()
+        self.assertEqual(self.local_text, "The -e-quick brown fox")
+        self.assertEqual(self.remote_text, self.local_text)
+
+    def test_new_edit_clears_redo(self):
+        self.local_edit(make_sequence([(0, "A")]))
+        self.undo()
+        self.assertTrue(self.manager.can_redo)
+        self.local_edit(make_sequence([(0, "B")]))
+        self.assertFalse(self.manager.can_redo)
+
+    def test_max_undo(self):
+        self.manager = UndoManager(Engine(1), max_undo=2)
+        for _ in range(3):
+            self.local_edit(make_sequence([(0, "a")]))
+        self.undo()
+        self.undo()
+        self.assertFalse(self.manager.can_undo)
+        self.assertEqual(self.local_text, "aThe quick brown fox")
+
+    def test_undo_after_undoing_a_delete(self):
+        self.local_text = ""
+        self.remote_text = ""
+        self.local_edit(make_sequence([(0, "ab")]))
+        self.local_edit(make_sequence([(0, "XYZ")]))
+        self.local_edit(make_sequence(deletes=[(0, 3)]))
+        self.undo()
+        self.assertEqual(self.local_text, "XYZab")
+        # Undoing the insert of the text that was deleted and put back removes all of it
+        self.undo()
+        self.assertEqual(self.local_text, "ab")
+        self.undo()
+        self.assertEqual(self.local_text, "")
+        self.assertEqual(self.remote_text, "")
+
+    def test_random_undo_and_redo(self):
+        rng = random.Random(39)
+        for _ in range(100):
+            seed = rng.random()
+            with self.subTest(seed=seed):
+                self.setUp()
+                sequence_rng = random.Random(seed)
+                # The text after each transaction that can be undone
+                texts = [self.local_text]
+                for _ in range(30):
+                    choice = sequence_rng.random()
+                    if choice < 0.5 or not self.manager.can_undo:
+                        self.local_edit(random_sequence(sequence_rng, self.local_text))
+                        texts.append(self.local_text)
+                    elif choice < 0.8 or not self.manager.can_redo:
+                        # Every undo puts back the text as it was before the transaction it undoes
+                        self.undo()
+                        texts.pop()
+                        self.assertEqual(self.local_text, texts[-1])
+                    else:
+                        self.redo()
+                        texts.append(self.local_text)
+                while self.manager.can_undo:
+                    self.undo()
+                    texts.pop()
+                    self.assertEqual(self.local_text, texts[-1])
+                self.assertEqual(self.local_text, "The quick brown fox")
+                self.assertEqual(self.remote_text, self.local_text)
+
+    def test_random_undo_with_remote_edits(self):
+        rng = random.Random(40)
+        for _ in range(100):
+            seed = rng.random()
+            with self.subTest(seed=seed):
+                self.setUp()
+                sequence_rng = random.Random(seed)
+                for _ in range(30):
+                    choice = sequence_rng.random()
+                    if choice < 0.3:
+                        self.remote_edit(random_sequence(sequence_rng, self.remote_text))
+                    elif choice < 0.65 or not self.manager.can_undo:
+                        self.local_edit(random_sequence(sequence_rng, self.local_text))
+                    elif choice < 0.9 or not self.manager.can_redo:
+                        self.undo()
+                    else:
+                        self.redo()
+                    self.assertEqual(self.remote_text, self.local_text)
@@ -0,0 +1,187 @@
+import json
+from copy import copy
+from unittest import TestCase
+from pyote.operations import InsertOperation, DeleteOperation, ReplaceOperation, MoveOperation, MultiReplaceOperation
+from pyote.serialization import ContentStore, encode_multi_replace
+from pyote.utils import TransactionSequence, InsertOperationNode, DeleteOperationNode, State
+
+
+class NodePoolTests(TestCase):
+
+    def setUp(self):
+        InsertOperationNode.pool.clear()
+        DeleteOperationNode.pool.clear()
+
+    def tearDown(self):
+        InsertOperationNode.pool.clear()
+        DeleteOperationNode.pool.clear()
+
+    def test_copy_reuses_released_nodes(self):
+        released = InsertOperationNode(InsertOperation(3, "abc"))
+        released.value.state = State(1, 2, 2)
+        released_state = released.value.state
+        InsertOperationNode.pool.release(released)
+        self.assertEqual(len(InsertOperationNode.pool), 1)
+
+        original = InsertOperationNode(InsertOperation(7, "xyz"))
+        original.value.state = State(2, 5, 4)
+        copied = copy(original)
+        self.assertIs(copied, released)
+        self.assertIs(copied.value.state, released_state)
+        self.assertEqual(copied.value, InsertOperation(7, "xyz"))
+        self.assertEqual(copied.value.state.__getstate__(), {'site_id': 2, 'local_time': 5, 'remote_time': 4})
+        self.assertIsNot(copied.value.state, original.value.state)
+        self.assertEqual(len(InsertOperationNode.pool), 0)
+
+    def test_release_respects_capacity(self):
+        pool = DeleteOperationNode.pool
+        capacity = pool.capacity
+        pool.capacity = 2
+        try:
+            pool.release(DeleteOperationNode.from_list([DeleteOperation(1, 1), DeleteOperation(2, 2),
+                                                        DeleteOperation(3, 3)]))
+            self.assertEqual(len(pool), 2)
+        finally:
+            pool.capacity = capacity
+
+    def test_reserve(self):
+        InsertOperationNode.pool.reserve(5)
+        self.assertEqual(len(InsertOperationNode.pool), 5)
+        original = InsertOperationNode(InsertOperation(1, "a"))
+        self.assertEqual(copy(original).value, InsertOperation(1, "a"))
+        self.assertEqual(len(InsertOperationNode.pool), 4)
+
+
+class TransactionSequenceTests(TestCase):
+
+    def get_sequence(self):
+        inserts = [InsertOperation(0, "The \"quick\"\n"), InsertOperation(12, "brown é")]
+        inserts[0].state = State(1, 4, 2)
+        inserts[1].state = State(1, 5, 3)
+        deletes = [DeleteOperation(1, 2), DeleteOperation(3, 1)]
+        deletes[0].state = State(1, 6, 4)
+        deletes[1].state = State(1, 6, 4)
+        return TransactionSequence(State(2, 1, 1), InsertOperationNode.from_list(inserts),
+                                   DeleteOperationNode.from_list(deletes))
+
+    def test_to_json_matches_message(self):
+        sequence = self.get_sequence()
+        self.assertEqual(json.loads(sequence.to_json()),
+                         json.loads(json.dumps(sequence.__getstate__(), default=lambda o: o.__getstate__())))
+        self.assertEqual(json.loads(TransactionSequence().to_json()),
+                         {'inserts': [], 'deletes': [], 'starting_state': None})
+        local = TransactionSequence(None, InsertOperationNode.from_list([InsertOperation(0, "a")]),
+                                    DeleteOperationNode.from_list([DeleteOperation(1, 1)]))
+        self.assertEqual(json.loads(local.to_json()),
+                         json.loads(json.dumps(local.__getstate__(), default=lambda o: o.__getstate__())))
+
+    def test_from_json(self):
+        sequence = TransactionSequence.from_json(self.get_sequence().to_json())
+        self.assertEqual(sequence.starting_state.__getstate__(), {'site_id': 2, 'local_time': 1, 'remote_time': 1})
+        self.assertEqual(sequence.inserts.to_list(), [InsertOperation(0, "The \"quick\"\n"),
+                                                      InsertOperation(12, "brown é")])
+        self.assertEqual([operation.state.__getstate__() for operation in sequence.inserts.to_list()],
+                         [{'site_id': 1, 'local_time': 4, 'remote_time': 2},
+                          {'site_id': 1, 'local_time': 5, 'remote_time': 3}])
+        deletes = sequence.deletes.to_list()
+        self.assertEqual(deletes, [DeleteOperation(1, 2), DeleteOperation(3, 1)])
+        # Identical consecutive states are only decoded once
+        self.assertIs(deletes[0].state, deletes[1].state)
+
+    def test_from_message_without_states(self):
+        sequence = TransactionSequence.from_message({
+            'inserts': [{'state': None, 'position': 1, 'value': 'a'}],
+            'deletes': [],
+            'starting_state': None,
+        })
+        self.assertIsNone(sequence.starting_state)
+        self.assertIsNone(sequence.inserts.value.state)
+        self.assertIsNone(sequence.deletes)
+
+    def test_apply_to(self):
+        sequence = TransactionSequence(None, InsertOperationNode.from_list([InsertOperation(4, "very "),
+                                                                            InsertOperation(14, "ish")]),
+                                       DeleteOperationNode.from_list([DeleteOperation(0, 4), DeleteOperation(14, 6)]))
+        self.assertEqual(sequence.apply_to("The quick brown fox"), "very quickish fox")
+
+    def test_from_operations(self):
+        text = "The colour of the sky, the colour of the sea"
+        sequence = TransactionSequence.from_operations([ReplaceOperation(27, 6, "color"),
+                                                        ReplaceOperation(4, 6, "color")], text)
+        self.assertEqual(sequence.apply_to(text), "The color of the sky, the color of the sea")
+        # Only the changed part of each replace is kept
+        self.assertIsNone(sequence.inserts)
+        self.assertEqual(sequence.deletes.to_list(), [DeleteOperation(8, 1), DeleteOperation(30, 1)])
+
+        sequence = TransactionSequence.from_operations([ReplaceOperation(4, 6, "color")])
+        self.assertEqual(sequence.inserts.to_list(), [InsertOperation(4, "color")])
+        self.assertEqual(sequence.deletes.to_list(), [DeleteOperation(9, 6)])
+
+        sequence = TransactionSequence.from_operations([InsertOperation(0, "A"), DeleteOperation(0, 3),
+                                                        InsertOperation(22, "!")], text)
+        self.assertEqual(sequence.apply_to(text), "A colour of the sky,! the colour of the sea")
+
+    def test_from_operations_multi_replace(self):
+        text = "The colour of the sky, the colour of the sea"
+        replacements = MultiReplaceOperation([(4, 6, "color"), (27, 6, "color"), (41, 3, "ocean")])
+        sequence = TransactionSequence.from_operations([replacements], text)
+        self.assertEqual(sequence.apply_to(text), "The color of the sky, the color of the ocean")
+        self.assertEqual(json.loads(encode_multi_replace(replacements)),
+                         {'state': None, 'position': 4,
+                          'ranges': [[4, 6, "color"], [27, 6, "color"], [41, 3, "ocean"]]})
+
+    def test_from_operations_move(self):
+        text = "The quick brown fox"
+        sequence = TransactionSequence.from_operations([MoveOperation(10, 6, 4)], text)
+        self.assertEqual(sequence.apply_to(text), "The brown quick fox")
+        sequence = TransactionSequence.from_operations([MoveOperation(4, 6, 16)], text)
+        self.assertEqual(sequence.apply_to(text), "The brown quick fox")
+        # Moving text to where it already is does nothing
+        sequence = TransactionSequence.from_operations([MoveOperation(4, 6, 10)], text)
+        self.assertIsNone(sequence.inserts)
+        self.assertIsNone(sequence.deletes)
+        self.assertEqual(MoveOperation(4, 6, 16).get_increment(), 0)
+        self.assertEqual(ReplaceOperation(4, 6, "color").get_increment(), -1)
+
+    def test_from_operations_errors(self):
+        with self.assertRaises(ValueError):
+            TransactionSequence.from_operations([DeleteOperation(2, 4), ReplaceOperation(5, 1, "a")])
+        with self.assertRaises(ValueError):
+            TransactionSequence.from_operations([MoveOperation(2, 4, 0)])
+        with self.assertRaises(ValueError):
+            TransactionSequence.from_operations([MoveOperation(2, 4, 3)], "The quick brown fox")
+
+
+class ContentStoreTests(TestCase):
+
+    def test_large_values_are_encoded_once(self):
+        store = ContentStore(threshold=10, capacity=100)
+        value = "a \"large\" paste"
+        encoded = store.encode(value)
+        self.assertEqual(json.loads(encoded), value)
+        self.assertIs(store.encode(value), encoded)
+        # An equal value decoded from a message finds the same encoding
+        self.assertIs(store.encode(json.loads(encoded)), encoded)
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.size, len(encoded))
+
+    def test_small_values_are_not_stored(self):
+        store = ContentStore(threshold=10)
+        self.assertEqual(store.encode("short"), '"short"')
+        self.assertEqual(store.encode(5), '5')
+        self.assertEqual(len(store), 0)
+
+    def test_least_recently_used_values_are_dropped(self):
+        store = ContentStore(threshold=1, capacity=20)
+        store.encode("aaaaaaaa")
+        store.encode("bbbbbbbb")
+        store.encode("aaaaaaaa")
+        store.encode("cccccccc")
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.size, 20)
+        self.assertIn("aaaaaaaa", store._encoded)
+        self.assertNotIn("bbbbbbbb", store._encoded)
+        store.encode("d" * 30)
+        self.assertEqual(len(store), 2)
+        store.clear()
+        self.assertEqual((len(store), store.size), (0, 0))